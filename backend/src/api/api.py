@@ -1,471 +1,1127 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import uvicorn
-import json
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
-from typing import List, Optional
-import logging
-from datetime import datetime
-from services.knowledge_graph import KnowledgeGraphService
-
-load_dotenv()
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-app = FastAPI(
-    title="Knowledge Weaver API",
-    description="API for categorizing notes and managing categories with knowledge graph",
-    version="2.0.0"
-)
-
-# Initialize Knowledge Graph Service
-try:
-    kg_service = KnowledgeGraphService()
-    logger.info("Knowledge Graph Service initialized")
-except Exception as e:
-    logger.error(f"Failed to initialize Knowledge Graph Service: {e}")
-    kg_service = None
-
-# Add CORS middleware for browser requests
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, specify allowed origins
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-client = OpenAI(api_key=os.getenv("DEEPSEEK_API_KEY"), base_url="https://api.deepseek.com")
-
-CATEGORIES_FILE = "../../data/categories.json"
-
-class WebpageMetadata(BaseModel):
-    title: str = ""
-    url: str = ""
-    domain: str = ""
-    summary: str = ""
-
-class Note(BaseModel):
-    content: str
-    url: str = ""  # Backward compatibility
-    metadata: WebpageMetadata = None  # New structured metadata
-    timestamp: Optional[int] = None
-    categories: Optional[List[str]] = None
-
-class KnowledgeGraphQuery(BaseModel):
-    query: str
-    entity_types: Optional[List[str]] = None
-    limit: int = 20
-
-class ImportData(BaseModel):
-    notes: List[dict]
-    categories: Optional[List[dict]] = None
-    metadata: Optional[dict] = None
-
-class Category(BaseModel):
-    category: str
-    definition: str
-
-def read_categories():
-    if not os.path.exists(CATEGORIES_FILE):
-        return []
-    with open(CATEGORIES_FILE, "r") as f:
-        return json.load(f)
-
-def write_categories(categories):
-    # Ensure the directory exists
-    os.makedirs(os.path.dirname(CATEGORIES_FILE), exist_ok=True)
-    with open(CATEGORIES_FILE, "w") as f:
-        json.dump(categories, f, indent=2)
-
-@app.get("/health")
-async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy", "message": "Knowledge Weaver API is running"}
-
-@app.get("/categories")
-async def get_categories():
-    """Get all categories"""
-    return read_categories()
-
-@app.post("/categories")
-async def add_category(category: Category):
-    """Add a new category"""
-    categories = read_categories()
-    
-    # Check if category already exists
-    for existing in categories:
-        if existing["category"].lower() == category.category.lower():
-            raise HTTPException(status_code=400, detail="Category already exists")
-    
-    categories.append(category.model_dump())
-    write_categories(categories)
-    return {"message": "Category added successfully", "category": category.model_dump()}
-
-@app.put("/categories/{index}")
-async def update_category(index: int, category: Category):
-    """Update a category by index"""
-    categories = read_categories()
-    
-    if index < 0 or index >= len(categories):
-        raise HTTPException(status_code=404, detail="Category not found")
-    
-    # Check if new name conflicts with existing categories (excluding current one)
-    for i, existing in enumerate(categories):
-        if i != index and existing["category"].lower() == category.category.lower():
-            raise HTTPException(status_code=400, detail="Category name already exists")
-    
-    categories[index] = category.model_dump()
-    write_categories(categories)
-    return {"message": "Category updated successfully", "category": category.model_dump()}
-
-@app.delete("/categories/{index}")
-async def delete_category(index: int):
-    """Delete a category by index"""
-    categories = read_categories()
-    
-    if index < 0 or index >= len(categories):
-        raise HTTPException(status_code=404, detail="Category not found")
-    
-    deleted_category = categories.pop(index)
-    write_categories(categories)
-    return {"message": "Category deleted successfully", "deleted_category": deleted_category}
-
-@app.post("/categorize")
-async def categorize_note(note: Note):
-    # Extract URL and metadata for context
-    context_url = note.url
-    context_title = ""
-    context_domain = ""
-    
-    if note.metadata:
-        context_url = note.metadata.url or note.url
-        context_title = note.metadata.title
-        context_domain = note.metadata.domain
-    
-    print(f"Received categorization request: content='{note.content[:50]}...', url='{context_url}', title='{context_title}'")
-    categories = read_categories()
-    
-    existing_categories = [f"{cat['category']}: {cat['definition']}" for cat in categories]
-    
-    system_prompt = """You are an expert knowledge manager who excels at categorizing content. Your goal is to help users organize their knowledge effectively by assigning relevant, meaningful categories.
-
-INSTRUCTIONS:
-1. Analyze the note content and identify ALL relevant topics, themes, and concepts
-2. Assign 1-4 categories that best represent the content (multiple categories are encouraged for rich content)
-3. Use existing categories when they match, create new ones when needed
-4. Be creative and specific - help users discover connections they might not see
-5. NEVER use "Uncategorized" - every piece of content has some categorizable aspect
-
-RESPONSE FORMATS:
-
-For single category (existing):
-{
-    "categories": ["Web Development"]
-}
-
-For multiple categories (mix of existing and new):
-{
-    "categories": ["Machine Learning", "Research Methods"],
-    "new_categories": [
-        {
-            "category": "Research Methods",
-            "definition": "Methodologies and approaches for conducting research and analysis"
-        }
-    ]
-}
-
-For multiple new categories:
-{
-    "categories": ["Data Visualization", "Business Intelligence"],
-    "new_categories": [
-        {
-            "category": "Data Visualization", 
-            "definition": "Techniques and tools for visual representation of data and insights"
-        },
-        {
-            "category": "Business Intelligence",
-            "definition": "Strategic use of data analytics for business decision making"
-        }
-    ]
-}
-
-Always provide meaningful, specific categories that help organize knowledge effectively."""
-
-    # Build context information for better categorization
-    context_info = f"URL: {context_url}"
-    if context_title:
-        context_info += f"\nPage Title: {context_title}"
-    if context_domain:
-        context_info += f"\nWebsite: {context_domain}"
-    
-    user_prompt = f"""Note Content: "{note.content}"
-
-Webpage Context:
-{context_info}
-
-Existing Categories:
-{json.dumps(existing_categories, indent=2)}
-
-Please categorize this note considering both the content and the webpage context, and respond with JSON only."""
-
-    try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            response_format={'type': 'json_object'},
-            temperature=0.1,
-            stream=False
-        )
-        
-        raw_response = response.choices[0].message.content
-        print("DeepSeek API JSON Response:", raw_response)
-        
-        # Parse the JSON response
-        category_data = json.loads(raw_response)
-        
-        # Validate the response structure
-        if "categories" not in category_data:
-            raise ValueError("Response missing required 'categories' field")
-            
-        print("Successfully parsed category data:", category_data)
-        
-        # Process new categories if they exist
-        if "new_categories" in category_data and category_data["new_categories"]:
-            existing_names = [cat["category"].lower() for cat in categories]
-            for new_cat in category_data["new_categories"]:
-                if new_cat["category"].lower() not in existing_names:
-                    categories.append(new_cat)
-                    existing_names.append(new_cat["category"].lower())
-                    print(f"Added new category: {new_cat['category']}")
-            write_categories(categories)
-
-    except json.JSONDecodeError as e:
-        print(f"JSON parsing error: {e}")
-        print(f"Raw response: {raw_response}")
-        category_data = {"categories": ["General"], "definition": "JSON parsing failed"}
-    except Exception as e:
-        print(f"API call error: {e}")
-        category_data = {"categories": ["General"], "definition": "API call failed"}
-
-    # Add note to knowledge graph if service is available
-    if kg_service:
-        try:
-            note_data = {
-                "content": note.content,
-                "timestamp": note.timestamp or int(time.time()),
-                "categories": category_data.get("categories", []),
-                "metadata": {
-                    "title": context_title,
-                    "url": context_url,
-                    "domain": context_domain,
-                    "summary": note.metadata.summary if note.metadata else ""
-                }
-            }
-            await kg_service.add_note_entity(note_data)
-            logger.info("Note added to knowledge graph")
-        except Exception as e:
-            logger.error(f"Failed to add note to knowledge graph: {e}")
-
-    return category_data
-
-# Knowledge Graph Endpoints
-
-@app.post("/kg/notes")
-async def add_note_to_kg(note: Note):
-    """Add a note to the knowledge graph"""
-    if not kg_service:
-        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
-    
-    try:
-        import time
-        note_data = {
-            "content": note.content,
-            "timestamp": note.timestamp or int(time.time()),
-            "categories": note.categories or [],
-            "metadata": {
-                "title": note.metadata.title if note.metadata else "",
-                "url": note.metadata.url if note.metadata else note.url,
-                "domain": note.metadata.domain if note.metadata else "",
-                "summary": note.metadata.summary if note.metadata else ""
-            }
-        }
-        
-        note_id = await kg_service.add_note_entity(note_data)
-        return {"message": "Note added to knowledge graph", "note_id": note_id}
-        
-    except Exception as e:
-        logger.error(f"Failed to add note to knowledge graph: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.get("/kg/notes/{note_id}/related")
-async def get_related_notes(note_id: str, limit: int = 10):
-    """Get notes related to a specific note"""
-    if not kg_service:
-        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
-    
-    try:
-        related_notes = await kg_service.find_related_notes(note_id, limit)
-        return {"related_notes": related_notes}
-        
-    except Exception as e:
-        logger.error(f"Failed to get related notes: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.post("/kg/search")
-async def search_knowledge_graph(query: KnowledgeGraphQuery):
-    """Search entities in the knowledge graph"""
-    if not kg_service:
-        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
-    
-    try:
-        results = await kg_service.search_entities(
-            query.query, 
-            query.entity_types, 
-            query.limit
-        )
-        return {"results": results}
-        
-    except Exception as e:
-        logger.error(f"Failed to search knowledge graph: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.get("/kg/overview")
-async def get_knowledge_overview():
-    """Get overview of the knowledge graph"""
-    if not kg_service:
-        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
-    
-    try:
-        overview = await kg_service.get_knowledge_overview()
-        return overview
-        
-    except Exception as e:
-        logger.error(f"Failed to get knowledge overview: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.post("/kg/import")
-async def import_knowledge_data(import_data: ImportData):
-    """Import notes and categories to rebuild knowledge graph"""
-    if not kg_service:
-        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
-    
-    try:
-        import time
-        imported_notes = 0
-        imported_categories = 0
-        errors = []
-        
-        # Import categories first
-        if import_data.categories:
-            existing_categories = read_categories()
-            existing_names = [cat["category"].lower() for cat in existing_categories]
-            
-            for category in import_data.categories:
-                if category.get("category", "").lower() not in existing_names:
-                    existing_categories.append(category)
-                    existing_names.append(category.get("category", "").lower())
-                    imported_categories += 1
-            
-            write_categories(existing_categories)
-        
-        # Import notes and build knowledge graph
-        if import_data.notes:
-            for note_data in import_data.notes:
-                try:
-                    # Ensure required fields
-                    if not note_data.get("content"):
-                        continue
-                    
-                    # Normalize note data structure
-                    normalized_note = {
-                        "content": note_data.get("content", ""),
-                        "timestamp": note_data.get("timestamp") or int(time.time()),
-                        "categories": note_data.get("categories", []),
-                        "metadata": note_data.get("metadata", {})
-                    }
-                    
-                    # Add to knowledge graph
-                    await kg_service.add_note_entity(normalized_note)
-                    imported_notes += 1
-                    
-                except Exception as e:
-                    errors.append(f"Failed to import note: {str(e)}")
-                    logger.error(f"Failed to import note: {e}")
-        
-        return {
-            "message": "Import completed",
-            "imported_notes": imported_notes,
-            "imported_categories": imported_categories,
-            "errors": errors,
-            "total_notes": len(import_data.notes) if import_data.notes else 0
-        }
-        
-    except Exception as e:
-        logger.error(f"Failed to import knowledge data: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.get("/kg/export")
-async def export_knowledge_graph():
-    """Export complete knowledge graph data"""
-    if not kg_service:
-        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
-    
-    try:
-        # Get all entities
-        entities_ref = kg_service.db.collection("kg_entities")
-        entities = entities_ref.stream()
-        
-        # Get all relationships
-        relationships_ref = kg_service.db.collection("kg_relationships")
-        relationships = relationships_ref.stream()
-        
-        # Organize data by type
-        export_data = {
-            "metadata": {
-                "export_date": datetime.now().isoformat(),
-                "version": "2.0.0",
-                "source": "Knowledge Graph API"
-            },
-            "entities": {},
-            "relationships": []
-        }
-        
-        # Group entities by type
-        for entity in entities:
-            entity_data = entity.to_dict()
-            entity_type = entity_data.get("type", "unknown")
-            
-            if entity_type not in export_data["entities"]:
-                export_data["entities"][entity_type] = []
-            
-            export_data["entities"][entity_type].append({
-                "id": entity.id,
-                **entity_data
-            })
-        
-        # Collect relationships
-        for relationship in relationships:
-            rel_data = relationship.to_dict()
-            export_data["relationships"].append({
-                "id": relationship.id,
-                **rel_data
-            })
-        
-        return export_data
-        
-    except Exception as e:
-        logger.error(f"Failed to export knowledge graph: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-if __name__ == "__main__":
-    import time
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+import uvicorn
+import asyncio
+import json
+import os
+import time
+from dotenv import load_dotenv
+from typing import List, Optional
+import logging
+from datetime import datetime
+from services.knowledge_graph import KG_INDEX_SYNC_SECONDS, KnowledgeGraphService
+from services.llm_client import LLMClient
+from services.categorization_cache import CategorizationCache
+from services.category_registry import CategoryRegistry
+from services.category_index import CategoryIndex
+from services.note_classifier import NoteClassifier, LOCAL_CLASSIFIER_SEED_FILES
+from services.kg_queue import KGWorkQueue
+from services.overview_stats import KG_STATS_RECONCILE_SECONDS
+from services.graph_analytics import KG_ANALYTICS_REFRESH_SECONDS
+from services.near_duplicates import KG_DUPLICATE_POLICY
+
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = FastAPI(
+    title="Knowledge Weaver API",
+    description="API for categorizing notes and managing categories with knowledge graph",
+    version="2.0.0"
+)
+
+# Initialize Knowledge Graph Service
+try:
+    kg_service = KnowledgeGraphService()
+    logger.info("Knowledge Graph Service initialized")
+except Exception as e:
+    logger.error(f"Failed to initialize Knowledge Graph Service: {e}")
+    kg_service = None
+
+# Knowledge graph writes from /categorize go through a durable local queue, opened at startup
+kg_queue: Optional[KGWorkQueue] = None
+
+# Add CORS middleware for browser requests
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # In production, specify allowed origins
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+llm_client = LLMClient(api_key=os.getenv("DEEPSEEK_API_KEY"))
+categorization_cache = CategorizationCache()
+
+CATEGORIES_FILE = "../../data/categories.json"
+category_registry = CategoryRegistry(CATEGORIES_FILE)
+category_index = CategoryIndex()
+note_classifier = NoteClassifier()
+
+class WebpageMetadata(BaseModel):
+    title: str = ""
+    url: str = ""
+    domain: str = ""
+    summary: str = ""
+
+class Note(BaseModel):
+    content: str
+    url: str = ""  # Backward compatibility
+    metadata: WebpageMetadata = None  # New structured metadata
+    timestamp: Optional[int] = None
+    categories: Optional[List[str]] = None
+
+class KnowledgeGraphQuery(BaseModel):
+    query: str
+    entity_types: Optional[List[str]] = None
+    limit: int = 20
+
+class SimilarNotesQuery(BaseModel):
+    note_id: Optional[str] = None
+    text: Optional[str] = None
+    limit: int = 10
+
+class ImportData(BaseModel):
+    notes: List[dict]
+    categories: Optional[List[dict]] = None
+    metadata: Optional[dict] = None
+
+class Category(BaseModel):
+    category: str
+    definition: str
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    """Release pooled LLM connections"""
+    await llm_client.close()
+
+@app.on_event("shutdown")
+async def flush_categories():
+    """Write any pending category changes before exit"""
+    category_registry.close()
+
+async def _seed_note_classifier():
+    """Train the local classifier from export files and stored notes"""
+    for file_path in filter(None, (path.strip() for path in LOCAL_CLASSIFIER_SEED_FILES.split(","))):
+        try:
+            await asyncio.to_thread(note_classifier.learn_from_export, file_path)
+        except Exception as e:
+            logger.error(f"Failed to train local classifier from {file_path}: {e}")
+    if kg_service:
+        try:
+            await note_classifier.learn_from_firestore(kg_service.db)
+        except Exception as e:
+            logger.error(f"Failed to train local classifier from knowledge graph: {e}")
+    await asyncio.to_thread(note_classifier.save)
+
+@app.on_event("startup")
+async def start_note_classifier_training():
+    """Seed the local classifier in the background so startup is not delayed"""
+    app.state.classifier_seed_task = asyncio.create_task(_seed_note_classifier())
+
+@app.on_event("shutdown")
+async def save_note_classifier():
+    """Persist local classifier counts"""
+    note_classifier.save()
+
+@app.on_event("startup")
+async def start_kg_queue():
+    """Open the queue and start draining queued knowledge graph writes"""
+    global kg_queue
+    if not kg_service:
+        return
+    try:
+        kg_queue = await asyncio.to_thread(KGWorkQueue)
+        kg_queue.register("add_note", kg_service.add_note_entity)
+        await kg_queue.start()
+        logger.info(f"KG work queue opened at {kg_queue.db_path}")
+    except Exception as e:
+        logger.error(f"Failed to open KG work queue: {e}")
+        kg_queue = None
+
+@app.on_event("shutdown")
+async def stop_kg_queue():
+    """Stop queue workers; unfinished jobs stay in the queue for the next run"""
+    if kg_queue:
+        await kg_queue.stop()
+        await asyncio.to_thread(kg_queue.close)
+
+@app.on_event("startup")
+async def start_graph_index_load():
+    """Load the in-process graph index in the background; reads fall back to Firestore until it is ready"""
+    if kg_service:
+        app.state.graph_index_task = asyncio.create_task(kg_service.load_graph_index())
+
+async def _load_note_indexes():
+    """Preload the note indexes; a failure is already logged, and the next ingest retries the load"""
+    try:
+        await kg_service.load_note_indexes()
+    except Exception:
+        pass
+
+@app.on_event("startup")
+async def start_note_indexes_load():
+    """Index note timestamps, MinHash signatures and ingest keys in the background so the first ingest does not wait"""
+    if kg_service:
+        app.state.note_indexes_task = asyncio.create_task(_load_note_indexes())
+
+@app.on_event("startup")
+async def start_search_index_load():
+    """Load the entity search index in the background; /kg/search scans Firestore until it is ready"""
+    if kg_service:
+        app.state.search_index_task = asyncio.create_task(kg_service.load_search_index())
+
+@app.on_event("shutdown")
+async def save_search_index():
+    """Snapshot the entity search index so the next start only catches up"""
+    if kg_service and kg_service.search_index.ready:
+        try:
+            kg_service.search_index.save()
+        except Exception as e:
+            logger.error(f"Failed to save entity search index: {e}")
+
+@app.on_event("startup")
+async def start_vector_index_load():
+    """Load note vectors in the background; /kg/similar is unavailable until they are ready"""
+    if kg_service:
+        app.state.vector_index_task = asyncio.create_task(kg_service.load_vector_index())
+
+@app.on_event("shutdown")
+async def save_vector_index():
+    """Persist note vectors as a memory-mappable matrix so the next start only catches up"""
+    if kg_service and kg_service.vector_index.ready:
+        try:
+            kg_service.vector_index.save()
+        except Exception as e:
+            logger.error(f"Failed to save vector index: {e}")
+
+async def _reconcile_overview_stats():
+    """Recount the materialized overview stats every KG_STATS_RECONCILE_SECONDS to correct drift"""
+    while True:
+        await asyncio.sleep(KG_STATS_RECONCILE_SECONDS)
+        try:
+            await kg_service.reconcile_stats()
+        except Exception as e:
+            logger.error(f"Failed to reconcile overview stats: {e}")
+
+@app.on_event("startup")
+async def start_overview_stats_reconciliation():
+    """Schedule periodic reconciliation of /kg/overview stats (KG_STATS_RECONCILE_SECONDS=0 disables it)"""
+    if kg_service and KG_STATS_RECONCILE_SECONDS > 0:
+        app.state.stats_reconcile_task = asyncio.create_task(_reconcile_overview_stats())
+
+async def _refresh_graph_analytics():
+    """Compute graph analytics once the graph index is loaded, then refresh incrementally every KG_ANALYTICS_REFRESH_SECONDS"""
+    graph_task = getattr(app.state, "graph_index_task", None)
+    if graph_task is not None:
+        await graph_task
+    while True:
+        try:
+            await kg_service.refresh_analytics()
+        except Exception as e:
+            logger.error(f"Failed to refresh graph analytics: {e}")
+        await asyncio.sleep(KG_ANALYTICS_REFRESH_SECONDS)
+
+@app.on_event("startup")
+async def start_graph_analytics_refresh():
+    """Schedule background graph analytics (KG_ANALYTICS_REFRESH_SECONDS=0 leaves them to /kg/analytics/refresh)"""
+    if kg_service and KG_ANALYTICS_REFRESH_SECONDS > 0:
+        app.state.analytics_task = asyncio.create_task(_refresh_graph_analytics())
+
+@app.on_event("startup")
+async def start_index_sync():
+    """Periodically read back writes made by other processes into the in-process indexes (KG_INDEX_SYNC_SECONDS=0 disables it)"""
+    if kg_service and KG_INDEX_SYNC_SECONDS > 0:
+        app.state.index_sync_task = asyncio.create_task(kg_service.keep_indexes_synced())
+
+@app.on_event("shutdown")
+async def flush_kg_counters():
+    """Write counter increments and overview stats changes still coalescing in memory"""
+    if kg_service:
+        await kg_service.counters.close()
+        await kg_service.overview_stats.close()
+    for name in ("stats_reconcile_task", "analytics_task", "index_sync_task"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+
+@app.get("/health")
+async def health_check():
+    """Health check endpoint"""
+    return {"status": "healthy", "message": "Knowledge Weaver API is running"}
+
+@app.get("/llm/stats")
+async def get_llm_stats():
+    """Get LLM client concurrency usage"""
+    return llm_client.stats()
+
+@app.get("/categorize/cache/stats")
+async def get_categorization_cache_stats():
+    """Get categorization cache hit/miss counters"""
+    return categorization_cache.stats()
+
+@app.get("/categorize/classifier/stats")
+async def get_classifier_stats():
+    """Get local classifier size and fast-path hit counters"""
+    return note_classifier.stats()
+
+@app.get("/categories")
+async def get_categories():
+    """Get all categories"""
+    return category_registry.all()
+
+@app.post("/categories")
+async def add_category(category: Category):
+    """Add a new category"""
+    try:
+        category_registry.add(category.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Category added successfully", "category": category.model_dump()}
+
+@app.put("/categories/{index}")
+async def update_category(index: int, category: Category):
+    """Update a category by index"""
+    try:
+        category_registry.update(index, category.model_dump())
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Category updated successfully", "category": category.model_dump()}
+
+@app.delete("/categories/{index}")
+async def delete_category(index: int):
+    """Delete a category by index"""
+    try:
+        deleted_category = category_registry.delete(index)
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"message": "Category deleted successfully", "deleted_category": deleted_category}
+
+CATEGORIZE_SYSTEM_PROMPT = """You are an expert knowledge manager who excels at categorizing content. Your goal is to help users organize their knowledge effectively by assigning relevant, meaningful categories.
+
+INSTRUCTIONS:
+1. Analyze the note content and identify ALL relevant topics, themes, and concepts
+2. Assign 1-4 categories that best represent the content (multiple categories are encouraged for rich content)
+3. Use existing categories when they match, create new ones when needed
+4. Be creative and specific - help users discover connections they might not see
+5. NEVER use "Uncategorized" - every piece of content has some categorizable aspect
+
+RESPONSE FORMATS:
+
+For single category (existing):
+{
+    "categories": ["Web Development"]
+}
+
+For multiple categories (mix of existing and new):
+{
+    "categories": ["Machine Learning", "Research Methods"],
+    "new_categories": [
+        {
+            "category": "Research Methods",
+            "definition": "Methodologies and approaches for conducting research and analysis"
+        }
+    ]
+}
+
+For multiple new categories:
+{
+    "categories": ["Data Visualization", "Business Intelligence"],
+    "new_categories": [
+        {
+            "category": "Data Visualization", 
+            "definition": "Techniques and tools for visual representation of data and insights"
+        },
+        {
+            "category": "Business Intelligence",
+            "definition": "Strategic use of data analytics for business decision making"
+        }
+    ]
+}
+
+Always provide meaningful, specific categories that help organize knowledge effectively."""
+
+BATCH_CATEGORIZE_SYSTEM_PROMPT = CATEGORIZE_SYSTEM_PROMPT + """
+
+BATCH MODE:
+You will receive several notes, each with an "index". Categorize every note independently and wrap the per-note objects described above in a "results" list, keeping each note's index:
+{
+    "results": [
+        {"index": 0, "categories": ["Web Development"]},
+        {"index": 1, "categories": ["Research Methods"], "new_categories": [{"category": "Research Methods", "definition": "Methodologies and approaches for conducting research and analysis"}]}
+    ]
+}"""
+
+KG_IMPORT_CHUNK_SIZE = int(os.getenv("KG_IMPORT_CHUNK_SIZE", "500"))
+# Longer NDJSON lines are skipped with a per-line error instead of being buffered
+KG_IMPORT_MAX_LINE_BYTES = int(os.getenv("KG_IMPORT_MAX_LINE_BYTES", str(1024 * 1024)))
+KG_NEIGHBORHOOD_MAX_HOPS = int(os.getenv("KG_NEIGHBORHOOD_MAX_HOPS", "3"))
+KG_NEIGHBORHOOD_MAX_NODES = int(os.getenv("KG_NEIGHBORHOOD_MAX_NODES", "500"))
+
+CATEGORIZE_BATCH_MAX_NOTES = int(os.getenv("CATEGORIZE_BATCH_MAX_NOTES", "500"))
+CATEGORIZE_BATCH_PACK_SIZE = int(os.getenv("CATEGORIZE_BATCH_PACK_SIZE", "5"))
+CATEGORIZE_BATCH_CONCURRENCY = int(os.getenv("CATEGORIZE_BATCH_CONCURRENCY", "4"))
+
+def _note_context(note: Note):
+    """Resolve (url, title, domain) from a note's metadata, falling back to the legacy url field"""
+    if note.metadata:
+        return note.metadata.url or note.url, note.metadata.title, note.metadata.domain
+    return note.url, "", ""
+
+def _shortlist_categories(notes: List[Note], categories: List[dict], version: str) -> List[dict]:
+    """Keep only the categories most similar to the notes so prompt size stays bounded"""
+    category_index.sync(categories, version)
+    texts = []
+    for note in notes:
+        _, context_title, context_domain = _note_context(note)
+        texts.append(f"{note.content} {context_title} {context_domain}")
+    return category_index.shortlist(categories, texts)
+
+def _format_existing_categories(categories: List[dict]) -> str:
+    existing_categories = [f"{cat['category']}: {cat['definition']}" for cat in categories]
+    return json.dumps(existing_categories, indent=2)
+
+async def _categorize_with_llm(note: Note, categories: List[dict]):
+    """Ask the LLM to categorize a single note; returns (category_data, succeeded)"""
+    context_url, context_title, context_domain = _note_context(note)
+
+    # Build context information for better categorization
+    context_info = f"URL: {context_url}"
+    if context_title:
+        context_info += f"\nPage Title: {context_title}"
+    if context_domain:
+        context_info += f"\nWebsite: {context_domain}"
+    
+    user_prompt = f"""Note Content: "{note.content}"
+
+Webpage Context:
+{context_info}
+
+Existing Categories:
+{_format_existing_categories(categories)}
+
+Please categorize this note considering both the content and the webpage context, and respond with JSON only."""
+
+    raw_response = None
+    try:
+        raw_response = await llm_client.chat_json(CATEGORIZE_SYSTEM_PROMPT, user_prompt)
+        print("DeepSeek API JSON Response:", raw_response)
+        
+        # Parse the JSON response
+        category_data = json.loads(raw_response)
+        
+        # Validate the response structure
+        if "categories" not in category_data:
+            raise ValueError("Response missing required 'categories' field")
+            
+        print("Successfully parsed category data:", category_data)
+        return category_data, True
+    except json.JSONDecodeError as e:
+        print(f"JSON parsing error: {e}")
+        print(f"Raw response: {raw_response}")
+        category_data = {"categories": ["General"], "definition": "JSON parsing failed"}
+    except Exception as e:
+        print(f"API call error: {e}")
+        category_data = {"categories": ["General"], "definition": "API call failed"}
+
+    return category_data, False
+
+async def _categorize_pack_with_llm(notes: List[Note], categories: List[dict]) -> List[Optional[dict]]:
+    """Categorize several notes in one LLM request; entries the model skipped come back as None"""
+    packed_notes = []
+    for index, note in enumerate(notes):
+        context_url, context_title, context_domain = _note_context(note)
+        packed_notes.append({
+            "index": index,
+            "content": note.content,
+            "url": context_url,
+            "title": context_title,
+            "website": context_domain
+        })
+
+    user_prompt = f"""Notes:
+{json.dumps(packed_notes, indent=2)}
+
+Existing Categories:
+{_format_existing_categories(categories)}
+
+Please categorize each note considering both its content and its webpage context, and respond with JSON only."""
+
+    results: List[Optional[dict]] = [None] * len(notes)
+    try:
+        raw_response = await llm_client.chat_json(BATCH_CATEGORIZE_SYSTEM_PROMPT, user_prompt)
+        for item in json.loads(raw_response).get("results", []):
+            index = item.get("index")
+            if isinstance(index, int) and 0 <= index < len(notes) and "categories" in item:
+                results[index] = {key: value for key, value in item.items() if key != "index"}
+    except Exception as e:
+        print(f"Batch categorization error: {e}")
+
+    return results
+
+def _classify_locally(note: Note) -> Optional[dict]:
+    """Answer from the local classifier when it is confident and its labels are still registered"""
+    _, context_title, context_domain = _note_context(note)
+    category_data = note_classifier.classify(note.content, context_title, context_domain)
+    if category_data is None:
+        return None
+    category_data["categories"] = [name for name in category_data["categories"] if name in category_registry]
+    return category_data if category_data["categories"] else None
+
+def _kg_note_id(note: Note) -> str:
+    """Id the knowledge graph stores a note under; a missing timestamp is pinned so every caller agrees"""
+    if not note.timestamp:
+        note.timestamp = int(time.time())
+    return f"note-{note.timestamp}"
+
+def _learn_categorization(note: Note, categories: List[str]):
+    """Feed an LLM- or user-labelled note back into the local classifier, once per note id"""
+    _, context_title, context_domain = _note_context(note)
+    note_classifier.learn(note.content, categories, context_title, context_domain, _kg_note_id(note))
+
+async def _enqueue_categorized_note(note: Note, categories: List[str]):
+    """Queue a freshly categorized note for the knowledge graph if the service is available"""
+    if not kg_queue:
+        return
+    try:
+        context_url, context_title, context_domain = _note_context(note)
+        _kg_note_id(note)
+        note_data = {
+            "content": note.content,
+            "timestamp": note.timestamp,
+            "categories": categories,
+            "metadata": {
+                "title": context_title,
+                "url": context_url,
+                "domain": context_domain,
+                "summary": note.metadata.summary if note.metadata else ""
+            }
+        }
+        if await kg_queue.enqueue("add_note", note_data):
+            logger.info("Note queued for knowledge graph")
+    except Exception as e:
+        logger.error(f"Failed to queue note for knowledge graph: {e}")
+
+@app.post("/categorize")
+async def categorize_note(note: Note):
+    context_url, context_title, context_domain = _note_context(note)
+    
+    print(f"Received categorization request: content='{note.content[:50]}...', url='{context_url}', title='{context_title}'")
+    categories = category_registry.all()
+
+    cache_version = category_registry.version
+    cache_key = CategorizationCache.make_key(note.content, context_url, context_title, cache_version)
+    category_data = await categorization_cache.get(cache_key, cache_version)
+
+    if category_data is not None:
+        print("Categorization cache hit")
+    else:
+        category_data = _classify_locally(note)
+        if category_data is not None:
+            print(f"Local classifier answered: {category_data}")
+
+    if category_data is None:
+        candidates = _shortlist_categories([note], categories, cache_version)
+        category_data, succeeded = await _categorize_with_llm(note, candidates)
+        if succeeded:
+            category_registry.merge(category_data.get("new_categories"))
+            _learn_categorization(note, category_data["categories"])
+            # Key on the category set as written so newly created categories do not orphan this entry
+            cache_version = category_registry.version
+            cache_key = CategorizationCache.make_key(note.content, context_url, context_title, cache_version)
+            await categorization_cache.set(cache_key, cache_version, category_data)
+
+    await _enqueue_categorized_note(note, category_data.get("categories", []))
+
+    return category_data
+
+@app.post("/categorize/batch")
+async def categorize_notes_batch(notes: List[Note]):
+    """Categorize many notes at once; results are returned in request order"""
+    if len(notes) > CATEGORIZE_BATCH_MAX_NOTES:
+        raise HTTPException(status_code=400, detail=f"Batch too large (max {CATEGORIZE_BATCH_MAX_NOTES} notes)")
+
+    print(f"Received batch categorization request: {len(notes)} notes")
+    categories = category_registry.all()
+    category_version = category_registry.version
+
+    results: List[Optional[dict]] = [None] * len(notes)
+    succeeded = [False] * len(notes)
+    pending = []
+    for i, note in enumerate(notes):
+        context_url, context_title, _ = _note_context(note)
+        cached = await categorization_cache.get(
+            CategorizationCache.make_key(note.content, context_url, context_title, category_version),
+            category_version
+        )
+        if cached is not None:
+            results[i] = cached
+            continue
+        results[i] = _classify_locally(note)
+        if results[i] is None:
+            pending.append(i)
+
+    semaphore = asyncio.Semaphore(CATEGORIZE_BATCH_CONCURRENCY)
+
+    async def run_pack(indices: List[int]):
+        async with semaphore:
+            pack_notes = [notes[i] for i in indices]
+            candidates = _shortlist_categories(pack_notes, categories, category_version)
+            pack_results = await _categorize_pack_with_llm(pack_notes, candidates)
+        for i, category_data in zip(indices, pack_results):
+            if category_data is None:
+                # The model dropped this note from the pack; retry it on its own
+                async with semaphore:
+                    candidates = _shortlist_categories([notes[i]], categories, category_version)
+                    category_data, ok = await _categorize_with_llm(notes[i], candidates)
+            else:
+                ok = True
+            results[i] = category_data
+            succeeded[i] = ok
+
+    await asyncio.gather(*[
+        run_pack(pending[start:start + CATEGORIZE_BATCH_PACK_SIZE])
+        for start in range(0, len(pending), CATEGORIZE_BATCH_PACK_SIZE)
+    ])
+
+    # Merge every new category in one registry update so it is persisted by a single flush
+    new_categories = []
+    for i in pending:
+        if succeeded[i]:
+            new_categories.extend(results[i].get("new_categories") or [])
+    category_registry.merge(new_categories)
+
+    cache_version = category_registry.version
+    for i in pending:
+        if succeeded[i]:
+            _learn_categorization(notes[i], results[i]["categories"])
+            context_url, context_title, _ = _note_context(notes[i])
+            cache_key = CategorizationCache.make_key(notes[i].content, context_url, context_title, cache_version)
+            await categorization_cache.set(cache_key, cache_version, results[i])
+
+    for note, category_data in zip(notes, results):
+        await _enqueue_categorized_note(note, category_data.get("categories", []))
+
+    return {"results": results, "total_notes": len(notes), "llm_notes": len(pending)}
+
+# Knowledge Graph Endpoints
+
+@app.get("/kg/queue/stats")
+async def get_kg_queue_stats():
+    """Get knowledge graph write queue depth and lag"""
+    if not kg_queue:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    return await asyncio.to_thread(kg_queue.stats)
+
+@app.get("/kg/cache/stats")
+async def get_kg_cache_stats():
+    """Get knowledge graph entity cache hit/miss counters"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    return kg_service.entity_cache.stats()
+
+@app.get("/kg/counters/stats")
+async def get_kg_counter_stats():
+    """Get coalesced counter flush statistics"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    return kg_service.counters.stats()
+
+@app.get("/kg/overview/stats")
+async def get_kg_overview_stats():
+    """Get materialized overview stats flush and reconciliation counters"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    return kg_service.overview_stats.stats()
+
+@app.post("/kg/overview/reconcile")
+async def reconcile_kg_overview():
+    """Recount the materialized overview stats from every entity now"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    try:
+        return await kg_service.reconcile_stats()
+    except Exception as e:
+        logger.error(f"Failed to reconcile overview stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/kg/search/stats")
+async def get_kg_search_stats():
+    """Get entity search index size and state"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    return kg_service.search_index.stats()
+
+@app.get("/kg/similar/stats")
+async def get_kg_similar_stats():
+    """Get note vector index size and state"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    return kg_service.vector_index.stats()
+
+@app.get("/kg/ingest/stats")
+async def get_kg_ingest_stats():
+    """Get ingest key count and notes skipped as already ingested"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    return kg_service.ingest_keys.stats()
+
+@app.get("/kg/graph/stats")
+async def get_kg_graph_stats():
+    """Get in-process graph index size and state"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    if kg_service.graph_index is None:
+        return {"enabled": False}
+    return {"enabled": True, **kg_service.graph_index.stats()}
+
+@app.post("/kg/notes")
+async def add_note_to_kg(note: Note):
+    """Add a note to the knowledge graph"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    
+    try:
+        _kg_note_id(note)
+        note_data = {
+            "content": note.content,
+            "timestamp": note.timestamp,
+            "categories": note.categories or [],
+            "metadata": {
+                "title": note.metadata.title if note.metadata else "",
+                "url": note.metadata.url if note.metadata else note.url,
+                "domain": note.metadata.domain if note.metadata else "",
+                "summary": note.metadata.summary if note.metadata else ""
+            }
+        }
+        
+        note_id = await kg_service.add_note_entity(note_data)
+        _learn_categorization(note, note_data["categories"])
+        return {"message": "Note added to knowledge graph", "note_id": note_id}
+        
+    except Exception as e:
+        logger.error(f"Failed to add note to knowledge graph: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/kg/notes/{note_id}/related")
+async def get_related_notes(note_id: str, limit: int = 10):
+    """Get notes related to a specific note"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    
+    try:
+        related_notes = await kg_service.find_related_notes(note_id, limit)
+        return {"related_notes": related_notes}
+        
+    except Exception as e:
+        logger.error(f"Failed to get related notes: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _require_graph_index():
+    """Traversals run only on the in-process graph index"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    if not kg_service.graph_ready:
+        raise HTTPException(status_code=503, detail="Graph index is not loaded yet")
+
+def _parse_types(types: Optional[str]) -> Optional[List[str]]:
+    return [t.strip() for t in types.split(",") if t.strip()] if types else None
+
+@app.get("/kg/path")
+async def get_graph_path(from_id: str = Query(..., alias="from"), to: str = Query(...), types: Optional[str] = None):
+    """Weighted shortest path between two entities (stronger relationships are shorter)"""
+    _require_graph_index()
+    try:
+        return await kg_service.find_path(from_id, to, _parse_types(types))
+    except Exception as e:
+        logger.error(f"Failed to find path: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/kg/neighborhood/{entity_id}")
+async def get_graph_neighborhood(entity_id: str, hops: int = 1, types: Optional[str] = None, max_nodes: int = 200):
+    """Entities within k hops of an entity, optionally following only some relationship types"""
+    _require_graph_index()
+    if hops < 1 or hops > KG_NEIGHBORHOOD_MAX_HOPS:
+        raise HTTPException(status_code=400, detail=f"hops must be between 1 and {KG_NEIGHBORHOOD_MAX_HOPS}")
+    try:
+        return await kg_service.get_neighborhood(
+            entity_id, hops, _parse_types(types), max(1, min(max_nodes, KG_NEIGHBORHOOD_MAX_NODES))
+        )
+    except Exception as e:
+        logger.error(f"Failed to get neighborhood: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _require_analytics():
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    if not kg_service.analytics.ready:
+        raise HTTPException(status_code=503, detail="Graph analytics have not been computed yet")
+
+@app.post("/kg/analytics/refresh")
+async def refresh_graph_analytics(full: bool = False):
+    """Recompute PageRank, components and communities; full rewrites every entity's results"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    try:
+        return await kg_service.refresh_analytics(full)
+    except Exception as e:
+        logger.error(f"Failed to refresh graph analytics: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/kg/analytics/central")
+async def get_central_entities(types: Optional[str] = None, limit: int = 20):
+    """Entities ranked by weighted PageRank, optionally of some types"""
+    _require_analytics()
+    try:
+        return {"entities": await kg_service.central_entities(max(1, min(limit, 100)), _parse_types(types))}
+    except Exception as e:
+        logger.error(f"Failed to get central entities: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/kg/analytics/communities")
+async def get_communities(limit: int = 20):
+    """Largest communities with their size, type mix and most central members"""
+    _require_analytics()
+    try:
+        return {"communities": await kg_service.community_summaries(max(1, min(limit, 100)))}
+    except Exception as e:
+        logger.error(f"Failed to get communities: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/kg/analytics/stats")
+async def get_analytics_stats():
+    """Get the last graph analytics run"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    return kg_service.analytics.stats()
+
+@app.post("/kg/duplicates/dedupe")
+async def dedupe_notes(policy: str = "link", dry_run: bool = True):
+    """Find near-duplicate notes across the whole graph and link or merge them; dry_run only reports"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    if policy not in ("link", "merge"):
+        raise HTTPException(status_code=400, detail="policy must be 'link' or 'merge'")
+    try:
+        return await kg_service.dedupe_notes(policy, dry_run)
+    except Exception as e:
+        logger.error(f"Failed to dedupe notes: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/kg/duplicates/stats")
+async def get_duplicate_stats():
+    """Get near-duplicate index size and lookup counters"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    return {"policy": KG_DUPLICATE_POLICY, **kg_service.duplicate_index.stats()}
+
+@app.post("/kg/search")
+async def search_knowledge_graph(query: KnowledgeGraphQuery):
+    """Search entities in the knowledge graph"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    
+    try:
+        results = await kg_service.search_entities(
+            query.query, 
+            query.entity_types, 
+            query.limit
+        )
+        return {"results": results}
+        
+    except Exception as e:
+        logger.error(f"Failed to search knowledge graph: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/kg/similar")
+async def find_similar_notes(query: SimilarNotesQuery):
+    """Notes closest in embedding space to a stored note or to free text"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    if not kg_service.vector_index.ready:
+        raise HTTPException(status_code=503, detail="Vector index is not loaded yet")
+    if not query.note_id and not (query.text or "").strip():
+        raise HTTPException(status_code=400, detail="Provide note_id or text")
+
+    try:
+        results = await kg_service.find_similar_notes(query.note_id, query.text, max(1, min(query.limit, 100)))
+        return {"results": results}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to find similar notes: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/kg/overview")
+async def get_knowledge_overview():
+    """Get overview of the knowledge graph"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    
+    try:
+        overview = await kg_service.get_knowledge_overview()
+        return overview
+        
+    except Exception as e:
+        logger.error(f"Failed to get knowledge overview: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _normalize_import_note(note_data: dict) -> dict:
+    """Normalize an imported note to the shape add_note_entity expects"""
+    return {
+        "content": note_data.get("content", ""),
+        "timestamp": note_data.get("timestamp") or int(time.time()),
+        "categories": note_data.get("categories", []),
+        "metadata": note_data.get("metadata", {})
+    }
+
+@app.post("/kg/import")
+async def import_knowledge_data(import_data: ImportData, bulk: bool = False):
+    """Import notes and categories to rebuild knowledge graph (?bulk=true batches all writes)"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    
+    try:
+        imported_notes = 0
+        skipped_notes = 0
+        superseded_notes = 0
+        imported_categories = 0
+        errors = []
+        
+        # Import categories first
+        if import_data.categories:
+            imported_categories = len(category_registry.merge(import_data.categories))
+        
+        # Import notes and build knowledge graph
+        if import_data.notes and bulk:
+            normalized_notes = [
+                _normalize_import_note(note_data)
+                for note_data in import_data.notes if note_data.get("content")
+            ]
+
+            def log_progress(committed: int, total: int):
+                logger.info(f"Bulk import progress: {committed}/{total} writes committed")
+
+            result = await kg_service.bulk_add_notes(normalized_notes, progress=log_progress)
+            await asyncio.to_thread(note_classifier.learn_many, import_data.notes)
+            imported_notes = result["notes"]
+            skipped_notes = result["skipped_notes"]
+            superseded_notes = result["superseded_notes"]
+            errors.extend(result["errors"])
+        elif import_data.notes:
+            for note_data in import_data.notes:
+                try:
+                    # Ensure required fields
+                    if not note_data.get("content"):
+                        continue
+                    
+                    normalized_note = _normalize_import_note(note_data)
+                    
+                    # Add to knowledge graph
+                    await kg_service.add_note_entity(normalized_note)
+                    await asyncio.to_thread(note_classifier.learn_many, [{**normalized_note, "id": note_data.get("id")}])
+                    imported_notes += 1
+                    
+                except Exception as e:
+                    errors.append(f"Failed to import note: {str(e)}")
+                    logger.error(f"Failed to import note: {e}")
+        
+        return {
+            "message": "Import completed",
+            "imported_notes": imported_notes,
+            "skipped_notes": skipped_notes,
+            "superseded_notes": superseded_notes,
+            "imported_categories": imported_categories,
+            "errors": errors,
+            "total_notes": len(import_data.notes) if import_data.notes else 0
+        }
+        
+    except Exception as e:
+        logger.error(f"Failed to import knowledge data: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _json_default(value):
+    """Serialize Firestore timestamps and other non-JSON values in exports"""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+def _export_metadata() -> dict:
+    return {
+        "export_date": datetime.now().isoformat(),
+        "version": "2.0.0",
+        "source": "Knowledge Graph API"
+    }
+
+async def _iter_ndjson_export():
+    """One JSON object per line: a metadata header, then entities, then relationships"""
+    yield json.dumps({"record": "metadata", **_export_metadata()}) + "\n"
+    record_names = {"entities": "entity", "relationships": "relationship"}
+    async for collection, item in kg_service.iter_export():
+        yield json.dumps({"record": record_names[collection], **item}, default=_json_default) + "\n"
+
+@app.post("/kg/import/stream")
+async def import_knowledge_data_stream(request: Request):
+    """Import an NDJSON body (one note or {"record": "category", ...} per line) in bounded chunks as it uploads"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+
+    summary = {"imported_notes": 0, "skipped_notes": 0, "superseded_notes": 0, "imported_categories": 0,
+               "total_notes": 0, "chunks": 0}
+    errors = []
+    chunk: List[dict] = []
+    in_flight: Optional[asyncio.Task] = None
+
+    async def write_chunk(notes: List[dict]):
+        result = await kg_service.bulk_add_notes([_normalize_import_note(n) for n in notes])
+        await asyncio.to_thread(note_classifier.learn_many, notes)
+        summary["imported_notes"] += result["notes"]
+        summary["skipped_notes"] += result["skipped_notes"]
+        summary["superseded_notes"] += result["superseded_notes"]
+        summary["chunks"] += 1
+        errors.extend(result["errors"])
+
+    async def flush():
+        # Keep one chunk writing while the next one fills, so memory stays at two chunks
+        nonlocal chunk, in_flight
+        if in_flight:
+            await in_flight
+        in_flight = asyncio.create_task(write_chunk(chunk)) if chunk else None
+        chunk = []
+
+    def handle_line(line: bytes):
+        line = line.strip()
+        if not line:
+            return
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            errors.append(f"Invalid JSON line: {e}")
+            return
+        if not isinstance(record, dict):
+            errors.append(f"Invalid line: expected a JSON object, got {type(record).__name__}")
+            return
+        kind = record.pop("record", "note")
+        if kind == "category":
+            summary["imported_categories"] += len(category_registry.merge([record]))
+        elif kind == "note" and record.get("content"):
+            summary["total_notes"] += 1
+            chunk.append(record)
+
+    # Pieces of the line being received; joined once when its newline arrives
+    partial: List[bytes] = []
+    partial_size = 0
+    oversized = False
+
+    def end_line(piece: bytes):
+        nonlocal partial_size, oversized
+        if not oversized and partial_size + len(piece) > KG_IMPORT_MAX_LINE_BYTES:
+            errors.append(f"Line longer than {KG_IMPORT_MAX_LINE_BYTES} bytes skipped")
+        elif not oversized:
+            handle_line(b"".join(partial) + piece)
+        partial.clear()
+        partial_size = 0
+        oversized = False
+
+    def feed(data: bytes):
+        nonlocal partial_size, oversized
+        *complete, rest = data.split(b"\n")
+        for piece in complete:
+            end_line(piece)
+        if oversized:
+            return
+        if partial_size + len(rest) > KG_IMPORT_MAX_LINE_BYTES:
+            errors.append(f"Line longer than {KG_IMPORT_MAX_LINE_BYTES} bytes skipped")
+            partial.clear()
+            partial_size = 0
+            oversized = True
+        elif rest:
+            partial.append(rest)
+            partial_size += len(rest)
+
+    try:
+        async for data in request.stream():
+            feed(data)
+            if len(chunk) >= KG_IMPORT_CHUNK_SIZE:
+                await flush()
+        end_line(b"")
+        await flush()
+        if in_flight:
+            await in_flight
+    except Exception as e:
+        logger.error(f"Failed to import knowledge data stream: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {"message": "Import completed", **summary, "errors": errors}
+
+@app.get("/kg/export")
+async def export_knowledge_graph(format: str = "json"):
+    """Export complete knowledge graph data (format=ndjson streams it with constant memory)"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+
+    if format == "ndjson":
+        return StreamingResponse(_iter_ndjson_export(), media_type="application/x-ndjson")
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'ndjson'")
+    
+    try:
+        # Organize data by type
+        export_data = {
+            "metadata": _export_metadata(),
+            "entities": {},
+            "relationships": []
+        }
+        
+        # Group entities by type
+        async for entity in kg_service.db.collection("kg_entities").stream():
+            entity_data = entity.to_dict()
+            entity_type = entity_data.get("type", "unknown")
+            
+            if entity_type not in export_data["entities"]:
+                export_data["entities"][entity_type] = []
+            
+            export_data["entities"][entity_type].append({
+                "id": entity.id,
+                **entity_data
+            })
+        
+        # Collect relationships
+        async for relationship in kg_service.db.collection("kg_relationships").stream():
+            rel_data = relationship.to_dict()
+            export_data["relationships"].append({
+                "id": relationship.id,
+                **rel_data
+            })
+        
+        return export_data
+        
+    except Exception as e:
+        logger.error(f"Failed to export knowledge graph: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/kg/export/page")
+async def export_knowledge_graph_page(collection: str = "entities", cursor: Optional[str] = None,
+                                      limit: int = 1000, end: Optional[str] = None):
+    """Export one page of entities or relationships; pass next_cursor back to resume"""
+    if not kg_service:
+        raise HTTPException(status_code=503, detail="Knowledge Graph service not available")
+    if limit < 1 or limit > 5000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 5000")
+
+    try:
+        return await kg_service.export_page(collection, cursor, limit, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to export knowledge graph page: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=8000)
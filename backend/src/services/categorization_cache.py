@@ -0,0 +1,136 @@
+"""
+Categorization cache for kg-note
+Content-addressed LRU in memory with an optional SQLite tier on disk
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CATEGORIZATION_CACHE_SIZE = int(os.getenv("CATEGORIZATION_CACHE_SIZE", "2048"))
+CATEGORIZATION_CACHE_PATH = os.getenv("CATEGORIZATION_CACHE_PATH", "")
+
+
+def category_set_version(categories: List[Dict]) -> str:
+    """Stable fingerprint of the category set; changes whenever categories.json does"""
+    payload = json.dumps(categories, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+class CategorizationCache:
+    def __init__(self, max_entries: int = CATEGORIZATION_CACHE_SIZE, db_path: str = CATEGORIZATION_CACHE_PATH):
+        """Create the in-memory tier and open the disk tier if a path is configured"""
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        self._db = None
+        # Disk-tier statements run in worker threads and share one connection
+        self._db_lock = threading.Lock()
+        if db_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS categorization_cache ("
+                    "key TEXT PRIMARY KEY, version TEXT NOT NULL, value TEXT NOT NULL)"
+                )
+                self._db.commit()
+                logger.info(f"Categorization cache disk tier at {db_path}")
+            except sqlite3.Error as e:
+                logger.error(f"Failed to open categorization cache at {db_path}: {e}")
+                self._db = None
+
+    @staticmethod
+    def make_key(content: str, url: str, title: str, version: str) -> str:
+        """Hash note content, page context and category-set version into a cache key"""
+        digest = hashlib.sha256()
+        for part in (version, url or "", title or "", content):
+            digest.update(part.encode())
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    async def _check_version(self, version: str):
+        """Drop entries computed against an older category set"""
+        if version == self._version:
+            return
+        if self._version is not None:
+            logger.info("Category set changed, invalidating categorization cache")
+        self._entries.clear()
+        self._version = version
+        if self._db:
+            await asyncio.to_thread(self._disk_write, "DELETE FROM categorization_cache WHERE version != ?", (version,))
+
+    def _disk_read(self, key: str, version: str) -> Optional[str]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value FROM categorization_cache WHERE key = ? AND version = ?",
+                (key, version)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _disk_write(self, sql: str, params: tuple):
+        with self._db_lock:
+            self._db.execute(sql, params)
+            self._db.commit()
+
+    async def get(self, key: str, version: str) -> Optional[Dict]:
+        """Look up a cached categorization; the disk tier is read off the event loop"""
+        await self._check_version(version)
+
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(value)
+
+        if self._db:
+            row = await asyncio.to_thread(self._disk_read, key, version)
+            if row:
+                value = json.loads(row)
+                self._remember(key, value)
+                self.hits += 1
+                self.disk_hits += 1
+                return dict(value)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, version: str, value: Dict):
+        """Store a categorization in both tiers; the disk tier is written off the event loop"""
+        await self._check_version(version)
+        self._remember(key, value)
+        if self._db:
+            await asyncio.to_thread(
+                self._disk_write,
+                "INSERT OR REPLACE INTO categorization_cache (key, version, value) VALUES (?, ?, ?)",
+                (key, version, json.dumps(value))
+            )
+
+    def _remember(self, key: str, value: Dict):
+        self._entries[key] = dict(value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and tier sizes"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "disk_enabled": self._db is not None
+        }
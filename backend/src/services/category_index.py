@@ -0,0 +1,143 @@
+"""
+Category Index for kg-note
+Lexical retrieval over category names and definitions to shortlist prompt candidates
+"""
+
+import math
+import os
+import re
+import logging
+from collections import Counter
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_SHORTLIST_K = int(os.getenv("CATEGORY_SHORTLIST_K", "30"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "with", "www", "http", "https", "com"
+}
+
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+# Category names are short and precise, so their terms count more than definition terms
+_NAME_WEIGHT = 3
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords dropped and plural 's' stripped"""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _STOPWORDS or len(token) < 2:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class CategoryIndex:
+    def __init__(self):
+        """Empty inverted index; call sync() with the category list to populate"""
+        self._docs: Dict[str, Counter] = {}
+        self._lengths: Dict[str, int] = {}
+        self._sources: Dict[str, tuple] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._synced_version: Optional[str] = None
+
+    def upsert(self, name: str, definition: str):
+        """Index or re-index one category"""
+        key = name.lower()
+        if self._sources.get(key) == (name, definition):
+            return
+        self.remove(name)
+
+        terms = Counter(tokenize(definition))
+        for token in tokenize(name):
+            terms[token] += _NAME_WEIGHT
+        self._docs[key] = terms
+        self._sources[key] = (name, definition)
+        self._lengths[key] = sum(terms.values())
+        self._total_length += self._lengths[key]
+        for term, count in terms.items():
+            self._postings.setdefault(term, {})[key] = count
+
+    def remove(self, name: str):
+        """Drop one category from the index"""
+        key = name.lower()
+        terms = self._docs.pop(key, None)
+        if terms is None:
+            return
+        self._sources.pop(key, None)
+        self._total_length -= self._lengths.pop(key, 0)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[term]
+
+    def sync(self, categories: List[Dict], version: Optional[str] = None):
+        """Bring the index in line with the category list, touching only what changed"""
+        if version is not None and version == self._synced_version:
+            return
+        current = set()
+        for cat in categories:
+            name = cat.get("category", "")
+            key = name.lower()
+            if key in current:
+                continue
+            current.add(key)
+            self.upsert(name, cat.get("definition", ""))
+        for key in [key for key in self._docs if key not in current]:
+            self.remove(self._sources[key][0])
+        self._synced_version = version
+
+    def rank(self, text: str) -> List[tuple]:
+        """(lowercase name, BM25 score) pairs for categories sharing terms with text, best first"""
+        if not self._docs:
+            return []
+        n_docs = len(self._docs)
+        avg_length = self._total_length / n_docs if n_docs else 0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(text)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, tf in postings.items():
+                norm = tf + _K1 * (1 - _B + _B * self._lengths[key] / avg_length) if avg_length else tf + _K1
+                scores[key] = scores.get(key, 0.0) + idf * tf * (_K1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    def shortlist(self, categories: List[Dict], texts: List[str], k: int = CATEGORY_SHORTLIST_K) -> List[Dict]:
+        """Pick at most k categories relevant to any of texts, padded in file order when few match"""
+        if len(categories) <= k:
+            return categories
+
+        by_key = {}
+        for cat in categories:
+            by_key.setdefault(cat.get("category", "").lower(), cat)
+
+        # Round-robin over each text's ranking so one note in a pack cannot crowd out the others
+        rankings = [self.rank(text) for text in texts]
+        chosen: Dict[str, Dict] = {}
+        depth = 0
+        while len(chosen) < k and any(depth < len(ranking) for ranking in rankings):
+            for ranking in rankings:
+                if depth < len(ranking) and len(chosen) < k:
+                    key = ranking[depth][0]
+                    if key in by_key:
+                        chosen.setdefault(key, by_key[key])
+            depth += 1
+
+        for key, cat in by_key.items():
+            if len(chosen) >= k:
+                break
+            chosen.setdefault(key, cat)
+
+        return list(chosen.values())
@@ -0,0 +1,202 @@
+"""
+Category Registry for kg-note
+Process-wide, in-memory view of categories.json with write-behind persistence
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+from typing import Dict, List, Optional
+
+from services.categorization_cache import category_set_version
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_FLUSH_DELAY_SECONDS = float(os.getenv("CATEGORY_FLUSH_DELAY_SECONDS", "0.5"))
+CATEGORY_RELOAD_CHECK_SECONDS = float(os.getenv("CATEGORY_RELOAD_CHECK_SECONDS", "1.0"))
+
+
+class CategoryRegistry:
+    def __init__(self, path: str, flush_delay: float = CATEGORY_FLUSH_DELAY_SECONDS):
+        """Load categories once and keep them indexed by lowercase name"""
+        self.path = path
+        self.flush_delay = flush_delay
+        self._lock = threading.RLock()
+        self._categories: List[Dict] = []
+        self._index: Dict[str, int] = {}
+        self._version: Optional[str] = None
+        self._signature: Optional[tuple] = None
+        self._last_mtime_check = 0.0
+        self._dirty = False
+        self._flush_timer: Optional[threading.Timer] = None
+        self._load()
+
+    def _file_signature(self) -> Optional[tuple]:
+        """(mtime_ns, size) of categories.json, or None if it does not exist"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        """Read categories.json from disk, replacing the in-memory copy"""
+        self._signature = self._file_signature()
+        if self._signature is not None:
+            with open(self.path, "r") as f:
+                categories = json.load(f)
+        else:
+            categories = []
+        self._categories = categories
+        self._rebuild_index()
+        logger.info(f"Loaded {len(categories)} categories from {self.path}")
+
+    def _rebuild_index(self):
+        self._index = {}
+        for i, cat in enumerate(self._categories):
+            # Keep the first occurrence so lookups match the old linear scans
+            self._index.setdefault(cat.get("category", "").lower(), i)
+        self._version = None
+
+    def _maybe_reload(self):
+        """Reload if another process changed the file since we last read or wrote it"""
+        now = time.monotonic()
+        if now - self._last_mtime_check < CATEGORY_RELOAD_CHECK_SECONDS:
+            return
+        self._last_mtime_check = now
+        # Unflushed local changes win; they will overwrite the file shortly
+        if self._dirty:
+            return
+        if self._file_signature() != self._signature:
+            logger.info("categories.json changed on disk, reloading")
+            self._load()
+
+    def all(self) -> List[Dict]:
+        """Snapshot of every category, in file order"""
+        with self._lock:
+            self._maybe_reload()
+            return [dict(cat) for cat in self._categories]
+
+    def get(self, name: str) -> Optional[Dict]:
+        """Look up a category by case-insensitive name"""
+        with self._lock:
+            self._maybe_reload()
+            index = self._index.get(name.lower())
+            return dict(self._categories[index]) if index is not None else None
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._maybe_reload()
+            return len(self._categories)
+
+    @property
+    def version(self) -> str:
+        """Fingerprint of the current category set"""
+        with self._lock:
+            self._maybe_reload()
+            if self._version is None:
+                self._version = category_set_version(self._categories)
+            return self._version
+
+    def add(self, category: Dict) -> Dict:
+        """Add a category; raises ValueError if the name is taken"""
+        with self._lock:
+            self._maybe_reload()
+            name = category.get("category", "").lower()
+            if name in self._index:
+                raise ValueError("Category already exists")
+            self._categories.append(dict(category))
+            self._index[name] = len(self._categories) - 1
+            self._mark_dirty()
+            return dict(category)
+
+    def update(self, index: int, category: Dict) -> Dict:
+        """Replace the category at index; raises IndexError or ValueError"""
+        with self._lock:
+            self._maybe_reload()
+            if index < 0 or index >= len(self._categories):
+                raise IndexError("Category not found")
+            name = category.get("category", "").lower()
+            for i, existing in enumerate(self._categories):
+                if i != index and existing.get("category", "").lower() == name:
+                    raise ValueError("Category name already exists")
+            self._categories[index] = dict(category)
+            self._rebuild_index()
+            self._mark_dirty()
+            return dict(category)
+
+    def delete(self, index: int) -> Dict:
+        """Remove the category at index; raises IndexError"""
+        with self._lock:
+            self._maybe_reload()
+            if index < 0 or index >= len(self._categories):
+                raise IndexError("Category not found")
+            deleted = self._categories.pop(index)
+            self._rebuild_index()
+            self._mark_dirty()
+            return deleted
+
+    def merge(self, categories: Optional[List[Dict]]) -> List[Dict]:
+        """Add every category whose name is not yet registered; returns the ones added"""
+        added = []
+        if not categories:
+            return added
+        with self._lock:
+            self._maybe_reload()
+            for category in categories:
+                name = category.get("category", "").lower()
+                if name not in self._index:
+                    self._categories.append(dict(category))
+                    self._index[name] = len(self._categories) - 1
+                    added.append(category)
+                    logger.info(f"Added new category: {category.get('category')}")
+            if added:
+                self._mark_dirty()
+        return added
+
+    def _mark_dirty(self):
+        """Record a change and schedule one coalesced flush"""
+        self._dirty = True
+        self._version = None
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_delay, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        """Atomically write pending changes to disk (temp file + rename)"""
+        with self._lock:
+            self._flush_timer = None
+            if not self._dirty:
+                return
+            snapshot = json.dumps(self._categories, indent=2)
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".categories-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.write(snapshot)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logger.error(f"Failed to write categories to {self.path}: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._signature = self._file_signature()
+            self._dirty = False
+
+    def close(self):
+        """Cancel the pending timer and flush synchronously"""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        self.flush()
@@ -0,0 +1,109 @@
+"""
+Concept extractor for kg-note
+Dictionary-driven concept matching compiled into a single trie-shaped regex
+"""
+
+import json
+import os
+import re
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from services.kg_queue import KG_DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+CONCEPT_DICTIONARY_PATH = os.getenv("CONCEPT_DICTIONARY_PATH", os.path.join(KG_DATA_DIR, "concepts.json"))
+
+# Used when the dictionary file is missing, so extraction never silently stops
+BUILTIN_CONCEPTS = {
+    "docker": {"confidence": 0.9, "terms": ["docker", "container", "dockerfile"]},
+    "api": {"confidence": 0.8, "terms": ["api", "endpoint", "rest"]},
+    "deployment": {"confidence": 0.8, "terms": ["deploy", "deployment", "cloud"]},
+    "database": {"confidence": 0.8, "terms": ["database", "db", "firestore", "sql"]},
+    "authentication": {"confidence": 0.7, "terms": ["auth", "authentication", "login"]},
+    "programming": {"confidence": 0.7, "terms": ["javascript", "js", "python", "code"]},
+}
+
+_DEFAULT_CONFIDENCE = 0.7
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _normalize(term: str) -> str:
+    return _WHITESPACE_RE.sub(" ", term.strip().lower())
+
+
+def _trie_pattern(node: Dict) -> str:
+    """Regex for a character trie; shared prefixes are matched once and longer terms win"""
+    alternatives = [
+        (r"\s+" if char == " " else re.escape(char)) + _trie_pattern(child)
+        for char, child in sorted(node.items()) if char != ""
+    ]
+    if not alternatives:
+        return ""
+    body = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+    if "" in node:
+        # A term ends here but longer terms continue; the greedy optional tries them first
+        body = f"(?:{body})?"
+    return body
+
+
+class ConceptExtractor:
+    def __init__(self, path: Optional[str] = CONCEPT_DICTIONARY_PATH):
+        """Load and compile the concept dictionary at path, or the built-in concepts if it does not exist"""
+        self.path = path
+        self._terms: Dict[str, tuple] = {}      # normalized term -> (concept, confidence)
+        self._matcher: Optional[re.Pattern] = None
+        if path and os.path.exists(path):
+            self.load(path)
+        else:
+            logger.warning(f"Concept dictionary not found at {path}; using {len(BUILTIN_CONCEPTS)} built-in concepts")
+            self.compile(BUILTIN_CONCEPTS)
+
+    def load(self, path: str):
+        """Replace the dictionary with {concept: {"confidence": float, "terms": [...]}} from a JSON file"""
+        with open(path, "r", encoding="utf-8") as f:
+            dictionary = json.load(f)
+        self.compile(dictionary)
+        logger.info(f"Loaded {len(dictionary)} concepts ({len(self._terms)} terms) from {path}")
+
+    def compile(self, dictionary: Dict[str, Dict]):
+        """Build one matcher for every term and synonym in the dictionary"""
+        terms: Dict[str, tuple] = {}
+        trie: Dict = {}
+        for concept, entry in dictionary.items():
+            confidence = float(entry.get("confidence", _DEFAULT_CONFIDENCE))
+            for term in entry.get("terms", []):
+                term = _normalize(term)
+                if not term or term in terms:
+                    continue
+                terms[term] = (concept, confidence)
+                node = trie
+                for char in term:
+                    node = node.setdefault(char, {})
+                node[""] = True
+        matcher = re.compile(rf"\b(?:{_trie_pattern(trie)})\b", re.IGNORECASE) if terms else None
+        # Swap both at once so concurrent readers never see a half-built dictionary
+        self._terms, self._matcher = terms, matcher
+
+    def extract(self, text: str) -> List[Dict]:
+        """Matched concepts with confidence and (start, end) spans, in order of first occurrence"""
+        terms, matcher = self._terms, self._matcher
+        if matcher is None or not text:
+            return []
+        found: Dict[str, Dict] = {}
+        for match in matcher.finditer(text):
+            concept, confidence = terms[_normalize(match.group(0))]
+            entry = found.setdefault(concept, {"concept": concept, "confidence": confidence, "positions": []})
+            entry["positions"].append((match.start(), match.end()))
+        return list(found.values())
+
+    def extract_many(self, texts: Iterable[str]) -> List[List[Dict]]:
+        """extract() over many texts with the same compiled matcher"""
+        return [self.extract(text) for text in texts]
+
+    def stats(self) -> Dict:
+        return {
+            "concepts": len({concept for concept, _ in self._terms.values()}),
+            "terms": len(self._terms)
+        }
@@ -0,0 +1,138 @@
+"""
+Counter buffer for kg-note
+Coalesces counter increments on hot entities in memory and flushes one Increment per entity
+"""
+
+import asyncio
+import os
+import logging
+from collections import Counter
+from typing import Dict, Optional
+
+from google.api_core.exceptions import NotFound
+from google.cloud import firestore
+
+logger = logging.getLogger(__name__)
+
+KG_COUNTER_FLUSH_SECONDS = float(os.getenv("KG_COUNTER_FLUSH_SECONDS", "1.0"))
+
+# Firestore caps a batched write at 500 operations
+_FLUSH_BATCH_SIZE = 500
+
+
+class CounterBuffer:
+    def __init__(self, db, collection: str = "kg_entities", flush_delay: float = KG_COUNTER_FLUSH_SECONDS):
+        """Buffer for db (a Firestore AsyncClient); flush_delay <= 0 means callers should write inline"""
+        self.db = db
+        self.collection = collection
+        self.flush_delay = flush_delay
+        self._pending: Counter = Counter()           # (entity_id, field) -> delta
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.increments = 0
+        self.flushed_writes = 0
+        self.failed_flushes = 0
+        self.dropped_deltas = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.flush_delay > 0
+
+    def add(self, entity_id: str, field: str, delta: int):
+        """Record an increment and schedule one coalesced flush"""
+        self._pending[(entity_id, field)] += delta
+        self.increments += 1
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+
+    def pending(self, entity_id: str, field: str) -> int:
+        """Delta not yet written to Firestore, to add to a value read from it"""
+        return self._pending.get((entity_id, field), 0)
+
+    def snapshot(self) -> Dict:
+        """Every pending delta, keyed by (entity id, field)"""
+        return dict(self._pending)
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_delay)
+        # Let a flush that re-queues failed deltas schedule the next attempt
+        self._flush_task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Counter flush failed: {e}")
+
+    def _update(self, fields: Dict[str, int]) -> Dict:
+        update = {field: firestore.Increment(delta) for field, delta in fields.items()}
+        update["updated"] = firestore.SERVER_TIMESTAMP
+        return update
+
+    def _requeue(self, entity_id: str, fields: Dict[str, int]):
+        for field, delta in fields.items():
+            self._pending[(entity_id, field)] += delta
+
+    async def _flush_each(self, chunk) -> int:
+        """Retry a failed batch one entity at a time: deleted entities lose their deltas, other failures re-queue"""
+        async def write(entity_id: str, fields: Dict[str, int]) -> int:
+            try:
+                await self.db.collection(self.collection).document(entity_id).update(self._update(fields))
+                return 1
+            except NotFound:
+                self.dropped_deltas += len(fields)
+                logger.warning(f"Dropped counter deltas for deleted entity {entity_id}")
+            except Exception as e:
+                logger.error(f"Failed to flush counters of {entity_id}, will retry: {e}")
+                self._requeue(entity_id, fields)
+            return 0
+
+        return sum(await asyncio.gather(*[write(entity_id, fields) for entity_id, fields in chunk]))
+
+    async def flush(self) -> int:
+        """Write every pending delta as one Increment per entity; failed batches are retried per entity"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, Counter()
+
+            by_entity: Dict[str, Dict[str, int]] = {}
+            for (entity_id, field), delta in pending.items():
+                if delta:
+                    by_entity.setdefault(entity_id, {})[field] = delta
+            items = list(by_entity.items())
+
+            written = 0
+            for i in range(0, len(items), _FLUSH_BATCH_SIZE):
+                chunk = items[i:i + _FLUSH_BATCH_SIZE]
+                batch = self.db.batch()
+                for entity_id, fields in chunk:
+                    batch.update(self.db.collection(self.collection).document(entity_id), self._update(fields))
+                try:
+                    await batch.commit()
+                    written += len(chunk)
+                except Exception as e:
+                    # One deleted entity fails the whole batch; find it instead of re-queueing everything forever
+                    self.failed_flushes += 1
+                    logger.error(f"Failed to flush {len(chunk)} counters as a batch, retrying per entity: {e}")
+                    written += await self._flush_each(chunk)
+
+            self.flushed_writes += written
+        if self._pending and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+        return written
+
+    async def close(self):
+        """Write everything still pending, then cancel the scheduled flush"""
+        await self.flush()
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        self._flush_task = None
+
+    def stats(self) -> Dict:
+        return {
+            "pending_entities": len({entity_id for entity_id, _ in self._pending}),
+            "increments": self.increments,
+            "flushed_writes": self.flushed_writes,
+            "failed_flushes": self.failed_flushes,
+            "dropped_deltas": self.dropped_deltas,
+            "flush_delay_seconds": self.flush_delay
+        }
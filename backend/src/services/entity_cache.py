@@ -0,0 +1,103 @@
+"""
+Entity cache for kg-note
+Process-wide LRU with TTL over kg_entities documents, kept current by the service's own writes
+"""
+
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+KG_ENTITY_CACHE_SIZE = int(os.getenv("KG_ENTITY_CACHE_SIZE", "10000"))
+KG_ENTITY_CACHE_TTL_SECONDS = float(os.getenv("KG_ENTITY_CACHE_TTL_SECONDS", "300"))
+
+# Marker for entities known to exist whose latest body we do not hold (e.g. after an Increment)
+_EXISTS = object()
+
+
+class EntityCache:
+    def __init__(self, max_entries: int = KG_ENTITY_CACHE_SIZE, ttl_seconds: float = KG_ENTITY_CACHE_TTL_SECONDS):
+        """Empty cache; max_entries <= 0 disables it"""
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, object]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.exists_hits = 0
+        self.evictions = 0
+
+    def _lookup(self, entity_id: str):
+        entry = self._entries.get(entity_id)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[entity_id]
+            return None
+        self._entries.move_to_end(entity_id)
+        return value
+
+    def get(self, entity_id: str) -> Optional[Dict]:
+        """Cached entity document, or None when absent, expired or only known to exist"""
+        value = self._lookup(entity_id)
+        if value is None or value is _EXISTS:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(value)
+
+    def get_many(self, entity_ids: Iterable[str]) -> Tuple[Dict[str, Dict], List[str]]:
+        """Split ids into (cached documents by id, ids that must be read from Firestore)"""
+        found, missing = {}, []
+        for entity_id in dict.fromkeys(entity_ids):
+            doc = self.get(entity_id)
+            if doc is None:
+                missing.append(entity_id)
+            else:
+                found[entity_id] = doc
+        return found, missing
+
+    def known_to_exist(self, entity_id: str) -> bool:
+        """True when the entity was seen in Firestore or written by this process within the TTL"""
+        if self._lookup(entity_id) is None:
+            return False
+        self.exists_hits += 1
+        return True
+
+    def put(self, entity_id: str, doc: Dict):
+        """Remember a document as read from, or just written to, Firestore"""
+        self._remember(entity_id, dict(doc))
+
+    def mark_exists(self, entity_id: str):
+        """Remember that an entity exists, dropping any body that a field transform has made stale"""
+        self._remember(entity_id, _EXISTS)
+
+    def invalidate(self, entity_id: str):
+        self._entries.pop(entity_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _remember(self, entity_id: str, value: object):
+        if self.max_entries <= 0:
+            return
+        self._entries[entity_id] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(entity_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and size"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "exists_hits": self.exists_hits,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,191 @@
+"""
+Entity search index for kg-note
+BM25 inverted index over entity names, observations and note content, with prefix matching
+"""
+
+import bisect
+import json
+import math
+import os
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from services.category_index import tokenize
+from services.kg_queue import KG_DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+KG_SEARCH_INDEX_PATH = os.getenv("KG_SEARCH_INDEX_PATH", os.path.join(KG_DATA_DIR, "kg_search_index.json"))
+KG_SEARCH_MAX_PREFIX_TERMS = int(os.getenv("KG_SEARCH_MAX_PREFIX_TERMS", "20"))
+
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+# Names are short and precise, so their terms count more than observation or content terms
+_NAME_WEIGHT = 3
+# A term that only starts with a query token scores less than an exact match
+_PREFIX_WEIGHT = 0.5
+_SNAPSHOT_VERSION = 1
+
+
+def entity_terms(entity: Dict) -> Counter:
+    """Weighted term counts for an entity document"""
+    terms = Counter(tokenize(" ".join(entity.get("observations") or [])))
+    data = entity.get("data") or {}
+    if entity.get("type") == "note":
+        terms.update(tokenize(data.get("content", "")))
+    for token in tokenize(entity.get("name") or ""):
+        terms[token] += _NAME_WEIGHT
+    return terms
+
+
+class EntitySearchIndex:
+    def __init__(self, path: str = KG_SEARCH_INDEX_PATH):
+        """Empty index; load() a snapshot or index() entities to populate"""
+        self.path = path
+        self._docs: Dict[str, Counter] = {}
+        self._types: Dict[str, str] = {}
+        self._lengths: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._vocabulary: List[str] = []        # sorted, for prefix lookups
+        self._total_length = 0
+        self.ready = False
+        # Time of the last full read from Firestore; other processes' writes after it may be missing
+        self.synced_at: Optional[float] = None
+        self.changes_since_save = 0
+
+    def index(self, entity_id: str, entity: Dict):
+        """Index or re-index one entity document"""
+        self._put(entity_id, entity.get("type", ""), entity_terms(entity))
+
+    def index_many(self, entities: Iterable[Tuple[str, Dict]]):
+        """Index many (entity id, document) pairs, sorting the vocabulary once at the end"""
+        for entity_id, entity in entities:
+            self._put(entity_id, entity.get("type", ""), entity_terms(entity), keep_sorted=False)
+        self._vocabulary = sorted(self._postings)
+
+    def _put(self, entity_id: str, entity_type: str, terms: Counter, keep_sorted: bool = True):
+        if self._docs.get(entity_id) == terms and self._types.get(entity_id) == entity_type:
+            return
+        self.remove(entity_id)
+        self._docs[entity_id] = terms
+        self._types[entity_id] = entity_type
+        self._lengths[entity_id] = sum(terms.values())
+        self._total_length += self._lengths[entity_id]
+        for term, count in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if keep_sorted:
+                    bisect.insort(self._vocabulary, term)
+            postings[entity_id] = count
+        self.changes_since_save += 1
+
+    def remove(self, entity_id: str):
+        """Drop one entity from the index"""
+        terms = self._docs.pop(entity_id, None)
+        if terms is None:
+            return
+        self._types.pop(entity_id, None)
+        self._total_length -= self._lengths.pop(entity_id, 0)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(entity_id, None)
+                if not postings:
+                    del self._postings[term]
+                    i = bisect.bisect_left(self._vocabulary, term)
+                    if i < len(self._vocabulary) and self._vocabulary[i] == term:
+                        self._vocabulary.pop(i)
+        self.changes_since_save += 1
+
+    def _expand(self, token: str, prefix: bool) -> List[Tuple[str, float]]:
+        """The token itself plus, if prefix, vocabulary terms it is a prefix of, with their weights"""
+        expanded = [(token, 1.0)] if token in self._postings else []
+        if not prefix:
+            return expanded
+        i = bisect.bisect_right(self._vocabulary, token)
+        while i < len(self._vocabulary) and len(expanded) < KG_SEARCH_MAX_PREFIX_TERMS:
+            term = self._vocabulary[i]
+            if not term.startswith(token):
+                break
+            expanded.append((term, _PREFIX_WEIGHT))
+            i += 1
+        return expanded
+
+    def search(self, query: str, entity_types: Optional[Iterable[str]] = None, limit: int = 20) -> List[Tuple[str, float]]:
+        """(entity id, BM25 score) pairs for the best matches, optionally restricted to some types
+
+        The last query token also matches terms it is a prefix of, so partially typed queries work.
+        """
+        n_docs = len(self._docs)
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not n_docs or not tokens:
+            return []
+        types = set(entity_types) if entity_types else None
+        avg_length = self._total_length / n_docs
+        scores: Dict[str, float] = {}
+        for position, token in enumerate(tokens):
+            # Best weight per matched document, so a token expanding to many terms counts once
+            token_scores: Dict[str, float] = {}
+            for term, weight in self._expand(token, position == len(tokens) - 1):
+                postings = self._postings[term]
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for entity_id, tf in postings.items():
+                    if types is not None and self._types.get(entity_id) not in types:
+                        continue
+                    norm = tf + _K1 * (1 - _B + _B * self._lengths[entity_id] / avg_length)
+                    score = weight * idf * tf * (_K1 + 1) / norm
+                    if score > token_scores.get(entity_id, 0.0):
+                        token_scores[entity_id] = score
+            for entity_id, score in token_scores.items():
+                scores[entity_id] = scores.get(entity_id, 0.0) + score
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    def save(self):
+        """Snapshot the index to disk (temp file + rename)"""
+        if not self.path:
+            return
+        # Documents are replaced, never mutated, so shallow copies are a consistent snapshot
+        docs, types = dict(self._docs), dict(self._types)
+        state = {
+            "version": _SNAPSHOT_VERSION,
+            "synced_at": self.synced_at,
+            "docs": {entity_id: [types.get(entity_id, ""), terms] for entity_id, terms in docs.items()}
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        self.changes_since_save = 0
+
+    def load(self) -> bool:
+        """Load the snapshot at path; returns False when there is none or it is unreadable"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load search index from {self.path}: {e}")
+            return False
+        if state.get("version") != _SNAPSHOT_VERSION:
+            return False
+        for entity_id, (entity_type, terms) in state.get("docs", {}).items():
+            self._put(entity_id, entity_type, Counter(terms), keep_sorted=False)
+        self._vocabulary = sorted(self._postings)
+        self.synced_at = state.get("synced_at")
+        self.changes_since_save = 0
+        logger.info(f"Loaded search index with {len(self._docs)} entities from {self.path}")
+        return True
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "entities": len(self._docs),
+            "terms": len(self._postings),
+            "synced_at": self.synced_at,
+            "changes_since_save": self.changes_since_save
+        }
@@ -0,0 +1,323 @@
+"""
+Graph analytics for kg-note
+Weighted PageRank, connected components and Louvain-style communities over a SciPy sparse adjacency
+"""
+
+import asyncio
+import os
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+logger = logging.getLogger(__name__)
+
+KG_ANALYTICS_REFRESH_SECONDS = float(os.getenv("KG_ANALYTICS_REFRESH_SECONDS", "3600"))
+KG_PAGERANK_DAMPING = float(os.getenv("KG_PAGERANK_DAMPING", "0.85"))
+# Incremental refreshes rewrite an entity only when its PageRank moved by more than this fraction
+KG_ANALYTICS_WRITE_THRESHOLD = float(os.getenv("KG_ANALYTICS_WRITE_THRESHOLD", "0.05"))
+
+_PAGERANK_TOLERANCE = 1e-6
+_PAGERANK_MAX_ITERATIONS = 100
+_LOUVAIN_MAX_PASSES = 30
+_LOUVAIN_MAX_LEVELS = 10
+_LOUVAIN_MAX_ROUNDS = 4
+_MIN_ROUND_GAIN = 1e-4
+_MIN_GAIN = 1e-12
+_MIN_Q_GAIN = 1e-6
+# Nodes are moved in this many random batches per pass
+_LOUVAIN_BATCHES = 8
+
+# Entity id prefix -> entity type (see KnowledgeGraphService._generate_entity_id)
+_ID_PREFIX_TYPES = {"note": "note", "url": "url_context", "category": "category", "concept": "concept", "domain": "domain"}
+
+
+def entity_type_of(entity_id: str) -> str:
+    return _ID_PREFIX_TYPES.get(entity_id.split("-", 1)[0], "unknown")
+
+
+def pagerank(n: int, src: np.ndarray, dst: np.ndarray, weights: np.ndarray, damping: float = KG_PAGERANK_DAMPING,
+             start: Optional[np.ndarray] = None) -> Tuple[np.ndarray, int]:
+    """Weighted PageRank by power iteration; rank from dangling nodes is spread uniformly"""
+    if n == 0:
+        return np.zeros(0), 0
+    out_weight = np.bincount(src, weights=weights, minlength=n)
+    transition = sp.csr_matrix((weights / out_weight[src], (dst, src)), shape=(n, n))
+    dangling = out_weight == 0
+    rank = np.full(n, 1.0 / n) if start is None else start / start.sum()
+    for iteration in range(1, _PAGERANK_MAX_ITERATIONS + 1):
+        updated = damping * (transition @ rank) + (damping * rank[dangling].sum() + 1.0 - damping) / n
+        error = np.abs(updated - rank).sum()
+        rank = updated
+        if error < _PAGERANK_TOLERANCE:
+            break
+    return rank, iteration
+
+
+def modularity(adjacency: sp.csr_matrix, labels: np.ndarray) -> float:
+    """Newman modularity of a labelling of an undirected weighted graph"""
+    degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+    total = degrees.sum()
+    if total == 0:
+        return 0.0
+    coo = adjacency.tocoo()
+    internal = coo.data[labels[coo.row] == labels[coo.col]].sum()
+    community_degrees = np.bincount(labels, weights=degrees)
+    return float(internal / total - np.square(community_degrees / total).sum())
+
+
+def _local_moving(adjacency: sp.csr_matrix, labels: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Move nodes to the neighbouring community with the best modularity gain, a random batch at a time
+
+    Every node in a batch moves at once against the community totals left by the previous batch, so
+    a pass costs a few vectorized sweeps instead of one Python step per node.
+    """
+    n = adjacency.shape[0]
+    degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+    total = degrees.sum()
+    if total == 0:
+        return labels
+    self_loops = adjacency.diagonal()
+    labels = labels.copy()
+    community_degrees = np.bincount(labels, weights=degrees, minlength=n)
+    q = modularity(adjacency, labels)
+    for _ in range(_LOUVAIN_MAX_PASSES):
+        moved = 0
+        for batch in np.array_split(rng.permutation(n), _LOUVAIN_BATCHES):
+            block = adjacency[batch].tocoo()
+            # Weight from each batch node to each neighbouring community
+            weights = sp.csr_matrix((block.data, (block.row, labels[block.col])), shape=(len(batch), n))
+            weights.sum_duplicates()
+            row_lengths = np.diff(weights.indptr)
+            rows = np.repeat(np.arange(len(batch)), row_lengths)
+            nodes = batch[rows]
+            cols, data = weights.indices, weights.data
+            own = cols == labels[nodes]
+            # Gain of joining a community, with the node itself taken out of its current one
+            gain = data - own * self_loops[nodes] - degrees[nodes] * (community_degrees[cols] - own * degrees[nodes]) / total
+            stay = -degrees[batch] * (community_degrees[labels[batch]] - degrees[batch]) / total
+            stay[rows[own]] = gain[own]
+
+            # Best community per node: first entry of each row that reaches the row maximum
+            candidates = np.nonzero(row_lengths)[0]
+            if not len(candidates):
+                continue
+            best_gain = np.maximum.reduceat(gain, weights.indptr[candidates])
+            positions = np.flatnonzero(gain >= np.repeat(best_gain, row_lengths[candidates]))
+            first = positions[np.r_[True, rows[positions[1:]] != rows[positions[:-1]]]]
+            targets = cols[first]
+            current = labels[batch[candidates]]
+            movers = (best_gain > stay[candidates] + _MIN_GAIN) & (targets != current)
+            # Two singletons joining each other would just swap; only the higher label moves
+            sizes = np.bincount(labels, minlength=n)
+            movers &= ~((sizes[current] == 1) & (sizes[targets] == 1) & (targets > current))
+            if not movers.any():
+                continue
+            moving, targets = batch[candidates[movers]], targets[movers]
+            np.subtract.at(community_degrees, labels[moving], degrees[moving])
+            np.add.at(community_degrees, targets, degrees[moving])
+            labels[moving] = targets
+            moved += len(moving)
+        previous_q, q = q, modularity(adjacency, labels)
+        if not moved or q - previous_q < _MIN_Q_GAIN:
+            break
+    return labels
+
+
+def _relabel(labels: np.ndarray) -> np.ndarray:
+    """Dense labels 0..k-1, largest group first"""
+    _, inverse, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+    rank = np.empty(len(sizes), dtype=np.int64)
+    rank[np.argsort(-sizes, kind="stable")] = np.arange(len(sizes))
+    return rank[inverse]
+
+
+def louvain(adjacency: sp.csr_matrix, start: Optional[np.ndarray] = None, seed: int = 0) -> Tuple[np.ndarray, float]:
+    """Multi-level modularity communities (local moving, then aggregate each community into a node)
+
+    Levels are rerun from the result while modularity improves, so nodes placed badly early on can move.
+    """
+    rng = np.random.default_rng(seed)
+    n = adjacency.shape[0]
+    labels = np.arange(n) if start is None else _relabel(start)
+    q = modularity(adjacency, labels)
+    for _ in range(_LOUVAIN_MAX_ROUNDS):
+        # membership maps original nodes to nodes of the current (aggregated) graph
+        membership = np.arange(n)
+        graph = adjacency
+        level_start = labels
+        for _ in range(_LOUVAIN_MAX_LEVELS):
+            level_labels = _relabel(_local_moving(graph, level_start, rng))
+            membership = level_labels[membership]
+            n_communities = level_labels.max() + 1 if len(level_labels) else 0
+            if n_communities == graph.shape[0]:
+                break
+            aggregate = sp.csr_matrix((np.ones(graph.shape[0]), (np.arange(graph.shape[0]), level_labels)),
+                                      shape=(graph.shape[0], n_communities))
+            graph = (aggregate.T @ graph @ aggregate).tocsr()
+            level_start = np.arange(n_communities)
+        round_q = modularity(adjacency, membership)
+        if round_q <= q + _MIN_ROUND_GAIN:
+            if round_q > q:
+                labels, q = membership, round_q
+            break
+        labels, q = membership, round_q
+    return _relabel(labels), q
+
+
+class GraphAnalytics:
+    def __init__(self):
+        """Empty results; compute() fills them from edge arrays"""
+        self.ids: List[str] = []
+        self._nodes: Dict[str, int] = {}
+        self.pagerank = np.zeros(0)
+        self.components = np.zeros(0, dtype=np.int64)
+        self.communities = np.zeros(0, dtype=np.int64)
+        self.modularity = 0.0
+        self.ready = False
+        self.computed_at: Optional[float] = None
+        # Values last written to Firestore, so incremental refreshes only rewrite what changed
+        self._written: Dict[str, Tuple[float, int, int]] = {}
+        self.last_run: Dict = {}
+
+    def compute(self, ids: List[str], src: np.ndarray, dst: np.ndarray, weights: np.ndarray,
+                incremental: bool = False) -> Dict:
+        """Run every analysis; incremental warm-starts PageRank and communities from the previous run"""
+        started = time.time()
+        n = len(ids)
+        weights = np.maximum(weights.astype(np.float64), 1e-6)
+        rank_start = community_start = None
+        if incremental and self.ready:
+            previous = np.array([self._nodes.get(entity_id, -1) for entity_id in ids], dtype=np.int64)
+            known = previous >= 0
+            rank_start = np.full(n, 1.0 / max(n, 1))
+            rank_start[known] = self.pagerank[previous[known]]
+            # New nodes start as their own communities
+            community_start = np.arange(n) + (self.communities.max() + 1 if len(self.communities) else 0)
+            community_start[known] = self.communities[previous[known]]
+
+        rank, iterations = pagerank(n, src, dst, weights, start=rank_start)
+        loops = src == dst
+        undirected = sp.csr_matrix((weights[~loops], (src[~loops], dst[~loops])), shape=(n, n))
+        undirected = (undirected + undirected.T).tocsr()
+        n_components, components = connected_components(undirected, directed=False)
+        communities, q = louvain(undirected, community_start)
+
+        self.ids = list(ids)
+        self._nodes = {entity_id: i for i, entity_id in enumerate(self.ids)}
+        self.pagerank, self.components, self.communities, self.modularity = rank, _relabel(components), communities, q
+        self.ready = True
+        self.computed_at = time.time()
+        self.last_run = {
+            "nodes": n,
+            "edges": int(len(src)),
+            "incremental": bool(rank_start is not None),
+            "pagerank_iterations": iterations,
+            "components": int(n_components),
+            "communities": int(communities.max() + 1) if n else 0,
+            "modularity": round(q, 4),
+            "seconds": round(self.computed_at - started, 3)
+        }
+        logger.info(f"Graph analytics computed: {self.last_run}")
+        return self.last_run
+
+    def entity_results(self, entity_id: str) -> Optional[Dict]:
+        node = self._nodes.get(entity_id)
+        if node is None:
+            return None
+        return {
+            "pagerank": float(self.pagerank[node]),
+            "component": int(self.components[node]),
+            "community": int(self.communities[node])
+        }
+
+    def changed(self, full: bool = False) -> List[Tuple[str, Dict]]:
+        """(entity id, analytics fields) to write back: all of them, or those that moved since the last write"""
+        percentiles = self._percentiles()
+        changes = []
+        for node, entity_id in enumerate(self.ids):
+            rank, component, community = float(self.pagerank[node]), int(self.components[node]), int(self.communities[node])
+            previous = self._written.get(entity_id)
+            if not full and previous is not None and previous[1:] == (component, community) \
+                    and abs(rank - previous[0]) <= KG_ANALYTICS_WRITE_THRESHOLD * previous[0]:
+                continue
+            changes.append((entity_id, {
+                "pagerank": rank,
+                "pagerank_percentile": percentiles[node],
+                "component": component,
+                "community": community,
+                "computed_at": self.computed_at
+            }))
+        return changes
+
+    def _percentiles(self) -> List[float]:
+        order = np.argsort(self.pagerank, kind="stable")
+        percentiles = np.empty(len(order))
+        percentiles[order] = np.arange(len(order)) / max(len(order) - 1, 1)
+        return np.round(percentiles, 4).tolist()
+
+    @property
+    def has_written(self) -> bool:
+        return bool(self._written)
+
+    def mark_written(self, changes: List[Tuple[str, Dict]]):
+        for entity_id, fields in changes:
+            self._written[entity_id] = (fields["pagerank"], fields["component"], fields["community"])
+
+    def top(self, limit: int = 20, entity_types: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """Highest-PageRank entities, optionally of some types"""
+        order = np.argsort(-self.pagerank, kind="stable")
+        types = set(entity_types) if entity_types else None
+        result = []
+        for node in order:
+            entity_id = self.ids[node]
+            if types is None or entity_type_of(entity_id) in types:
+                result.append((entity_id, float(self.pagerank[node])))
+                if len(result) >= limit:
+                    break
+        return result
+
+    def community_summaries(self, limit: int = 20, members: int = 5) -> List[Dict]:
+        """Largest communities with their size, type mix and highest-PageRank members"""
+        if not self.ready or not len(self.communities):
+            return []
+        summaries = []
+        sizes = np.bincount(self.communities)
+        for community in np.argsort(-sizes, kind="stable")[:limit]:
+            nodes = np.nonzero(self.communities == community)[0]
+            ranked = nodes[np.argsort(-self.pagerank[nodes], kind="stable")]
+            type_counts: Dict[str, int] = {}
+            for node in nodes:
+                entity_type = entity_type_of(self.ids[node])
+                type_counts[entity_type] = type_counts.get(entity_type, 0) + 1
+            summaries.append({
+                "community": int(community),
+                "size": int(sizes[community]),
+                "types": type_counts,
+                "top_members": [{"id": self.ids[node], "pagerank": float(self.pagerank[node])} for node in ranked[:members]]
+            })
+        return summaries
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "computed_at": self.computed_at,
+            "written_entities": len(self._written),
+            "last_run": self.last_run
+        }
+
+
+async def _run_standalone_refresh():
+    """Recompute analytics and write every entity's results from a separate process"""
+    from services.knowledge_graph import KnowledgeGraphService
+
+    kg_service = KnowledgeGraphService()
+    await kg_service.refresh_analytics(full=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run_standalone_refresh())
@@ -0,0 +1,340 @@
+"""
+Graph index for kg-note
+In-process adjacency of kg_relationships in CSR arrays, kept current by the service's writes
+"""
+
+import heapq
+import itertools
+import os
+import time
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+KG_GRAPH_INDEX_ENABLED = os.getenv("KG_GRAPH_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+# Fold pending edges into the CSR arrays once there are this many, or 10% of the base, whichever is larger
+KG_GRAPH_INDEX_COMPACT_EDGES = int(os.getenv("KG_GRAPH_INDEX_COMPACT_EDGES", "1024"))
+# Upper bound on nodes a single traversal may settle, so latency stays bounded on large graphs
+KG_TRAVERSAL_MAX_VISITED = int(os.getenv("KG_TRAVERSAL_MAX_VISITED", "5000"))
+
+# Strength floor when turning strengths into path costs (cost = 1 / strength)
+_MIN_STRENGTH = 1e-3
+
+
+class _CSR:
+    """One direction of adjacency: row i's edges are indices[indptr[i]:indptr[i + 1]]"""
+
+    def __init__(self, n_nodes: int, rows: np.ndarray, cols: np.ndarray, types: np.ndarray, strengths: np.ndarray):
+        order = np.argsort(rows, kind="stable")
+        self.indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_nodes), out=self.indptr[1:])
+        self.indices = cols[order].astype(np.int32)
+        self.types = types[order].astype(np.uint8)
+        self.strengths = strengths[order].astype(np.float32)
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.indptr) - 1
+
+    def row(self, node: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if node >= self.n_rows:
+            empty = np.empty(0, dtype=np.int32)
+            return empty, empty.astype(np.uint8), empty.astype(np.float32)
+        start, end = self.indptr[node], self.indptr[node + 1]
+        return self.indices[start:end], self.types[start:end], self.strengths[start:end]
+
+
+class GraphIndex:
+    def __init__(self, compact_threshold: int = KG_GRAPH_INDEX_COMPACT_EDGES):
+        """Empty index; call build() with the stored relationships before serving reads"""
+        self.compact_threshold = compact_threshold
+        self._ids: List[str] = []                 # node number -> entity id
+        self._nodes: Dict[str, int] = {}          # entity id -> node number
+        self._type_names: List[str] = []
+        self._type_codes: Dict[str, int] = {}
+        empty = np.empty(0, dtype=np.int32)
+        self._out = _CSR(0, empty, empty, empty, empty.astype(np.float32))
+        self._in = _CSR(0, empty, empty, empty, empty.astype(np.float32))
+        self._n_base_edges = 0
+        # Edges written since the last compaction, keyed (from, type, to) -> strength
+        self._pending: Dict[Tuple[int, int, int], float] = {}
+        self._pending_out: Dict[int, List[Tuple[int, int]]] = {}
+        self._pending_in: Dict[int, List[Tuple[int, int]]] = {}
+        # Edges deleted since the last build, as (from id, type, to id); a build may still read them
+        self._removed: set = set()
+        self._unapplied_removals = False
+        self.ready = False
+        self.built_at: Optional[float] = None
+        self.compactions = 0
+
+    def _node(self, entity_id: str) -> int:
+        node = self._nodes.get(entity_id)
+        if node is None:
+            node = len(self._ids)
+            self._nodes[entity_id] = node
+            self._ids.append(entity_id)
+        return node
+
+    def _type(self, rel_type: str) -> int:
+        code = self._type_codes.get(rel_type)
+        if code is None:
+            code = len(self._type_names)
+            if code > 255:
+                raise ValueError("Graph index supports at most 256 relationship types")
+            self._type_codes[rel_type] = code
+            self._type_names.append(rel_type)
+        return code
+
+    def build(self, relationships: Iterable[Dict]):
+        """Replace the base arrays with the given relationships plus any edges written meanwhile
+
+        Edges removed meanwhile are left out, and nodes are renumbered so ones no edge touches are dropped.
+        """
+        started = time.time()
+        # Writes that landed while relationships were streaming are newer than what was read
+        pending = [(self._ids[from_node], self._type_names[code], self._ids[to_node], strength)
+                   for (from_node, code, to_node), strength in self._pending.items()]
+        removed, self._removed = self._removed, set()
+        self._ids, self._nodes = [], {}
+        src, types, dst, strengths = [], [], [], []
+        edges = ((rel["from_id"], rel["type"], rel["to_id"], rel.get("strength", 1.0)) for rel in relationships
+                 if rel.get("from_id") and rel.get("to_id") and rel.get("type"))
+        for from_id, rel_type, to_id, strength in itertools.chain(edges, pending):
+            if (from_id, rel_type, to_id) in removed:
+                continue
+            src.append(self._node(from_id))
+            types.append(self._type(rel_type))
+            dst.append(self._node(to_id))
+            strengths.append(float(strength))
+        src, types, dst = (np.array(values, dtype=np.int64) for values in (src, types, dst))
+        strengths = np.array(strengths, dtype=np.float32)
+        # Keep the last occurrence of each (from, type, to)
+        keys = (src * 256 + types) * max(len(self._ids), 1) + dst
+        _, last = np.unique(keys[::-1], return_index=True)
+        keep = np.sort(len(keys) - 1 - last)
+        self._rebuild(src[keep], types[keep], dst[keep], strengths[keep])
+        self.ready = True
+        self.built_at = time.time()
+        logger.info(f"Graph index built: {len(self._ids)} nodes, {self._n_base_edges} edges in {time.time() - started:.2f}s")
+
+    def _rebuild(self, src: np.ndarray, types: np.ndarray, dst: np.ndarray, strengths: np.ndarray):
+        n_nodes = len(self._ids)
+        self._out = _CSR(n_nodes, src, dst, types, strengths)
+        self._in = _CSR(n_nodes, dst, src, types, strengths)
+        self._n_base_edges = len(src)
+        self._unapplied_removals = False
+        self._pending.clear()
+        self._pending_out.clear()
+        self._pending_in.clear()
+
+    def upsert(self, from_id: str, to_id: str, rel_type: str, strength: float = 1.0):
+        """Add an edge, or update the strength of an existing one"""
+        src, code, dst = self._node(from_id), self._type(rel_type), self._node(to_id)
+        strength = float(strength)
+        if self._removed:
+            self._removed.discard((from_id, rel_type, to_id))
+
+        # Existing base edge: update both directions in place
+        indices, types, _ = self._out.row(src)
+        hits = np.nonzero((indices == dst) & (types == code))[0]
+        if len(hits):
+            self._out.strengths[self._out.indptr[src] + hits[0]] = strength
+            indices, types, _ = self._in.row(dst)
+            back = np.nonzero((indices == src) & (types == code))[0]
+            self._in.strengths[self._in.indptr[dst] + back[0]] = strength
+            return
+
+        key = (src, code, dst)
+        if key not in self._pending:
+            self._pending_out.setdefault(src, []).append((dst, code))
+            self._pending_in.setdefault(dst, []).append((src, code))
+        self._pending[key] = strength
+        if len(self._pending) >= max(self.compact_threshold, self._n_base_edges // 10):
+            self.compact()
+
+    def upsert_many(self, relationships: Iterable[Dict]):
+        for rel in relationships:
+            if rel.get("from_id") and rel.get("to_id") and rel.get("type"):
+                self.upsert(rel["from_id"], rel["to_id"], rel["type"], rel.get("strength", 1.0))
+
+    def remove(self, from_id: str, to_id: str, rel_type: str):
+        """Drop a deleted edge: pending edges at once, base edges at the next compact() or build()"""
+        self._removed.add((from_id, rel_type, to_id))
+        self._unapplied_removals = True
+        src, code, dst = self._nodes.get(from_id), self._type_codes.get(rel_type), self._nodes.get(to_id)
+        if src is None or code is None or dst is None:
+            return
+        if self._pending.pop((src, code, dst), None) is not None:
+            self._pending_out[src].remove((dst, code))
+            self._pending_in[dst].remove((src, code))
+
+    def _live_base_edges(self) -> np.ndarray:
+        """Mask over the base edges (in out-row order) that are still live"""
+        out = self._out
+        keep = np.ones(len(out.indices), dtype=bool)
+        for from_id, rel_type, to_id in self._removed:
+            src, code, dst = self._nodes.get(from_id), self._type_codes.get(rel_type), self._nodes.get(to_id)
+            if src is None or code is None or dst is None or src >= out.n_rows:
+                continue
+            indices, types, _ = out.row(src)
+            keep[out.indptr[src] + np.nonzero((indices == dst) & (types == code))[0]] = False
+        return keep
+
+    def compact(self):
+        """Fold pending edges into fresh CSR arrays and drop removed ones (pending edges never duplicate base ones)"""
+        if not self._pending and not self._unapplied_removals:
+            return
+        out = self._out
+        keep = self._live_base_edges()
+        base_src = np.repeat(np.arange(out.n_rows, dtype=np.int64), np.diff(out.indptr))[keep]
+        pending = np.array(list(self._pending.keys()), dtype=np.int64).reshape(-1, 3)
+        self._rebuild(
+            np.concatenate([base_src, pending[:, 0]]),
+            np.concatenate([out.types.astype(np.int64)[keep], pending[:, 1]]),
+            np.concatenate([out.indices.astype(np.int64)[keep], pending[:, 2]]),
+            np.concatenate([out.strengths[keep],
+                            np.fromiter(self._pending.values(), dtype=np.float32, count=len(self._pending))])
+        )
+        self.compactions += 1
+
+    def has_node(self, entity_id: str) -> bool:
+        return entity_id in self._nodes
+
+    def neighbors(self, entity_id: str, direction: str = "out", types: Optional[Iterable[str]] = None) -> List[Tuple[str, str, float]]:
+        """(neighbor id, relationship type, strength) for edges out of, into ("in") or around ("both") a node"""
+        node = self._nodes.get(entity_id)
+        if node is None:
+            return []
+        codes = None
+        if types is not None:
+            codes = {self._type_codes[t] for t in types if t in self._type_codes}
+            if not codes:
+                return []
+
+        sides = []
+        if direction in ("out", "both"):
+            sides.append((self._out, self._pending_out, True))
+        if direction in ("in", "both"):
+            sides.append((self._in, self._pending_in, False))
+
+        result = []
+        for csr, pending, outgoing in sides:
+            indices, type_codes, strengths = csr.row(node)
+            for other, code, strength in zip(indices.tolist(), type_codes.tolist(), strengths.tolist()):
+                if codes is None or code in codes:
+                    result.append((self._ids[other], self._type_names[code], strength))
+            for other, code in pending.get(node, []):
+                if codes is None or code in codes:
+                    key = (node, code, other) if outgoing else (other, code, node)
+                    result.append((self._ids[other], self._type_names[code], self._pending[key]))
+        return result
+
+    def incident_edges(self, entity_id: str, types: Optional[Iterable[str]] = None) -> List[Tuple[str, str, str, float]]:
+        """(from id, to id, type, strength) for every edge touching a node, in either direction"""
+        edges = [(entity_id, other, rel_type, strength) for other, rel_type, strength in self.neighbors(entity_id, "out", types)]
+        edges.extend((other, entity_id, rel_type, strength) for other, rel_type, strength in self.neighbors(entity_id, "in", types))
+        return edges
+
+    def shortest_path(self, from_id: str, to_id: str, types: Optional[Iterable[str]] = None,
+                      max_visited: int = KG_TRAVERSAL_MAX_VISITED) -> Dict:
+        """Dijkstra over edges in either direction with cost 1/strength, settling at most max_visited nodes"""
+        result = {"found": False, "cost": None, "nodes": [], "edges": [], "visited": 0, "truncated": False}
+        if from_id not in self._nodes or to_id not in self._nodes:
+            return result
+        types = list(types) if types is not None else None
+
+        dist = {from_id: 0.0}
+        previous: Dict[str, Tuple[str, Tuple[str, str, str, float]]] = {}
+        settled = set()
+        heap = [(0.0, from_id)]
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            if node == to_id:
+                break
+            if len(settled) >= max_visited:
+                result["truncated"] = True
+                break
+            for edge in self.incident_edges(node, types):
+                other = edge[1] if edge[0] == node else edge[0]
+                if other in settled:
+                    continue
+                next_cost = cost + 1.0 / max(edge[3], _MIN_STRENGTH)
+                if next_cost < dist.get(other, float("inf")):
+                    dist[other] = next_cost
+                    previous[other] = (node, edge)
+                    heapq.heappush(heap, (next_cost, other))
+
+        result["visited"] = len(settled)
+        if to_id not in settled:
+            return result
+        nodes, edges = [to_id], []
+        while nodes[-1] != from_id:
+            node, edge = previous[nodes[-1]]
+            nodes.append(node)
+            edges.append(edge)
+        result.update(found=True, cost=round(dist[to_id], 6), nodes=nodes[::-1], edges=edges[::-1])
+        return result
+
+    def neighborhood(self, entity_id: str, hops: int, types: Optional[Iterable[str]] = None,
+                     max_nodes: int = KG_TRAVERSAL_MAX_VISITED) -> Dict:
+        """Breadth-first k-hop neighborhood over edges in either direction, stopping at max_nodes nodes"""
+        result = {"nodes": {}, "edges": [], "truncated": False}
+        if entity_id not in self._nodes:
+            return result
+        types = list(types) if types is not None else None
+
+        depth = {entity_id: 0}
+        seen_edges = set()
+        frontier = [entity_id]
+        for hop in range(1, hops + 1):
+            next_frontier = []
+            for node in frontier:
+                for edge in self.incident_edges(node, types):
+                    other = edge[1] if edge[0] == node else edge[0]
+                    if other not in depth:
+                        if len(depth) >= max_nodes:
+                            result["truncated"] = True
+                            continue
+                        depth[other] = hop
+                        next_frontier.append(other)
+                    if edge[:3] not in seen_edges:
+                        seen_edges.add(edge[:3])
+                        result["edges"].append(edge)
+            frontier = next_frontier
+            if not frontier:
+                break
+
+        result["nodes"] = depth
+        return result
+
+    def edge_arrays(self) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+        """(node ids, from nodes, to nodes, strengths) for every edge, with pending edges folded in first"""
+        self.compact()
+        out = self._out
+        src = np.repeat(np.arange(out.n_rows, dtype=np.int64), np.diff(out.indptr))
+        return list(self._ids), src, out.indices.astype(np.int64), out.strengths.copy()
+
+    def node_id(self, node: int) -> str:
+        return self._ids[node]
+
+    def node_number(self, entity_id: str) -> Optional[int]:
+        return self._nodes.get(entity_id)
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "nodes": len(self._ids),
+            "edges": self._n_base_edges + len(self._pending),
+            "pending_edges": len(self._pending),
+            "relationship_types": len(self._type_names),
+            "compactions": self.compactions,
+            "memory_bytes": sum(a.nbytes for csr in (self._out, self._in)
+                                for a in (csr.indptr, csr.indices, csr.types, csr.strengths)),
+            "built_at": self.built_at
+        }
@@ -0,0 +1,87 @@
+"""
+Ingest keys for kg-note
+Content+context hashes of ingested notes, so repeated imports and retries are skipped before any Firestore work
+"""
+
+import hashlib
+import json
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def ingest_key(note_id: str, note_data: Dict) -> str:
+    """Hash of everything an ingest writes from: the note id, content, categories and page metadata"""
+    payload = json.dumps(
+        [note_id, note_data.get("content", ""), sorted(set(note_data.get("categories") or [])),
+         note_data.get("metadata") or {}],
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+class IngestKeys:
+    def __init__(self):
+        """Empty key set; load() stored keys and claim() keys as notes are planned"""
+        self._notes: Dict[str, str] = {}     # key -> note id
+        self._keys: Dict[str, str] = {}      # note id -> its current key
+        self.ready = False
+        self.skipped = 0
+
+    def __len__(self) -> int:
+        return len(self._notes)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._notes
+
+    def load(self, keys: Iterable[Tuple[str, str]]):
+        """Merge (note id, key) pairs read from stored notes; an empty key marks a note stored without one"""
+        for note_id, key in keys:
+            self._set(note_id, key)
+
+    def load_merged(self, keys: Iterable[Tuple[str, str]]):
+        """Merge (note id, key) pairs for near-duplicates that were merged into a stored note"""
+        for note_id, key in keys:
+            self._notes.setdefault(key, note_id)
+
+    def _set(self, note_id: str, key: str):
+        previous = self._keys.get(note_id)
+        if previous and previous != key and self._notes.get(previous) == note_id:
+            # The note was re-ingested with new content; its old key no longer describes it
+            del self._notes[previous]
+        self._keys[note_id] = key
+        if key:
+            self._notes[key] = note_id
+
+    def note_key(self, note_id: str) -> Optional[str]:
+        """Key a known note was last ingested with: "" if it was stored without one, None if it is not known"""
+        return self._keys.get(note_id)
+
+    def claim(self, note_id: str, key: str) -> bool:
+        """Reserve a key for a note about to be written
+
+        Returns False, and counts a skip, when the key was already processed.
+        """
+        if key in self._notes:
+            self.skipped += 1
+            return False
+        self._set(note_id, key)
+        return True
+
+    def release(self, note_id: str, key: str, previous: Optional[str] = None):
+        """Undo a claim whose writes failed, restoring the note's earlier key (None forgets the note)"""
+        if self._notes.get(key) != note_id:
+            return
+        del self._notes[key]
+        del self._keys[note_id]
+        if previous is not None:
+            self._set(note_id, previous)
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "keys": len(self._notes),
+            "notes": len(self._keys),
+            "skipped": self.skipped
+        }
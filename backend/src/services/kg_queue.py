@@ -0,0 +1,269 @@
+"""
+Knowledge graph work queue for kg-note
+Durable SQLite-backed queue that takes KG writes off the request path
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# backend/data, resolved from this file so the default does not depend on the working directory
+KG_DATA_DIR = os.getenv("KG_DATA_DIR", os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "data")))
+KG_QUEUE_PATH = os.getenv("KG_QUEUE_PATH", os.path.join(KG_DATA_DIR, "kg_queue.db"))
+KG_QUEUE_WORKERS = int(os.getenv("KG_QUEUE_WORKERS", "4"))
+KG_QUEUE_MAX_ATTEMPTS = int(os.getenv("KG_QUEUE_MAX_ATTEMPTS", "8"))
+KG_QUEUE_BACKOFF_SECONDS = float(os.getenv("KG_QUEUE_BACKOFF_SECONDS", "1.0"))
+KG_QUEUE_MAX_BACKOFF_SECONDS = float(os.getenv("KG_QUEUE_MAX_BACKOFF_SECONDS", "300"))
+KG_QUEUE_LEASE_SECONDS = float(os.getenv("KG_QUEUE_LEASE_SECONDS", "120"))
+KG_QUEUE_POLL_SECONDS = float(os.getenv("KG_QUEUE_POLL_SECONDS", "1.0"))
+KG_QUEUE_DONE_RETENTION_SECONDS = float(os.getenv("KG_QUEUE_DONE_RETENTION_SECONDS", "86400"))
+
+Handler = Callable[[Dict], Awaitable[object]]
+
+
+def payload_key(kind: str, payload: Dict) -> str:
+    """Idempotency key derived from the job kind and its canonical payload"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{kind}:{canonical}".encode()).hexdigest()
+
+
+class KGWorkQueue:
+    def __init__(self, db_path: str = KG_QUEUE_PATH):
+        """Open (or create) the queue database; blocking, so async callers should construct it in a thread"""
+        self.db_path = db_path
+        self._handlers: Dict[str, Handler] = {}
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers = []
+        self._stopping = False
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS kg_jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "key TEXT NOT NULL UNIQUE, "
+            "kind TEXT NOT NULL, "
+            "payload TEXT NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'pending', "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, "
+            "available_at REAL NOT NULL, "
+            "lease_until REAL, "
+            "finished_at REAL, "
+            "last_error TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS kg_jobs_ready ON kg_jobs (status, available_at)")
+
+    def register(self, kind: str, handler: Handler):
+        """Route jobs of this kind to an async handler"""
+        self._handlers[kind] = handler
+
+    async def enqueue(self, kind: str, payload: Dict, key: Optional[str] = None) -> bool:
+        """Persist a job; returns False if a job with the same key was already queued or done"""
+        inserted = await asyncio.to_thread(self._insert, key or payload_key(kind, payload), kind, payload)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return inserted
+
+    def _insert(self, key: str, kind: str, payload: Dict) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO kg_jobs (key, kind, payload, created_at, available_at) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, json.dumps(payload), now, now)
+            )
+        return cursor.rowcount > 0
+
+    def _claim(self) -> Optional[tuple]:
+        """Lease the oldest ready job, including ones whose previous lease expired"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, kind, payload, attempts FROM kg_jobs "
+                    "WHERE (status = 'pending' AND available_at <= ?) "
+                    "OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY available_at LIMIT 1",
+                    (now, now)
+                ).fetchone()
+                if row:
+                    self._db.execute(
+                        "UPDATE kg_jobs SET status = 'running', lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                        (now + KG_QUEUE_LEASE_SECONDS, row[0])
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return row
+
+    def _renew(self, job_id: int):
+        """Push a running job's lease forward so it is not handed to another worker"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE kg_jobs SET lease_until = ? WHERE id = ? AND status = 'running'",
+                (time.time() + KG_QUEUE_LEASE_SECONDS, job_id)
+            )
+
+    async def _keep_leased(self, job_id: int):
+        while True:
+            await asyncio.sleep(KG_QUEUE_LEASE_SECONDS / 3)
+            try:
+                await asyncio.to_thread(self._renew, job_id)
+            except Exception as e:
+                logger.error(f"Failed to renew lease of KG job {job_id}: {e}")
+
+    def _complete(self, job_id: int):
+        with self._lock:
+            self._db.execute(
+                "UPDATE kg_jobs SET status = 'done', finished_at = ?, lease_until = NULL, last_error = NULL WHERE id = ?",
+                (time.time(), job_id)
+            )
+
+    def _fail(self, job_id: int, attempts: int, error: str):
+        """Schedule a retry with exponential backoff and jitter, or give up"""
+        now = time.time()
+        with self._lock:
+            if attempts >= KG_QUEUE_MAX_ATTEMPTS:
+                self._db.execute(
+                    "UPDATE kg_jobs SET status = 'dead', finished_at = ?, lease_until = NULL, last_error = ? WHERE id = ?",
+                    (now, error, job_id)
+                )
+                logger.error(f"KG job {job_id} failed permanently after {attempts} attempts: {error}")
+                return
+            delay = min(KG_QUEUE_MAX_BACKOFF_SECONDS, KG_QUEUE_BACKOFF_SECONDS * (2 ** (attempts - 1)))
+            delay *= random.uniform(0.5, 1.0)
+            self._db.execute(
+                "UPDATE kg_jobs SET status = 'pending', available_at = ?, lease_until = NULL, last_error = ? WHERE id = ?",
+                (now + delay, error, job_id)
+            )
+            logger.warning(f"KG job {job_id} failed (attempt {attempts}), retrying in {delay:.1f}s: {error}")
+
+    def _prune(self):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM kg_jobs WHERE status = 'done' AND finished_at < ?",
+                (time.time() - KG_QUEUE_DONE_RETENTION_SECONDS,)
+            )
+
+    async def run_once(self) -> bool:
+        """Process one job if any is ready; returns False when the queue had nothing to do"""
+        # SQLite calls block (BEGIN IMMEDIATE waits up to 30s for the write lock), so keep them off the loop
+        row = await asyncio.to_thread(self._claim)
+        if row is None:
+            return False
+        job_id, kind, payload, attempts = row
+        attempts += 1
+        handler = self._handlers.get(kind)
+        if handler is None:
+            await asyncio.to_thread(self._fail, job_id, KG_QUEUE_MAX_ATTEMPTS, f"No handler registered for {kind}")
+            return True
+        # Long handlers keep renewing their lease instead of being re-leased and run twice
+        heartbeat = asyncio.create_task(self._keep_leased(job_id))
+        try:
+            await handler(json.loads(payload))
+        except Exception as e:
+            error = str(e)
+        else:
+            error = None
+        finally:
+            heartbeat.cancel()
+        if error is None:
+            await asyncio.to_thread(self._complete, job_id)
+        else:
+            await asyncio.to_thread(self._fail, job_id, attempts, error)
+        return True
+
+    async def _worker(self, worker_id: int):
+        while not self._stopping:
+            try:
+                if await self.run_once():
+                    continue
+            except Exception as e:
+                logger.error(f"KG queue worker {worker_id} error: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=KG_QUEUE_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self, workers: int = KG_QUEUE_WORKERS):
+        """Start the in-process worker pool on the running event loop"""
+        if workers <= 0 or self._workers:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        await asyncio.to_thread(self._prune)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(workers)]
+        logger.info(f"Started {workers} KG queue workers")
+
+    async def stop(self):
+        """Stop workers; leased jobs are picked up again after their lease expires"""
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> Dict:
+        """Queue depth, lag of the oldest pending job and per-status counts"""
+        now = time.time()
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM kg_jobs GROUP BY status").fetchall())
+            oldest = self._db.execute(
+                "SELECT MIN(created_at) FROM kg_jobs WHERE status IN ('pending', 'running')"
+            ).fetchone()[0]
+        return {
+            "depth": counts.get("pending", 0) + counts.get("running", 0),
+            "pending": counts.get("pending", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "dead": counts.get("dead", 0),
+            "lag_seconds": round(now - oldest, 3) if oldest else 0.0,
+            "workers": len(self._workers)
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+async def _run_standalone_worker():
+    """Drain the queue from a separate process (set KG_QUEUE_WORKERS=0 on the API)"""
+    from services.knowledge_graph import KG_INDEX_SYNC_SECONDS, KnowledgeGraphService
+
+    kg_service = KnowledgeGraphService()
+    queue = await asyncio.to_thread(KGWorkQueue)
+    queue.register("add_note", kg_service.add_note_entity)
+    await queue.start(max(KG_QUEUE_WORKERS, 1))
+    # Keep ingest keys and note indexes current with notes the API imports directly
+    sync_task = asyncio.create_task(kg_service.keep_indexes_synced()) if KG_INDEX_SYNC_SECONDS > 0 else None
+    try:
+        await asyncio.gather(*queue._workers)
+    finally:
+        if sync_task is not None:
+            sync_task.cancel()
+        await queue.stop()
+        queue.close()
+        await kg_service.counters.close()
+        await kg_service.overview_stats.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run_standalone_worker())
@@ -3,27 +3,90 @@ Knowledge Graph Service for kg-note
 Manages entities and relationships in Firestore following MCP patterns
 """
 
+import asyncio
 import hashlib
+import time
 import uuid
-from datetime import datetime
-from typing import Dict, List, Optional, Tuple, Any
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Any
+from google.api_core.exceptions import NotFound
 from google.cloud import firestore
 from google.auth import default
 import os
 import logging
 
+from services.concept_extractor import ConceptExtractor
+from services.counter_buffer import CounterBuffer
+from services.entity_cache import EntityCache
+from services.entity_search import EntitySearchIndex
+from services.graph_analytics import GraphAnalytics
+from services.graph_index import KG_GRAPH_INDEX_ENABLED, KG_TRAVERSAL_MAX_VISITED, GraphIndex
+from services.ingest_keys import IngestKeys, ingest_key
+from services.near_duplicates import KG_DUPLICATE_POLICY, MinHashLSH
+from services.overview_stats import RANKED_TYPES, OverviewStats
+from services.timestamp_index import TimestampIndex, to_milliseconds
+from services.vector_index import VectorIndex, embed
+
 logger = logging.getLogger(__name__)
 
+# Firestore caps a batched write at 500 operations
+BULK_BATCH_SIZE = 500
+BULK_READ_CHUNK = 300
+BULK_MAX_PARALLEL_COMMITS = int(os.getenv("KG_BULK_MAX_PARALLEL_COMMITS", "8"))
+
+EXPORT_COLLECTIONS = {"entities": "kg_entities", "relationships": "kg_relationships"}
+EXPORT_PAGE_SIZE = 500
+
+SEARCH_SYNC_SKEW_SECONDS = 60
+# How often in-process indexes read back writes made by other processes (0 disables)
+KG_INDEX_SYNC_SECONDS = float(os.getenv("KG_INDEX_SYNC_SECONDS", "60"))
+
+# Firestore accepts at most 30 values in an `in` filter
+IN_QUERY_MAX_VALUES = 30
+RELATED_FANOUT = int(os.getenv("KG_RELATED_FANOUT", "20"))
+RELATED_TEMPORAL_WINDOW_SECONDS = float(os.getenv("KG_RELATED_TEMPORAL_WINDOW_SECONDS", "3600"))
+# Evidence weights per shared signal; scores add up across signals
+RELATED_SIGNAL_WEIGHTS = {
+    "CREATED_FROM": 1.0,
+    "TAGGED_AS": 0.6,
+    "CONTAINS": 0.4,
+    "SAME_DOMAIN": 0.3,
+    "TEMPORAL_NEAR": 0.5
+}
+
+# TEMPORAL_NEAR edges link notes written less than the window apart, earlier note to later one, with
+# strength max(min, 1 - diff / decay); the defaults match scripts/upload-to-firestore.py
+TEMPORAL_WINDOW_MS = int(os.getenv("KG_TEMPORAL_WINDOW_MS", "3600000"))
+TEMPORAL_DECAY_MS = float(os.getenv("KG_TEMPORAL_DECAY_MS", str(TEMPORAL_WINDOW_MS)))
+TEMPORAL_MIN_STRENGTH = float(os.getenv("KG_TEMPORAL_MIN_STRENGTH", "0.3"))
+
 class KnowledgeGraphService:
     def __init__(self):
         """Initialize Firestore client for knowledge graph operations"""
         try:
+            # AsyncClient so Firestore I/O overlaps across requests instead of blocking the event loop
             if os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
-                self.db = firestore.Client()
+                self.db = firestore.AsyncClient()
             else:
                 # For Cloud Run deployment
                 credentials, project = default()
-                self.db = firestore.Client(credentials=credentials, project=project)
+                self.db = firestore.AsyncClient(credentials=credentials, project=project)
+            self.entity_cache = EntityCache()
+            self.counters = CounterBuffer(self.db)
+            self.overview_stats = OverviewStats(self.db)
+            self.concept_extractor = ConceptExtractor()
+            self.graph_index = GraphIndex() if KG_GRAPH_INDEX_ENABLED else None
+            self.search_index = EntitySearchIndex()
+            self.vector_index = VectorIndex()
+            self.analytics = GraphAnalytics()
+            self.timestamp_index = TimestampIndex()
+            self.duplicate_index = MinHashLSH()
+            self.ingest_keys = IngestKeys()
+            self._note_indexes_lock = asyncio.Lock()
+            self._analytics_lock = asyncio.Lock()
+            # Indexes loaded after this point scan everything, so syncs only need writes made since
+            self._indexes_synced_at = time.time()
             logger.info("Knowledge Graph Service initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize Firestore client: {e}")
@@ -46,352 +109,1283 @@ class KnowledgeGraphService:
         else:
             return f"{entity_type}-{uuid.uuid4().hex[:8]}"
 
+    def _build_note_entity(self, note_data: Dict) -> Dict:
+        """Build the note entity document"""
+        # Extract title from content (first 50 chars)
+        content = note_data.get("content", "")
+        title = content[:50] + "..." if len(content) > 50 else content
+        
+        note_entity = {
+            "type": "note",
+            "name": title,
+            "data": {
+                "content": content,
+                "timestamp": note_data.get("timestamp"),
+                "categories": note_data.get("categories", [])
+            },
+            "observations": [
+                f"Created at {datetime.fromtimestamp(note_data.get('timestamp', 0)).isoformat()}",
+                f"Content length: {len(content)} characters",
+                f"Categories: {', '.join(note_data.get('categories', []))}" if note_data.get('categories') else "No categories assigned"
+            ],
+            "created": firestore.SERVER_TIMESTAMP,
+            "updated": firestore.SERVER_TIMESTAMP
+        }
+
+        # Add metadata observations if available
+        metadata = note_data.get("metadata", {})
+        if metadata:
+            note_entity["observations"].extend([
+                f"Created from webpage: {metadata.get('title', 'Unknown')}",
+                f"Source domain: {metadata.get('domain', 'Unknown')}"
+            ])
+
+        return note_entity
+
+    def _build_url_context_entity(self, metadata: Dict) -> Dict:
+        """Build a new URL context entity document"""
+        domain = metadata.get("domain", "")
+        return {
+            "type": "url_context",
+            "name": metadata.get("title", "Untitled Page"),
+            "data": {
+                "url": metadata.get("url", ""),
+                "domain": domain,
+                "title": metadata.get("title", ""),
+                "summary": metadata.get("summary", "")
+            },
+            "observations": [
+                f"First visited: {datetime.now().isoformat()}",
+                f"Domain: {domain}",
+                "Generated 1 note"
+            ],
+            "created": firestore.SERVER_TIMESTAMP,
+            "updated": firestore.SERVER_TIMESTAMP
+        }
+
+    def _build_category_entity(self, category_name: str, note_count: int = 1) -> Dict:
+        """Build a new category entity document"""
+        return {
+            "type": "category",
+            "name": category_name,
+            "data": {
+                "description": f"User-defined category: {category_name}",
+                "note_count": note_count
+            },
+            "observations": [
+                f"Created: {datetime.now().isoformat()}",
+                f"Contains {note_count} note" + ("s" if note_count != 1 else "")
+            ],
+            "created": firestore.SERVER_TIMESTAMP,
+            "updated": firestore.SERVER_TIMESTAMP
+        }
+
+    def _build_concept_entity(self, concept_name: str, frequency: int = 1) -> Dict:
+        """Build a new concept entity document"""
+        return {
+            "type": "concept",
+            "name": concept_name,
+            "data": {
+                "frequency": frequency
+            },
+            "observations": [
+                f"First extracted: {datetime.now().isoformat()}",
+                f"Appears in {frequency} note" + ("s" if frequency != 1 else "")
+            ],
+            "created": firestore.SERVER_TIMESTAMP,
+            "updated": firestore.SERVER_TIMESTAMP
+        }
+
+    def _build_domain_entity(self, domain_name: str, note_count: int = 1) -> Dict:
+        """Build a new domain entity document"""
+        return {
+            "type": "domain",
+            "name": domain_name,
+            "data": {
+                "note_count": note_count
+            },
+            "observations": [
+                f"First encountered: {datetime.now().isoformat()}",
+                f"Generated {note_count} note" + ("s" if note_count != 1 else "")
+            ],
+            "created": firestore.SERVER_TIMESTAMP,
+            "updated": firestore.SERVER_TIMESTAMP
+        }
+
+    def _build_relationship(self, from_id: str, to_id: str, rel_type: str, strength: float, metadata: Dict) -> Dict:
+        """Build a relationship document"""
+        return {
+            "from_id": from_id,
+            "to_id": to_id,
+            "type": rel_type,
+            "strength": strength,
+            "metadata": metadata,
+            "created": firestore.SERVER_TIMESTAMP
+        }
+
+    def _relationship_id(self, rel: Dict) -> str:
+        return f"{rel['from_id']}-{rel['type']}-{rel['to_id']}"
+
     async def add_note_entity(self, note_data: Dict) -> str:
         """Add a note entity with automatic relationship creation"""
         try:
-            # Create note entity
-            note_id = self._generate_entity_id("note", str(note_data.get("timestamp", "")))
-            
-            # Extract title from content (first 50 chars)
-            content = note_data.get("content", "")
-            title = content[:50] + "..." if len(content) > 50 else content
-            
-            note_entity = {
-                "type": "note",
-                "name": title,
-                "data": {
-                    "content": content,
-                    "timestamp": note_data.get("timestamp"),
-                    "categories": note_data.get("categories", [])
-                },
-                "observations": [
-                    f"Created at {datetime.fromtimestamp(note_data.get('timestamp', 0)).isoformat()}",
-                    f"Content length: {len(content)} characters",
-                    f"Categories: {', '.join(note_data.get('categories', []))}" if note_data.get('categories') else "No categories assigned"
-                ],
-                "created": firestore.SERVER_TIMESTAMP,
-                "updated": firestore.SERVER_TIMESTAMP
-            }
-
-            # Add metadata observations if available
-            metadata = note_data.get("metadata", {})
-            if metadata:
-                note_entity["observations"].extend([
-                    f"Created from webpage: {metadata.get('title', 'Unknown')}",
-                    f"Source domain: {metadata.get('domain', 'Unknown')}"
-                ])
+            await self.load_note_indexes()
+            plan = self._plan_ingest([note_data])
+            if plan["errors"]:
+                raise ValueError(plan["errors"][0])
+            await self._plan_edits(plan)
+            # A note merged into an existing near-duplicate resolves to that note
+            note_id = next(iter(plan["notes"]), None) or next(iter(plan["merged"].values()), None)
+            if note_id is None:
+                # Already ingested with the same content and context: nothing to write
+                return plan["skipped"][0]
+            entities_ref = self.db.collection("kg_entities")
+            candidate_ids = self._candidate_entity_ids(plan)
+            known = {entity_id for entity_id in candidate_ids if self.entity_cache.known_to_exist(entity_id)}
+            refs = [entities_ref.document(entity_id) for entity_id in candidate_ids if entity_id not in known]
 
-            # Store note entity
-            self.db.collection("kg_entities").document(note_id).set(note_entity)
+            # One multi-document read and one atomic commit, whatever the note's fan-out
+            @firestore.async_transactional
+            async def ingest(transaction):
+                existing = set(known)
+                if refs:
+                    async for snapshot in self.db.get_all(refs, transaction=transaction):
+                        if snapshot.exists:
+                            existing.add(snapshot.id)
+                writes, _, _ = self._plan_writes(plan, existing)
+                for op, ref, data in writes:
+                    # Counter bumps on existing entities are coalesced outside the transaction
+                    if op == "increment" and self.counters.enabled:
+                        continue
+                    self._apply_write(transaction, op, ref, data)
+                return writes
 
-            # Create relationships
-            await self._create_note_relationships(note_id, note_data)
+            try:
+                writes = await ingest(self.db.transaction())
+            except Exception:
+                # A cached "exists" may be stale; make the retry read everything again
+                for entity_id in known:
+                    self.entity_cache.invalidate(entity_id)
+                self._release_planned_notes(plan, plan["ingest_keys"])
+                raise
+            self._track_writes(writes)
+            self._record_stats(plan, writes)
+            if self.counters.enabled:
+                for op, ref, data in writes:
+                    if op == "increment":
+                        for field, delta in data.items():
+                            self.counters.add(ref.id, field, delta)
 
-            logger.info(f"Created note entity: {note_id}")
+            logger.info(f"Created note entity: {note_id} ({len(plan['relationships'])} relationships, {len(writes)} writes)")
             return note_id
 
         except Exception as e:
             logger.error(f"Failed to add note entity: {e}")
             raise
 
-    async def _create_note_relationships(self, note_id: str, note_data: Dict):
-        """Create relationships for a note entity"""
-        try:
-            relationships = []
-            metadata = note_data.get("metadata", {})
-            
+    def _plan_ingest(self, notes: List[Dict]) -> Dict:
+        """Compute note docs, shared entities, aggregated counters and edges for a set of notes"""
+        plan = {
+            "notes": {},
+            "relationships": {},
+            "url_metadata": {},
+            "category_counts": Counter(),
+            "category_names": {},
+            "concept_counts": Counter(),
+            "concept_names": {},
+            "domain_names": {},
+            "merged": {},                   # near-duplicate note id -> note it was merged into
+            "duplicate_counts": Counter(),  # stored note id -> near-duplicates merged into it
+            "indexed_notes": set(),
+            "indexed_duplicates": set(),
+            "ingest_keys": {},              # note id -> (claimed ingest key, the note's previous key or None)
+            "edited": set(),                # note ids already stored, re-ingested with new content or context
+            "edited_counts": Counter(),     # category/concept id -> edited notes still linked to it, already counted
+            "unlinked": {},                 # relationship id -> stored category/concept edge an edited note dropped
+            "unlinked_counts": Counter(),   # category/concept id -> edited notes no longer linked to it
+            "merged_keys": {},              # note id -> ingest keys of near-duplicates merged into it
+            "skipped": [],                  # note ids already ingested with the same content and context
+            "superseded": 0,                # earlier versions of a note id repeated in this call
+            "errors": []
+        }
+
+        # A note id repeated within one call keeps its last version
+        latest: Dict[str, Dict] = {}
+        for note_data in notes:
+            latest[self._generate_entity_id("note", str(note_data.get("timestamp", "")))] = note_data
+        plan["superseded"] = len(notes) - len(latest)
+
+        # Notes already ingested unchanged are dropped before any other work
+        fresh = []
+        for note_id, note_data in latest.items():
+            key = ingest_key(note_id, note_data)
+            previous = self.ingest_keys.note_key(note_id)
+            if not self.ingest_keys.claim(note_id, key):
+                plan["skipped"].append(note_id)
+                continue
+            plan["ingest_keys"][note_id] = (key, previous)
+            if previous is not None:
+                plan["edited"].add(note_id)
+            fresh.append((note_id, note_data))
+
+        # Concepts for every note in one pass over the compiled dictionary
+        extracted = self.concept_extractor.extract_many(note_data.get("content", "") for _, note_data in fresh)
+
+        for (note_id, note_data), concepts in zip(fresh, extracted):
+            try:
+                note_entity = self._build_note_entity(note_data)
+            except Exception as e:
+                plan["errors"].append(f"Failed to import note {note_id}: {e}")
+                self._release_planned_notes(plan, [note_id])
+                continue
+            note_entity["ingest_key"] = plan["ingest_keys"][note_id][0]
+            duplicate = self._find_duplicate(note_id, note_data.get("content", ""), plan)
+            if duplicate and self._merges(note_id, plan):
+                original_id = duplicate[0]
+                if original_id in plan["notes"] and original_id not in plan["edited"]:
+                    original = plan["notes"][original_id]["data"]
+                    original["duplicate_count"] = original.get("duplicate_count", 0) + 1
+                else:
+                    plan["duplicate_counts"][original_id] += 1
+                plan["merged"][note_id] = original_id
+                # Kept on the original so a re-import of the duplicate is still skipped after a restart
+                plan["merged_keys"].setdefault(original_id, []).append(plan["ingest_keys"][note_id][0])
+                continue
+            plan["notes"][note_id] = note_entity
+            metadata = note_data.get("metadata", {}) or {}
+
+            note_relationships = []
             # 1. URL Context relationship
             if metadata.get("url"):
-                url_context_id = await self._ensure_url_context_entity(metadata)
-                relationships.append({
-                    "from_id": note_id,
-                    "to_id": url_context_id,
-                    "type": "CREATED_FROM",
-                    "strength": 1.0,
-                    "metadata": {"url": metadata.get("url")},
-                    "created": firestore.SERVER_TIMESTAMP
-                })
+                url_context_id = self._generate_entity_id("url_context", metadata["url"])
+                plan["url_metadata"].setdefault(url_context_id, metadata)
+                if metadata.get("domain"):
+                    domain_id = self._generate_entity_id("domain", metadata["domain"])
+                    plan["domain_names"].setdefault(domain_id, metadata["domain"])
+                note_relationships.append(self._build_relationship(
+                    note_id, url_context_id, "CREATED_FROM", 1.0, {"url": metadata.get("url")}
+                ))
 
             # 2. Category relationships
-            for category in note_data.get("categories", []):
-                category_id = await self._ensure_category_entity(category)
-                relationships.append({
-                    "from_id": note_id,
-                    "to_id": category_id,
-                    "type": "TAGGED_AS",
-                    "strength": 1.0,
-                    "metadata": {"user_assigned": True},
-                    "created": firestore.SERVER_TIMESTAMP
-                })
+            for category in dict.fromkeys(note_data.get("categories", [])):
+                category_id = self._generate_entity_id("category", category)
+                plan["category_names"].setdefault(category_id, category)
+                plan["category_counts"][category_id] += 1
+                note_relationships.append(self._build_relationship(
+                    note_id, category_id, "TAGGED_AS", 1.0, {"user_assigned": True}
+                ))
 
-            # 3. Concept relationships (AI-extracted)
-            concepts = await self._extract_concepts(note_data.get("content", ""))
-            for concept, confidence in concepts:
-                concept_id = await self._ensure_concept_entity(concept)
-                relationships.append({
-                    "from_id": note_id,
-                    "to_id": concept_id,
-                    "type": "CONTAINS",
-                    "strength": confidence,
-                    "metadata": {"ai_extracted": True},
-                    "created": firestore.SERVER_TIMESTAMP
-                })
+            # 3. Concept relationships (dictionary-extracted)
+            for match in concepts:
+                concept_id = self._generate_entity_id("concept", match["concept"])
+                plan["concept_names"].setdefault(concept_id, match["concept"])
+                plan["concept_counts"][concept_id] += 1
+                note_relationships.append(self._build_relationship(
+                    note_id, concept_id, "CONTAINS", match["confidence"],
+                    {"ai_extracted": True, "mentions": len(match["positions"])}
+                ))
 
-            # Batch write relationships
-            if relationships:
-                batch = self.db.batch()
-                for rel in relationships:
-                    rel_id = f"{rel['from_id']}-{rel['type']}-{rel['to_id']}"
-                    batch.set(self.db.collection("kg_relationships").document(rel_id), rel)
-                batch.commit()
+            # 4. Near-duplicate of an earlier note
+            if duplicate:
+                similarity = round(duplicate[1], 4)
+                note_relationships.append(self._build_relationship(
+                    note_id, duplicate[0], "DUPLICATE_OF", similarity, {"similarity": similarity}
+                ))
 
-            logger.info(f"Created {len(relationships)} relationships for note {note_id}")
+            for rel in note_relationships:
+                plan["relationships"][self._relationship_id(rel)] = rel
 
-        except Exception as e:
-            logger.error(f"Failed to create note relationships: {e}")
-            raise
+        # 5. Temporal relationships, against every indexed note and the rest of this batch
+        self._plan_temporal_edges(plan)
+        return plan
+
+    async def _plan_edits(self, plan: Dict):
+        """Diff the stored category and concept edges of edited notes against their new version
+
+        Links the note keeps were counted when it was first ingested; links it dropped are counted down and
+        their edges deleted. If the edges cannot be read, the planned notes' index claims are released.
+        """
+        edited = [note_id for note_id in plan["edited"] if note_id in plan["notes"]]
+        if not edited:
+            return
+
+        async def chunk_edges(chunk: List[str]) -> List[Tuple[str, Dict]]:
+            query = self.db.collection("kg_relationships").where("from_id", "in", chunk)
+            return [(rel.id, rel.to_dict()) async for rel in query.stream()]
 
-    async def _ensure_url_context_entity(self, metadata: Dict) -> str:
-        """Ensure URL context entity exists"""
-        url = metadata.get("url", "")
-        url_context_id = self._generate_entity_id("url_context", url)
-        
         try:
-            # Check if exists
-            doc_ref = self.db.collection("kg_entities").document(url_context_id)
-            doc = doc_ref.get()
-            
-            if not doc.exists:
-                # Create new URL context entity
-                domain = metadata.get("domain", "")
-                entity = {
-                    "type": "url_context",
-                    "name": metadata.get("title", "Untitled Page"),
-                    "data": {
-                        "url": url,
-                        "domain": domain,
-                        "title": metadata.get("title", ""),
-                        "summary": metadata.get("summary", "")
-                    },
-                    "observations": [
-                        f"First visited: {datetime.now().isoformat()}",
-                        f"Domain: {domain}",
-                        "Generated 1 note"
-                    ],
-                    "created": firestore.SERVER_TIMESTAMP,
-                    "updated": firestore.SERVER_TIMESTAMP
-                }
-                doc_ref.set(entity)
-                
-                # Ensure domain entity exists
-                if domain:
-                    await self._ensure_domain_entity(domain)
+            results = await asyncio.gather(*[
+                chunk_edges(edited[i:i + IN_QUERY_MAX_VALUES])
+                for i in range(0, len(edited), IN_QUERY_MAX_VALUES)
+            ])
+        except Exception:
+            self._release_planned_notes(plan, plan["ingest_keys"])
+            raise
+        for edges in results:
+            for rel_id, rel in edges:
+                if rel.get("type") not in ("TAGGED_AS", "CONTAINS"):
+                    continue
+                if rel_id in plan["relationships"]:
+                    plan["edited_counts"][rel["to_id"]] += 1
+                else:
+                    plan["unlinked"][rel_id] = rel
+                    plan["unlinked_counts"][rel["to_id"]] += 1
+
+    def _find_duplicate(self, note_id: str, content: str, plan: Dict) -> Optional[Tuple[str, float]]:
+        """Most similar indexed near-duplicate of a note, as (note id, similarity)
+
+        The note is claimed in the duplicate index right away unless it is about to be merged away.
+        """
+        if KG_DUPLICATE_POLICY not in ("link", "merge"):
+            return None
+        signature = self.duplicate_index.signature(content)
+        if signature is None:
+            return None
+        matches = self.duplicate_index.query(signature, exclude=note_id)
+        duplicate = matches[0] if matches else None
+        if not (duplicate and self._merges(note_id, plan)) and self.duplicate_index.add(note_id, signature):
+            plan["indexed_duplicates"].add(note_id)
+        return duplicate
+
+    def _merges(self, note_id: str, plan: Dict) -> bool:
+        """Whether a near-duplicate note is merged away; an edited note is already stored, so it is only linked"""
+        return KG_DUPLICATE_POLICY == "merge" and note_id not in plan["edited"]
+
+    def _release_planned_notes(self, plan: Dict, note_ids: Iterable[str]):
+        """Undo index claims for planned notes whose writes failed"""
+        for note_id in note_ids:
+            if note_id in plan["ingest_keys"]:
+                self.ingest_keys.release(note_id, *plan["ingest_keys"][note_id])
+            if note_id in plan["indexed_notes"]:
+                self.timestamp_index.remove(note_id)
+            if note_id in plan["indexed_duplicates"]:
+                self.duplicate_index.remove(note_id)
+
+    def _plan_temporal_edges(self, plan: Dict):
+        """TEMPORAL_NEAR edges between each planned note and the notes within the temporal window
+
+        Planned notes are claimed in the timestamp index right away, so concurrent ingests see each other.
+        """
+        if TEMPORAL_WINDOW_MS <= 0:
+            return
+        timestamps = {}
+        for note_id, entity in plan["notes"].items():
+            timestamp = to_milliseconds(entity["data"].get("timestamp"))
+            if timestamp is None:
+                continue
+            timestamps[note_id] = timestamp
+            if self.timestamp_index.add(note_id, timestamp):
+                plan["indexed_notes"].add(note_id)
+
+        for note_id, timestamp in timestamps.items():
+            for other_id, other_timestamp in self.timestamp_index.within(timestamp, TEMPORAL_WINDOW_MS):
+                if other_id == note_id:
+                    continue
+                time_diff = abs(timestamp - other_timestamp)
+                earlier, later = (other_id, note_id) if (other_timestamp, other_id) < (timestamp, note_id) else (note_id, other_id)
+                strength = max(TEMPORAL_MIN_STRENGTH, 1.0 - (time_diff / TEMPORAL_DECAY_MS))
+                rel = self._build_relationship(earlier, later, "TEMPORAL_NEAR", strength, {"time_diff_ms": time_diff})
+                plan["relationships"][self._relationship_id(rel)] = rel
+
+    def _candidate_entity_ids(self, plan: Dict) -> List[str]:
+        """Shared entities whose existence decides between create and increment"""
+        return list(dict.fromkeys([*plan["url_metadata"], *plan["category_counts"], *plan["concept_counts"],
+                                   *plan["unlinked_counts"], *plan["domain_names"]]))
+
+    def _plan_writes(self, plan: Dict, existing: set) -> Tuple[List[Tuple[str, Any, Dict]], int, int]:
+        """Turn a plan into (op, ref, data) writes given which shared entities already exist
+
+        op is "set", "merge" (a set merged into the stored document), "update", "increment" (data maps
+        counter fields to deltas), or "delete" (relationship data names the edge's endpoints).
+        """
+        entities_ref = self.db.collection("kg_entities")
+        writes: List[Tuple[str, Any, Dict]] = []
+        created = updated = 0
+
+        for note_id, entity in plan["notes"].items():
+            merged_keys = plan["merged_keys"].get(note_id)
+            if note_id in plan["edited"]:
+                # Keep what the stored note gathered since: duplicate count, analytics, merged keys
+                entity = {k: v for k, v in entity.items() if k != "created"}
+                if merged_keys:
+                    entity["ingest_keys"] = firestore.ArrayUnion(merged_keys)
+                writes.append(("merge", entities_ref.document(note_id), entity))
             else:
-                # Update note count
-                doc_ref.update({
-                    "updated": firestore.SERVER_TIMESTAMP
-                })
-                
-            return url_context_id
-            
+                if merged_keys:
+                    entity = {**entity, "ingest_keys": merged_keys}
+                writes.append(("set", entities_ref.document(note_id), entity))
+
+        # A domain's count tracks how many of its URL contexts are new
+        domain_counts: Counter = Counter()
+        for url_context_id, metadata in plan["url_metadata"].items():
+            ref = entities_ref.document(url_context_id)
+            if url_context_id in existing:
+                writes.append(("update", ref, {"updated": firestore.SERVER_TIMESTAMP}))
+                updated += 1
+            else:
+                writes.append(("set", ref, self._build_url_context_entity(metadata)))
+                created += 1
+                if metadata.get("domain"):
+                    domain_counts[self._generate_entity_id("domain", metadata["domain"])] += 1
+
+        counters = [
+            (plan["category_counts"], plan["category_names"], "data.note_count", self._build_category_entity),
+            (plan["concept_counts"], plan["concept_names"], "data.frequency", self._build_concept_entity),
+            (domain_counts, plan["domain_names"], "data.note_count", self._build_domain_entity),
+        ]
+        for counts, names, field, build in counters:
+            for entity_id, count in counts.items():
+                ref = entities_ref.document(entity_id)
+                if entity_id in existing:
+                    # Edited notes count only on links they did not have when first ingested
+                    count -= plan["edited_counts"][entity_id] + plan["unlinked_counts"][entity_id]
+                    if count:
+                        writes.append(("increment", ref, {field: count}))
+                        updated += 1
+                else:
+                    writes.append(("set", ref, build(names[entity_id], count)))
+                    created += 1
+
+        # Categories and concepts that edited notes dropped and no note in this plan links to
+        for entity_id, count in plan["unlinked_counts"].items():
+            if entity_id in existing and entity_id not in plan["category_counts"] and entity_id not in plan["concept_counts"]:
+                field = RANKED_TYPES[entity_id.split("-", 1)[0]]
+                writes.append(("increment", entities_ref.document(entity_id), {field: -count}))
+                updated += 1
+
+        # Near-duplicates merged into notes that are already stored
+        for original_id, count in plan["duplicate_counts"].items():
+            writes.append(("increment", entities_ref.document(original_id), {"data.duplicate_count": count}))
+            updated += 1
+        for original_id, keys in plan["merged_keys"].items():
+            if original_id not in plan["notes"]:
+                writes.append(("update", entities_ref.document(original_id), {"ingest_keys": firestore.ArrayUnion(keys)}))
+
+        relationships_ref = self.db.collection("kg_relationships")
+        for rel_id, rel in plan["relationships"].items():
+            writes.append(("set", relationships_ref.document(rel_id), rel))
+        for rel_id, rel in plan["unlinked"].items():
+            writes.append(("delete", relationships_ref.document(rel_id),
+                           {"from_id": rel["from_id"], "to_id": rel["to_id"], "type": rel["type"]}))
+
+        return writes, created, updated
+
+    def _apply_write(self, writer, op: str, ref, data: Dict):
+        """Stage one planned write on a batch or transaction"""
+        if op == "set":
+            writer.set(ref, data)
+        elif op == "merge":
+            writer.set(ref, data, merge=True)
+        elif op == "increment":
+            update = {field: firestore.Increment(delta) for field, delta in data.items()}
+            update["updated"] = firestore.SERVER_TIMESTAMP
+            writer.update(ref, update)
+        elif op == "delete":
+            writer.delete(ref)
+        else:
+            writer.update(ref, data)
+
+    def _track_writes(self, writes: List[Tuple[str, Any, Dict]]):
+        """Write-through of committed writes: entity bodies to the cache, search and vector indexes, edges to the graph index"""
+        removed_edges = False
+        for op, ref, data in writes:
+            if op == "delete":
+                if not ref.path.startswith("kg_relationships/"):
+                    self._forget_note(ref.id)
+                elif self.graph_index is not None and data.get("from_id"):
+                    self.graph_index.remove(data["from_id"], data["to_id"], data["type"])
+                    removed_edges = True
+                continue
+            if ref.path.startswith("kg_relationships/"):
+                if self.graph_index is not None:
+                    self.graph_index.upsert(data["from_id"], data["to_id"], data["type"], data.get("strength", 1.0))
+                continue
+            if op in ("set", "merge"):
+                if op == "set":
+                    self.entity_cache.put(ref.id, {k: v for k, v in data.items() if k not in ("created", "updated")})
+                else:
+                    # Only part of the stored document was written
+                    self.entity_cache.invalidate(ref.id)
+                self.search_index.index(ref.id, data)
+                if data.get("type") == "note":
+                    self.vector_index.add(ref.id, self._note_text(data))
+            else:
+                self.entity_cache.mark_exists(ref.id)
+        if removed_edges:
+            # Once per committed batch, so reads stop seeing deleted base edges before the next build
+            self.graph_index.compact()
+
+    def _record_stats(self, plan: Dict, writes: List[Tuple[str, Any, Dict]]):
+        """Feed committed entity creations and counter bumps to the materialized overview stats"""
+        names = {**plan["category_names"], **plan["concept_names"], **plan["domain_names"]}
+        for op, ref, data in writes:
+            if ref.path.startswith("kg_relationships/"):
+                continue
+            if op == "set":
+                entity_type = data.get("type", "unknown")
+                field = RANKED_TYPES.get(entity_type)
+                count = (data.get("data") or {}).get(field.split(".", 1)[1], 0) if field else 0
+                self.overview_stats.record_created(entity_type, ref.id, data.get("name"), count)
+            elif op == "increment":
+                entity_type = ref.id.split("-", 1)[0]
+                for delta in data.values():
+                    self.overview_stats.record_increment(entity_type, ref.id, names.get(ref.id), delta)
+
+    async def bulk_add_notes(self, notes: List[Dict], progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """Import many notes: plan all entities and edges in memory, then commit in parallel batches"""
+        # 1. Plan: dedupe notes and shared entities, aggregate counters
+        await self.load_note_indexes()
+        plan = self._plan_ingest(notes)
+        await self._plan_edits(plan)
+        errors = plan["errors"]
+
+        # 2. One existence check per distinct shared entity, chunked and run in parallel
+        entities_ref = self.db.collection("kg_entities")
+        existing = set()
+        candidate_ids = []
+        for entity_id in self._candidate_entity_ids(plan):
+            if self.entity_cache.known_to_exist(entity_id):
+                existing.add(entity_id)
+            else:
+                candidate_ids.append(entity_id)
+
+        async def existing_in(chunk: List[str]) -> List[str]:
+            refs = [entities_ref.document(entity_id) for entity_id in chunk]
+            return [snapshot.id async for snapshot in self.db.get_all(refs) if snapshot.exists]
+
+        for found in await asyncio.gather(*[
+            existing_in(candidate_ids[i:i + BULK_READ_CHUNK])
+            for i in range(0, len(candidate_ids), BULK_READ_CHUNK)
+        ]):
+            existing.update(found)
+
+        # 3. Build the write list
+        writes, created, updated = self._plan_writes(plan, existing)
+
+        # 4. Commit in large batches, several at a time
+        semaphore = asyncio.Semaphore(BULK_MAX_PARALLEL_COMMITS)
+        committed = 0
+
+        async def commit_chunk(chunk):
+            nonlocal committed
+            async with semaphore:
+                try:
+                    batch = self.db.batch()
+                    for op, ref, data in chunk:
+                        self._apply_write(batch, op, ref, data)
+                    await batch.commit()
+                except Exception as e:
+                    logger.error(f"Bulk import batch failed: {e}")
+                    errors.append(str(e))
+                    failed = {ref.id for _, ref, data in chunk if data.get("type") == "note" or "ingest_keys" in data}
+                    # Duplicates merged into a note whose write failed lose their persisted keys too
+                    failed.update(note_id for note_id, original_id in plan["merged"].items() if original_id in failed)
+                    self._release_planned_notes(plan, failed)
+                    return
+            self._track_writes(chunk)
+            self._record_stats(plan, chunk)
+            committed += len(chunk)
+            if progress:
+                progress(committed, len(writes))
+
+        await asyncio.gather(*[
+            commit_chunk(writes[i:i + BULK_BATCH_SIZE])
+            for i in range(0, len(writes), BULK_BATCH_SIZE)
+        ])
+
+        logger.info(
+            f"Bulk imported {len(plan['notes'])} notes: {created} entities created, {updated} updated, "
+            f"{len(plan['relationships'])} relationships, {committed}/{len(writes)} writes committed"
+        )
+        return {
+            "notes": len(plan["notes"]),
+            "duplicates_merged": len(plan["merged"]),
+            "skipped_notes": len(plan["skipped"]),
+            "superseded_notes": plan["superseded"],
+            "entities_created": created,
+            "entities_updated": updated,
+            "relationships": len(plan["relationships"]),
+            "writes": len(writes),
+            "committed_writes": committed,
+            "errors": errors
+        }
+
+    async def _get_entities(self, entity_ids: List[str]) -> Dict[str, Dict]:
+        """Entity documents by id: cache hits first, then one get_all for the rest"""
+        found, missing = self.entity_cache.get_many(entity_ids)
+        if missing:
+            entities_ref = self.db.collection("kg_entities")
+            async for doc in self.db.get_all([entities_ref.document(entity_id) for entity_id in missing]):
+                if doc.exists:
+                    found[doc.id] = doc.to_dict()
+                    self.entity_cache.put(doc.id, found[doc.id])
+        return found
+
+    @property
+    def graph_ready(self) -> bool:
+        """True once the in-process graph index has been loaded"""
+        return self.graph_index is not None and self.graph_index.ready
+
+    def _note_indexes_pending(self) -> Tuple[bool, bool, bool]:
+        """Whether the timestamp index, duplicate index and ingest keys still need loading, given what is enabled"""
+        return (TEMPORAL_WINDOW_MS > 0 and not self.timestamp_index.ready,
+                KG_DUPLICATE_POLICY in ("link", "merge") and not self.duplicate_index.ready,
+                not self.ingest_keys.ready)
+
+    async def load_note_indexes(self):
+        """Index every stored note's timestamp, MinHash signature and ingest key in one scan; ingests keep them current
+
+        A failed scan raises and leaves the indexes unready, so ingests fail and retry the load rather than
+        planning against empty ingest keys and counting stored notes again.
+        """
+        if not any(self._note_indexes_pending()):
+            return
+        async with self._note_indexes_lock:
+            load_timestamps, load_signatures, load_keys = self._note_indexes_pending()
+            if not (load_timestamps or load_signatures or load_keys):
+                return
+            try:
+                query = self.db.collection("kg_entities").where("type", "==", "note") \
+                    .select(["data.timestamp", "data.content", "ingest_key", "ingest_keys"])
+                timestamps, contents, keys, merged_keys = [], [], [], []
+                async for doc in query.stream():
+                    # Notes stored before ingest keys (or without a timestamp) lack fields, and get() would raise
+                    note = doc.to_dict() or {}
+                    data = note.get("data") or {}
+                    timestamp = to_milliseconds(data.get("timestamp"))
+                    if timestamp is not None:
+                        timestamps.append((doc.id, timestamp))
+                    contents.append((doc.id, data.get("content") or ""))
+                    # Notes stored without a key are still known, so re-importing them does not count them again
+                    keys.append((doc.id, note.get("ingest_key") or ""))
+                    merged_keys.extend((doc.id, key) for key in note.get("ingest_keys") or [])
+                if load_keys:
+                    self.ingest_keys.load(keys)
+                    self.ingest_keys.load_merged(merged_keys)
+                    self.ingest_keys.ready = True
+                if load_timestamps:
+                    self.timestamp_index.load(timestamps)
+                    self.timestamp_index.ready = True
+                if load_signatures:
+                    # Hashing every note is CPU-bound, so keep it off the event loop
+                    signatures = await asyncio.to_thread(
+                        lambda: [(note_id, self.duplicate_index.signature(content)) for note_id, content in contents]
+                    )
+                    for note_id, signature in signatures:
+                        if signature is not None:
+                            self.duplicate_index.add(note_id, signature)
+                    self.duplicate_index.ready = True
+                logger.info(f"Note indexes ready: {len(self.timestamp_index)} timestamps, "
+                            f"{len(self.duplicate_index)} signatures, {len(self.ingest_keys)} ingest keys")
+            except Exception as e:
+                logger.error(f"Failed to load note indexes: {e}")
+                raise
+
+    def _forget_note(self, note_id: str):
+        """Drop a deleted note from every in-process index (the graph index is rebuilt by the caller)"""
+        self.entity_cache.invalidate(note_id)
+        self.search_index.remove(note_id)
+        self.vector_index.remove(note_id)
+        self.timestamp_index.remove(note_id)
+        self.duplicate_index.remove(note_id)
+
+    async def dedupe_notes(self, policy: str = "link", dry_run: bool = True) -> Dict:
+        """Find near-duplicate notes across the stored graph and link or merge them
+
+        Notes are compared oldest first, so every duplicate points at an earlier note. "link" writes
+        DUPLICATE_OF edges; "merge" deletes each duplicate and its edges, takes it off the counters of
+        its categories and concepts, and counts it in the original's data.duplicate_count.
+        """
+        if policy not in ("link", "merge"):
+            raise ValueError(f"Unknown dedupe policy: {policy}")
+        started = time.time()
+        query = self.db.collection("kg_entities").where("type", "==", "note") \
+            .select(["data.timestamp", "data.content", "ingest_key", "ingest_keys"])
+        notes, note_keys = [], {}
+        async for doc in query.stream():
+            note = doc.to_dict() or {}
+            data = note.get("data") or {}
+            notes.append((to_milliseconds(data.get("timestamp")) or 0, doc.id, data.get("content") or ""))
+            note_keys[doc.id] = [key for key in [note.get("ingest_key"), *(note.get("ingest_keys") or [])] if key]
+        notes.sort(key=lambda note: note[:2])
+
+        def find_pairs() -> List[Tuple[str, str, float]]:
+            # Merged duplicates stay out of the index, so chains resolve to the earliest note
+            index = MinHashLSH()
+            pairs = []
+            for _, note_id, content in notes:
+                signature = index.signature(content)
+                if signature is None:
+                    continue
+                matches = index.query(signature)
+                if matches:
+                    pairs.append((note_id, matches[0][0], round(matches[0][1], 4)))
+                    if policy == "merge":
+                        continue
+                index.add(note_id, signature)
+            return pairs
+
+        pairs = await asyncio.to_thread(find_pairs)
+        summary = {
+            "policy": policy,
+            "dry_run": dry_run,
+            "notes_scanned": len(notes),
+            "duplicates": len(pairs),
+            "pairs": [{"note_id": note_id, "duplicate_of": original_id, "similarity": similarity}
+                      for note_id, original_id, similarity in pairs]
+        }
+        if dry_run or not pairs:
+            return summary
+
+        relationships_ref = self.db.collection("kg_relationships")
+        if policy == "link":
+            writes = []
+            for note_id, original_id, similarity in pairs:
+                rel = self._build_relationship(note_id, original_id, "DUPLICATE_OF", similarity, {"similarity": similarity})
+                writes.append(("set", relationships_ref.document(self._relationship_id(rel)), rel))
+        else:
+            writes = await self._plan_merge_writes(pairs, note_keys)
+        committed, errors = await self._commit_writes(writes)
+        if policy == "merge":
+            await self.load_graph_index()
+            await self.reconcile_stats()
+
+        summary.update({
+            "writes": len(writes),
+            "committed_writes": committed,
+            "errors": errors,
+            "seconds": round(time.time() - started, 2)
+        })
+        logger.info(f"Deduped notes ({policy}): {len(pairs)} duplicates, {committed}/{len(writes)} writes committed")
+        return summary
+
+    async def _plan_merge_writes(self, pairs: List[Tuple[str, str, float]],
+                                 note_keys: Dict[str, List[str]]) -> List[Tuple[str, Any, Dict]]:
+        """Deletes and counter changes that fold each duplicate note into the note it duplicates
+
+        The duplicate's ingest keys move to the original, so re-importing the duplicate is still skipped.
+        """
+        entities_ref = self.db.collection("kg_entities")
+        relationships_ref = self.db.collection("kg_relationships")
+        # Edges the duplicate added to shared counters when it was ingested
+        counted_edges = {"TAGGED_AS": "data.note_count", "CONTAINS": "data.frequency"}
+        duplicate_counts: Counter = Counter(original_id for _, original_id, _ in pairs)
+        decrements: Counter = Counter()
+        deleted_edges = set()
+        writes: List[Tuple[str, Any, Dict]] = []
+
+        async def stored_edges(note_id: str) -> List[Tuple[str, str, str]]:
+            if self.graph_ready:
+                return [(from_id, to_id, rel_type) for from_id, to_id, rel_type, _ in self.graph_index.incident_edges(note_id)]
+            edges = []
+            for field in ("from_id", "to_id"):
+                query = relationships_ref.where(field, "==", note_id).select(["from_id", "to_id", "type"])
+                edges.extend([(doc.get("from_id"), doc.get("to_id"), doc.get("type")) async for doc in query.stream()])
+            return edges
+
+        for (note_id, _, _), edges in zip(pairs, await asyncio.gather(*[stored_edges(note_id) for note_id, _, _ in pairs])):
+            for from_id, to_id, rel_type in edges:
+                rel_id = self._relationship_id({"from_id": from_id, "to_id": to_id, "type": rel_type})
+                if rel_id in deleted_edges:
+                    continue
+                deleted_edges.add(rel_id)
+                # The edge's ends ride along so the graph index can drop it
+                writes.append(("delete", relationships_ref.document(rel_id),
+                               {"from_id": from_id, "to_id": to_id, "type": rel_type}))
+                if from_id == note_id and rel_type in counted_edges:
+                    decrements[(to_id, counted_edges[rel_type])] += 1
+            writes.append(("delete", entities_ref.document(note_id), {}))
+
+        for original_id, count in duplicate_counts.items():
+            writes.append(("increment", entities_ref.document(original_id), {"data.duplicate_count": count}))
+        merged_keys: Dict[str, List[str]] = {}
+        for note_id, original_id, _ in pairs:
+            merged_keys.setdefault(original_id, []).extend(note_keys.get(note_id, []))
+        for original_id, keys in merged_keys.items():
+            if keys:
+                writes.append(("update", entities_ref.document(original_id), {"ingest_keys": firestore.ArrayUnion(keys)}))
+        for (entity_id, field), count in decrements.items():
+            writes.append(("increment", entities_ref.document(entity_id), {field: -count}))
+        return writes
+
+    async def _commit_writes(self, writes: List[Tuple[str, Any, Dict]]) -> Tuple[int, List[str]]:
+        """Commit planned writes in parallel batches outside any ingest plan; returns (committed, errors)"""
+        semaphore = asyncio.Semaphore(BULK_MAX_PARALLEL_COMMITS)
+        committed = 0
+        errors: List[str] = []
+
+        async def commit_chunk(chunk):
+            nonlocal committed
+            async with semaphore:
+                try:
+                    batch = self.db.batch()
+                    for op, ref, data in chunk:
+                        self._apply_write(batch, op, ref, data)
+                    await batch.commit()
+                except Exception as e:
+                    logger.error(f"Batch of {len(chunk)} writes failed: {e}")
+                    errors.append(str(e))
+                    return
+            self._track_writes(chunk)
+            committed += len(chunk)
+
+        await asyncio.gather(*[
+            commit_chunk(writes[i:i + BULK_BATCH_SIZE]) for i in range(0, len(writes), BULK_BATCH_SIZE)
+        ])
+        return committed, errors
+
+    async def _stored_relationships(self) -> List[Dict]:
+        query = self.db.collection("kg_relationships").select(["from_id", "to_id", "type", "strength"])
+        return [doc.to_dict() async for doc in query.stream()]
+
+    async def load_graph_index(self):
+        """Build the in-process graph index from every stored relationship"""
+        if self.graph_index is None:
+            return
+        try:
+            self.graph_index.build(await self._stored_relationships())
         except Exception as e:
-            logger.error(f"Failed to ensure URL context entity: {e}")
-            raise
+            logger.error(f"Failed to load graph index: {e}")
 
-    async def _ensure_category_entity(self, category_name: str) -> str:
-        """Ensure category entity exists"""
-        category_id = self._generate_entity_id("category", category_name)
-        
+    async def refresh_analytics(self, full: bool = False) -> Dict:
+        """Recompute PageRank, components and communities and write results onto entities as `analytics`
+
+        Incremental refreshes warm-start from the previous run and only rewrite entities whose results moved.
+        """
+        async with self._analytics_lock:
+            if self.graph_ready:
+                index = self.graph_index
+            else:
+                index = GraphIndex()
+                index.build(await self._stored_relationships())
+            ids, src, dst, strengths = index.edge_arrays()
+            summary = await asyncio.to_thread(self.analytics.compute, ids, src, dst, strengths, not full)
+
+            if not full and not self.analytics.has_written:
+                # First refresh in this process: learn what is already stored so unchanged entities are skipped
+                query = self.db.collection("kg_entities").select(["analytics"])
+                async for entity in query.stream():
+                    # Entities never analyzed have no field, and a projected snapshot's get() would raise
+                    stored = (entity.to_dict() or {}).get("analytics")
+                    if stored:
+                        self.analytics.mark_written([(entity.id, stored)])
+
+            changes = self.analytics.changed(full)
+            entities_ref = self.db.collection("kg_entities")
+            semaphore = asyncio.Semaphore(BULK_MAX_PARALLEL_COMMITS)
+            written = missing = 0
+
+            async def write_one(entity_id: str, fields: Dict) -> bool:
+                """Update one entity; False when it no longer exists"""
+                try:
+                    await entities_ref.document(entity_id).update({"analytics": fields})
+                    return True
+                except NotFound:
+                    return False
+
+            async def write_chunk(chunk):
+                nonlocal written, missing
+                async with semaphore:
+                    try:
+                        batch = self.db.batch()
+                        for entity_id, fields in chunk:
+                            batch.update(entities_ref.document(entity_id), {"analytics": fields})
+                        await batch.commit()
+                        landed = chunk
+                    except NotFound:
+                        # An edge can outlive its entity (deleted by a merge or another process), and one missing
+                        # document fails the whole batch, so write this chunk entity by entity instead
+                        results = await asyncio.gather(*[write_one(entity_id, fields) for entity_id, fields in chunk],
+                                                       return_exceptions=True)
+                        landed = [change for change, result in zip(chunk, results) if result is True]
+                        gone = [change for change, result in zip(chunk, results) if result is False]
+                        failed = len(chunk) - len(landed) - len(gone)
+                        if failed:
+                            logger.error(f"Failed to write analytics for {failed} entities")
+                        # Deleted entities are marked written so later incremental refreshes do not retry them
+                        self.analytics.mark_written(gone)
+                        missing += len(gone)
+                    except Exception as e:
+                        logger.error(f"Failed to write analytics for {len(chunk)} entities: {e}")
+                        return
+                self.analytics.mark_written(landed)
+                for entity_id, _ in landed:
+                    self.entity_cache.invalidate(entity_id)
+                written += len(landed)
+
+            await asyncio.gather(*[
+                write_chunk(changes[i:i + BULK_BATCH_SIZE]) for i in range(0, len(changes), BULK_BATCH_SIZE)
+            ])
+            summary = {**summary, "changed_entities": len(changes), "written_entities": written,
+                       "missing_entities": missing}
+            logger.info(f"Analytics refresh: {summary}")
+            return summary
+
+    async def central_entities(self, limit: int = 20, entity_types: Optional[List[str]] = None) -> List[Dict]:
+        """Highest-PageRank entities with their component and community"""
+        ranked = self.analytics.top(limit, entity_types)
+        entities = await self._get_entities([entity_id for entity_id, _ in ranked])
+        return [
+            {
+                "id": entity_id,
+                "type": entities[entity_id].get("type"),
+                "name": entities[entity_id].get("name"),
+                **self.analytics.entity_results(entity_id)
+            }
+            for entity_id, _ in ranked if entity_id in entities
+        ]
+
+    async def community_summaries(self, limit: int = 20) -> List[Dict]:
+        """Largest communities, with names for their top members"""
+        summaries = self.analytics.community_summaries(limit)
+        member_ids = [member["id"] for summary in summaries for member in summary["top_members"]]
+        entities = await self._get_entities(member_ids)
+        for summary in summaries:
+            for member in summary["top_members"]:
+                member["name"] = entities.get(member["id"], {}).get("name")
+        return summaries
+
+    async def _reverse_note_edges(self, entity_ids: List[str], fanout: int) -> List[Dict]:
+        """Edges from notes into any of entity_ids: from the graph index, or batched `in` queries run concurrently"""
+        if self.graph_ready:
+            return [
+                {"from_id": from_id, "to_id": entity_id, "type": rel_type, "strength": strength}
+                for entity_id in entity_ids
+                for from_id, rel_type, strength in self.graph_index.neighbors(entity_id, "in")
+                if from_id.startswith("note-")
+            ]
+
+        async def chunk_edges(chunk: List[str]) -> List[Dict]:
+            query = self.db.collection("kg_relationships") \
+                .where("to_id", "in", chunk) \
+                .limit(fanout * len(chunk))
+            return [rel.to_dict() async for rel in query.stream()]
+
+        results = await asyncio.gather(*[
+            chunk_edges(entity_ids[i:i + IN_QUERY_MAX_VALUES])
+            for i in range(0, len(entity_ids), IN_QUERY_MAX_VALUES)
+        ])
+        return [rel for edges in results for rel in edges if rel.get("from_id", "").startswith("note-")]
+
+    async def find_related_notes(self, note_id: str, limit: int = 10) -> List[Dict]:
+        """Find notes related to the given note, scored over shared URL, categories, concepts, domain and time"""
         try:
-            doc_ref = self.db.collection("kg_entities").document(category_id)
-            doc = doc_ref.get()
-            
-            if not doc.exists:
-                entity = {
-                    "type": "category",
-                    "name": category_name,
-                    "data": {
-                        "description": f"User-defined category: {category_name}",
-                        "note_count": 1
-                    },
-                    "observations": [
-                        f"Created: {datetime.now().isoformat()}",
-                        "Contains 1 note"
-                    ],
-                    "created": firestore.SERVER_TIMESTAMP,
-                    "updated": firestore.SERVER_TIMESTAMP
-                }
-                doc_ref.set(entity)
+            # Round trip 1: the note and its outgoing edges (edges come from the graph index when loaded)
+            shared_types = ("CREATED_FROM", "TAGGED_AS", "CONTAINS")
+            if self.graph_ready:
+                note_entities = await self._get_entities([note_id])
+                outgoing = [
+                    {"from_id": note_id, "to_id": to_id, "type": rel_type, "strength": strength}
+                    for to_id, rel_type, strength in self.graph_index.neighbors(note_id, "out", shared_types)
+                ]
             else:
-                # Increment note count
-                doc_ref.update({
-                    "data.note_count": firestore.Increment(1),
-                    "updated": firestore.SERVER_TIMESTAMP
+                note_entities, outgoing_docs = await asyncio.gather(
+                    self._get_entities([note_id]),
+                    self.db.collection("kg_relationships").where("from_id", "==", note_id).limit(50).get()
+                )
+                outgoing = [doc.to_dict() for doc in outgoing_docs]
+            note = note_entities.get(note_id, {})
+            own_edges = {rel.get("to_id"): rel for rel in outgoing if rel.get("type") in shared_types}
+            url_ids = [target for target, rel in own_edges.items() if rel.get("type") == "CREATED_FROM"]
+            timestamp = note.get("data", {}).get("timestamp")
+            if not isinstance(timestamp, (int, float)):
+                timestamp = None
+            # Timestamps may be stored in seconds or in milliseconds
+            window = RELATED_TEMPORAL_WINDOW_SECONDS * (1000 if timestamp and timestamp > 1e11 else 1)
+
+            async def same_domain_edges() -> List[Dict]:
+                """Notes created from other pages on the same domain as this note's page"""
+                domains = {e.get("data", {}).get("domain") for e in (await self._get_entities(url_ids)).values()}
+                domains.discard(None)
+                domains.discard("")
+                if not domains:
+                    return []
+                query = self.db.collection("kg_entities") \
+                    .where("data.domain", "in", list(domains)[:IN_QUERY_MAX_VALUES]) \
+                    .limit(RELATED_FANOUT)
+                sibling_urls = [doc.id async for doc in query.stream() if doc.id not in own_edges]
+                return await self._reverse_note_edges(sibling_urls, 1) if sibling_urls else []
+
+            async def nearby_notes() -> List[Tuple[str, Dict]]:
+                """The RELATED_FANOUT notes written closest in time within the temporal window"""
+                if timestamp is None:
+                    return []
+                if self.timestamp_index.ready:
+                    note_ms = to_milliseconds(timestamp)
+                    nearest = sorted(
+                        self.timestamp_index.within(note_ms, RELATED_TEMPORAL_WINDOW_SECONDS * 1000),
+                        key=lambda item: (abs(item[1] - note_ms), item[0])
+                    )
+                    ids = [other_id for other_id, _ in nearest if other_id != note_id][:RELATED_FANOUT]
+                    entities = await self._get_entities(ids)
+                    return [(other_id, entities[other_id]) for other_id in ids if other_id in entities]
+                # Nearest first on each side of the note; a bare limit would return an arbitrary slice of the window
+                entities_ref = self.db.collection("kg_entities")
+                later = entities_ref.where("data.timestamp", ">=", timestamp) \
+                    .where("data.timestamp", "<=", timestamp + window) \
+                    .order_by("data.timestamp").limit(RELATED_FANOUT + 1)
+                earlier = entities_ref.where("data.timestamp", "<", timestamp) \
+                    .where("data.timestamp", ">=", timestamp - window) \
+                    .order_by("data.timestamp", direction=firestore.Query.DESCENDING).limit(RELATED_FANOUT)
+                found = await asyncio.gather(later.get(), earlier.get())
+                nearest = sorted(
+                    ((doc.id, doc.to_dict()) for docs in found for doc in docs if doc.id != note_id),
+                    key=lambda item: (abs(item[1].get("data", {}).get("timestamp", timestamp) - timestamp), item[0])
+                )
+                return nearest[:RELATED_FANOUT]
+
+            # Round trip 2 (and the domain lookup chained behind it): every signal concurrently
+            shared_edges, domain_edges, temporal = await asyncio.gather(
+                self._reverse_note_edges(list(own_edges), RELATED_FANOUT),
+                same_domain_edges(),
+                nearby_notes()
+            )
+
+            # Aggregate evidence per candidate
+            scores: Dict[str, float] = {}
+            signals: Dict[str, Counter] = {}
+
+            def add_evidence(candidate_id: str, signal: str, weight: float):
+                if candidate_id == note_id or weight <= 0:
+                    return
+                scores[candidate_id] = scores.get(candidate_id, 0.0) + weight
+                signals.setdefault(candidate_id, Counter())[signal] += 1
+
+            for rel in shared_edges:
+                own = own_edges.get(rel.get("to_id"), {})
+                signal = rel.get("type")
+                if signal in RELATED_SIGNAL_WEIGHTS:
+                    weight = RELATED_SIGNAL_WEIGHTS[signal] * own.get("strength", 1.0) * rel.get("strength", 1.0)
+                    add_evidence(rel["from_id"], signal, weight)
+            for rel in domain_edges:
+                add_evidence(rel["from_id"], "SAME_DOMAIN", RELATED_SIGNAL_WEIGHTS["SAME_DOMAIN"])
+
+            nearby_entities = {}
+            for candidate_id, entity in temporal:
+                if entity.get("type") != "note":
+                    continue
+                nearby_entities[candidate_id] = entity
+                diff = abs(entity.get("data", {}).get("timestamp", timestamp) - timestamp)
+                add_evidence(candidate_id, "TEMPORAL_NEAR", RELATED_SIGNAL_WEIGHTS["TEMPORAL_NEAR"] * (1.0 - diff / window))
+
+            top = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+            # Round trip 3: hydrate the top-k in one get_all (nearby notes were already read)
+            notes_by_id = {cid: nearby_entities[cid] for cid, _ in top if cid in nearby_entities}
+            notes_by_id.update(await self._get_entities([cid for cid, _ in top if cid not in notes_by_id]))
+
+            related_notes = []
+            for candidate_id, score in top:
+                note_data = notes_by_id.get(candidate_id)
+                if not note_data:
+                    continue
+                candidate_signals = signals[candidate_id]
+                related_notes.append({
+                    "id": candidate_id,
+                    "name": note_data.get("name", ""),
+                    "content": note_data.get("data", {}).get("content", ""),
+                    "relationship_type": max(candidate_signals, key=lambda s: (RELATED_SIGNAL_WEIGHTS[s], candidate_signals[s])),
+                    "strength": round(score, 4),
+                    "signals": dict(candidate_signals)
                 })
-                
-            return category_id
-            
+            return related_notes
+
         except Exception as e:
-            logger.error(f"Failed to ensure category entity: {e}")
-            raise
+            logger.error(f"Failed to find related notes: {e}")
+            return []
 
-    async def _ensure_concept_entity(self, concept_name: str) -> str:
-        """Ensure concept entity exists"""
-        concept_id = self._generate_entity_id("concept", concept_name)
-        
+    def _edge_dict(self, edge: Tuple[str, str, str, float]) -> Dict:
+        from_id, to_id, rel_type, strength = edge
+        return {"from_id": from_id, "to_id": to_id, "type": rel_type, "strength": round(strength, 4)}
+
+    async def _describe_nodes(self, entity_ids: List[str]) -> Dict[str, Dict]:
+        """id -> {id, type, name} for traversal results, hydrated with one get_all"""
+        entities = await self._get_entities(entity_ids)
+        return {
+            entity_id: {
+                "id": entity_id,
+                "type": entities.get(entity_id, {}).get("type", entity_id.split("-", 1)[0]),
+                "name": entities.get(entity_id, {}).get("name", entity_id)
+            }
+            for entity_id in entity_ids
+        }
+
+    async def find_path(self, from_id: str, to_id: str, types: Optional[List[str]] = None,
+                        max_visited: int = KG_TRAVERSAL_MAX_VISITED) -> Dict:
+        """Weighted shortest path between two entities over the graph index (stronger edges are shorter)"""
+        path = self.graph_index.shortest_path(from_id, to_id, types, max_visited)
+        nodes = await self._describe_nodes(path["nodes"])
+        return {
+            "from": from_id,
+            "to": to_id,
+            "found": path["found"],
+            "cost": path["cost"],
+            "path": [nodes[entity_id] for entity_id in path["nodes"]],
+            "edges": [self._edge_dict(edge) for edge in path["edges"]],
+            "visited": path["visited"],
+            "truncated": path["truncated"]
+        }
+
+    async def get_neighborhood(self, entity_id: str, hops: int = 1, types: Optional[List[str]] = None,
+                               max_nodes: int = KG_TRAVERSAL_MAX_VISITED) -> Dict:
+        """Entities within k hops of entity_id over the graph index, with the edges between them"""
+        neighborhood = self.graph_index.neighborhood(entity_id, hops, types, max_nodes)
+        nodes = await self._describe_nodes(list(neighborhood["nodes"]))
+        return {
+            "center": entity_id,
+            "hops": hops,
+            "nodes": [{**nodes[node_id], "depth": depth} for node_id, depth in neighborhood["nodes"].items()],
+            "edges": [self._edge_dict(edge) for edge in neighborhood["edges"]],
+            "truncated": neighborhood["truncated"]
+        }
+
+    async def load_search_index(self):
+        """Load the search snapshot and catch up on entities written since, or index every entity"""
         try:
-            doc_ref = self.db.collection("kg_entities").document(concept_id)
-            doc = doc_ref.get()
-            
-            if not doc.exists:
-                entity = {
-                    "type": "concept",
-                    "name": concept_name,
-                    "data": {
-                        "frequency": 1
-                    },
-                    "observations": [
-                        f"First extracted: {datetime.now().isoformat()}",
-                        "Appears in 1 note"
-                    ],
-                    "created": firestore.SERVER_TIMESTAMP,
-                    "updated": firestore.SERVER_TIMESTAMP
-                }
-                doc_ref.set(entity)
+            entities_ref = self.db.collection("kg_entities")
+            sync_started = time.time()
+            if self.search_index.load() and self.search_index.synced_at:
+                # Allow for clock skew between this host and Firestore's server timestamps
+                since = datetime.fromtimestamp(self.search_index.synced_at - SEARCH_SYNC_SKEW_SECONDS, tz=timezone.utc)
+                query = entities_ref.where("updated", ">=", since)
             else:
-                # Increment frequency
-                doc_ref.update({
-                    "data.frequency": firestore.Increment(1),
-                    "updated": firestore.SERVER_TIMESTAMP
-                })
-                
-            return concept_id
-            
+                query = entities_ref
+            self.search_index.index_many([(doc.id, doc.to_dict()) async for doc in query.stream()])
+            self.search_index.synced_at = sync_started
+            self.search_index.ready = True
+            await asyncio.to_thread(self.search_index.save)
+            logger.info(f"Search index ready: {self.search_index.stats()}")
         except Exception as e:
-            logger.error(f"Failed to ensure concept entity: {e}")
-            raise
+            logger.error(f"Failed to load search index: {e}")
 
-    async def _ensure_domain_entity(self, domain_name: str) -> str:
-        """Ensure domain entity exists"""
-        domain_id = self._generate_entity_id("domain", domain_name)
-        
+    def _note_text(self, entity: Dict) -> str:
+        return (entity.get("data") or {}).get("content", "")
+
+    async def load_vector_index(self):
+        """Memory-map the saved note vectors and embed notes written since, or embed every note"""
         try:
-            doc_ref = self.db.collection("kg_entities").document(domain_id)
-            doc = doc_ref.get()
-            
-            if not doc.exists:
-                entity = {
-                    "type": "domain",
-                    "name": domain_name,
-                    "data": {
-                        "note_count": 1
-                    },
-                    "observations": [
-                        f"First encountered: {datetime.now().isoformat()}",
-                        "Generated 1 note"
-                    ],
-                    "created": firestore.SERVER_TIMESTAMP,
-                    "updated": firestore.SERVER_TIMESTAMP
-                }
-                doc_ref.set(entity)
+            entities_ref = self.db.collection("kg_entities")
+            sync_started = time.time()
+            if self.vector_index.load() and self.vector_index.synced_at:
+                since = datetime.fromtimestamp(self.vector_index.synced_at - SEARCH_SYNC_SKEW_SECONDS, tz=timezone.utc)
+                query = entities_ref.where("updated", ">=", since)
             else:
-                # Increment note count
-                doc_ref.update({
-                    "data.note_count": firestore.Increment(1),
-                    "updated": firestore.SERVER_TIMESTAMP
-                })
-                
-            return domain_id
-            
+                query = entities_ref.where("type", "==", "note")
+            notes = [(doc.id, self._note_text(doc.to_dict())) async for doc in query.stream()
+                     if doc.get("type") == "note"]
+            # Embedding is CPU-bound, so keep it off the event loop
+            vectors = await asyncio.to_thread(lambda: [embed(text, self.vector_index.dim) for _, text in notes])
+            for (note_id, _), vector in zip(notes, vectors):
+                self.vector_index.add_vector(note_id, vector)
+            self.vector_index.synced_at = sync_started
+            self.vector_index.ready = True
+            # A loaded matrix may already be past the IVF threshold; exact search serves until training finishes
+            self.vector_index.train_in_background()
+            await asyncio.to_thread(self.vector_index.save)
+            logger.info(f"Vector index ready: {self.vector_index.stats()}")
         except Exception as e:
-            logger.error(f"Failed to ensure domain entity: {e}")
-            raise
+            logger.error(f"Failed to load vector index: {e}")
 
-    async def _extract_concepts(self, content: str) -> List[Tuple[str, float]]:
-        """Extract concepts from note content using simple keyword extraction"""
-        # Simple concept extraction - in production, use AI/NLP
-        import re
-        
-        # Common technical concepts (expandable)
-        concept_patterns = {
-            r'\b(?:docker|container|dockerfile)\b': ('docker', 0.9),
-            r'\b(?:api|endpoint|rest)\b': ('api', 0.8),
-            r'\b(?:deploy|deployment|cloud)\b': ('deployment', 0.8),
-            r'\b(?:database|db|firestore|sql)\b': ('database', 0.8),
-            r'\b(?:auth|authentication|login)\b': ('authentication', 0.7),
-            r'\b(?:javascript|js|python|code)\b': ('programming', 0.7),
-        }
-        
-        concepts = []
-        content_lower = content.lower()
-        
-        for pattern, (concept, confidence) in concept_patterns.items():
-            if re.search(pattern, content_lower, re.IGNORECASE):
-                concepts.append((concept, confidence))
-        
-        return concepts
+    async def sync_indexes(self) -> Dict:
+        """Catch the in-process indexes up on entities and edges written since the last sync
 
-    async def find_related_notes(self, note_id: str, limit: int = 10) -> List[Dict]:
-        """Find notes related to the given note"""
-        try:
-            related_notes = []
-            
-            # Get note's relationships
-            relationships_query = self.db.collection("kg_relationships") \
-                .where("from_id", "==", note_id) \
-                .limit(20)
-            
-            relationships = relationships_query.stream()
-            
-            # Group related entities
-            related_entities = {}
-            for rel in relationships:
-                rel_data = rel.to_dict()
-                rel_type = rel_data.get("type")
-                target_id = rel_data.get("to_id")
-                
-                if rel_type not in related_entities:
-                    related_entities[rel_type] = []
-                related_entities[rel_type].append(target_id)
-
-            # Find notes sharing same categories, concepts, or URL contexts
-            for entity_type, entity_ids in related_entities.items():
-                if entity_type in ["TAGGED_AS", "CONTAINS", "CREATED_FROM"]:
-                    # Find other notes connected to these entities
-                    for entity_id in entity_ids:
-                        reverse_rels = self.db.collection("kg_relationships") \
-                            .where("to_id", "==", entity_id) \
-                            .where("type", "==", entity_type) \
-                            .limit(5).stream()
-                        
-                        for reverse_rel in reverse_rels:
-                            reverse_data = reverse_rel.to_dict()
-                            related_note_id = reverse_data.get("from_id")
-                            
-                            if related_note_id != note_id and related_note_id.startswith("note-"):
-                                # Get note entity data
-                                note_doc = self.db.collection("kg_entities").document(related_note_id).get()
-                                if note_doc.exists:
-                                    note_data = note_doc.to_dict()
-                                    related_notes.append({
-                                        "id": related_note_id,
-                                        "name": note_data.get("name", ""),
-                                        "content": note_data.get("data", {}).get("content", ""),
-                                        "relationship_type": entity_type,
-                                        "strength": reverse_data.get("strength", 0.5)
-                                    })
-
-            # Sort by relationship strength and limit
-            related_notes.sort(key=lambda x: x["strength"], reverse=True)
-            return related_notes[:limit]
+        Other processes (the standalone queue worker, other API replicas) write straight to Firestore, so
+        their notes, counters and edges only reach this process's indexes through this read-back.
+        Deleted entities are not seen; run dedupe merges in the process that serves the indexes.
+        """
+        sync_started = time.time()
+        since = datetime.fromtimestamp(self._indexes_synced_at - SEARCH_SYNC_SKEW_SECONDS, tz=timezone.utc)
+        entities = [(doc.id, doc.to_dict()) async for doc in
+                    self.db.collection("kg_entities").where("updated", ">=", since).stream()]
+        relationships = [doc.to_dict() async for doc in
+                         self.db.collection("kg_relationships").where("created", ">=", since).stream()]
+        notes = [(entity_id, entity) for entity_id, entity in entities if entity.get("type") == "note"]
+        embed_notes, sign_notes = self.vector_index.ready, self.duplicate_index.ready
 
-        except Exception as e:
-            logger.error(f"Failed to find related notes: {e}")
-            return []
+        def note_features():
+            texts = [self._note_text(note) for _, note in notes]
+            return ([embed(text, self.vector_index.dim) if embed_notes else None for text in texts],
+                    [self.duplicate_index.signature(text) if sign_notes else None for text in texts])
+
+        # Embedding and MinHash are CPU-bound, so keep them off the event loop
+        vectors, signatures = await asyncio.to_thread(note_features)
+        for entity_id, entity in entities:
+            self.entity_cache.invalidate(entity_id)
+            if self.search_index.ready:
+                self.search_index.index(entity_id, entity)
+        for (note_id, note), vector, signature in zip(notes, vectors, signatures):
+            if vector is not None:
+                self.vector_index.add_vector(note_id, vector)
+            if signature is not None:
+                # The content may have been edited, so replace rather than keep the old signature
+                self.duplicate_index.remove(note_id)
+                self.duplicate_index.add(note_id, signature)
+            timestamp = to_milliseconds((note.get("data") or {}).get("timestamp"))
+            if timestamp is not None and self.timestamp_index.ready:
+                self.timestamp_index.add(note_id, timestamp)
+            if self.ingest_keys.ready:
+                self.ingest_keys.load([(note_id, note.get("ingest_key") or "")])
+                self.ingest_keys.load_merged((note_id, key) for key in note.get("ingest_keys") or [])
+        if self.graph_ready:
+            self.graph_index.upsert_many(relationships)
+        self._indexes_synced_at = sync_started
+        return {"entities": len(entities), "notes": len(notes), "relationships": len(relationships)}
+
+    async def keep_indexes_synced(self):
+        """Run sync_indexes every KG_INDEX_SYNC_SECONDS until cancelled"""
+        while True:
+            await asyncio.sleep(KG_INDEX_SYNC_SECONDS)
+            try:
+                synced = await self.sync_indexes()
+                if synced["entities"] or synced["relationships"]:
+                    logger.info(f"Synced in-process indexes: {synced}")
+            except Exception as e:
+                logger.error(f"Failed to sync in-process indexes: {e}")
+
+    async def find_similar_notes(self, note_id: Optional[str] = None, text: Optional[str] = None,
+                                 limit: int = 10) -> List[Dict]:
+        """Notes whose embeddings are closest (cosine) to a stored note or to free text"""
+        if note_id:
+            query = self.vector_index.vector(note_id)
+            if query is None:
+                entity = (await self._get_entities([note_id])).get(note_id)
+                if entity is None:
+                    raise ValueError(f"Note {note_id} not found")
+                query = embed(self._note_text(entity), self.vector_index.dim)
+        else:
+            query = embed(text or "", self.vector_index.dim)
+        ranked = [(candidate, score) for candidate, score in self.vector_index.search(query, limit, exclude=note_id)
+                  if score > 0]
+        entities = await self._get_entities([candidate for candidate, _ in ranked])
+        return [
+            {
+                "id": candidate,
+                "name": entities[candidate].get("name"),
+                "content": self._note_text(entities[candidate]),
+                "score": round(score, 4)
+            }
+            for candidate, score in ranked if candidate in entities
+        ]
 
     async def search_entities(self, query: str, entity_types: List[str] = None, limit: int = 20) -> List[Dict]:
-        """Search entities by name and observations"""
+        """Search entities by name, observations and note content"""
         try:
+            if self.search_index.ready:
+                ranked = self.search_index.search(query, entity_types, limit)
+                entities = await self._get_entities([entity_id for entity_id, _ in ranked])
+                return [
+                    {
+                        "id": entity_id,
+                        "type": entities[entity_id].get("type"),
+                        "name": entities[entity_id].get("name"),
+                        "data": entities[entity_id].get("data", {}),
+                        "observations": entities[entity_id].get("observations", []),
+                        "score": round(score, 4)
+                    }
+                    for entity_id, score in ranked if entity_id in entities
+                ]
+
+            # Until the index is loaded, fall back to scanning a bounded slice of entities
             results = []
             
             # Search by entity name (case-insensitive partial match)
@@ -401,11 +1395,9 @@ class KnowledgeGraphService:
                 entities_ref = entities_ref.where("type", "in", entity_types)
             
             # Firestore doesn't support case-insensitive search, so we get all and filter
-            entities = entities_ref.limit(100).stream()
-            
             query_lower = query.lower()
             
-            for entity in entities:
+            async for entity in entities_ref.limit(100).stream():
                 entity_data = entity.to_dict()
                 entity_name = entity_data.get("name", "").lower()
                 entity_observations = " ".join(entity_data.get("observations", [])).lower()
@@ -427,41 +1419,52 @@ class KnowledgeGraphService:
             return []
 
     async def get_knowledge_overview(self) -> Dict:
-        """Get high-level overview of the knowledge graph"""
+        """Get high-level overview of the knowledge graph from the materialized stats document"""
         try:
-            overview = {
-                "entity_counts": {},
-                "top_domains": [],
-                "top_categories": [],
-                "top_concepts": [],
-                "recent_activity": []
-            }
-            
-            # Count entities by type
-            entities = self.db.collection("kg_entities").stream()
-            for entity in entities:
-                entity_data = entity.to_dict()
-                entity_type = entity_data.get("type", "unknown")
-                overview["entity_counts"][entity_type] = overview["entity_counts"].get(entity_type, 0) + 1
-            
-            # Get top domains, categories, concepts
-            for entity_type, result_key in [("domain", "top_domains"), ("category", "top_categories"), ("concept", "top_concepts")]:
-                entities_query = self.db.collection("kg_entities") \
-                    .where("type", "==", entity_type) \
-                    .limit(5).stream()
-                
-                items = []
-                for entity in entities_query:
-                    entity_data = entity.to_dict()
-                    items.append({
-                        "name": entity_data.get("name"),
-                        "count": entity_data.get("data", {}).get("note_count") or entity_data.get("data", {}).get("frequency", 0)
-                    })
-                
-                overview[result_key] = sorted(items, key=lambda x: x["count"], reverse=True)
-            
+            overview = await self.overview_stats.overview()
+            if overview is None:
+                # First use: build the stats document once from a full scan
+                await self.reconcile_stats()
+                overview = await self.overview_stats.overview()
+            overview["recent_activity"] = []
             return overview
             
         except Exception as e:
             logger.error(f"Failed to get knowledge overview: {e}")
-            return {}
\ No newline at end of file
+            return {}
+
+    async def reconcile_stats(self) -> Dict:
+        """Recount the overview stats from kg_entities, including counter increments not yet flushed"""
+        return await self.overview_stats.reconcile(self.counters.snapshot())
+
+    async def export_page(self, collection: str, cursor: Optional[str] = None, limit: int = EXPORT_PAGE_SIZE,
+                    end: Optional[str] = None) -> Dict:
+        """Read one page of a collection in document-id order, resuming after cursor and stopping before end"""
+        if collection not in EXPORT_COLLECTIONS:
+            raise ValueError(f"Unknown export collection: {collection}")
+
+        query = self.db.collection(EXPORT_COLLECTIONS[collection]).order_by("__name__")
+        if cursor:
+            query = query.start_after({"__name__": cursor})
+        if end:
+            query = query.end_before({"__name__": end})
+
+        items = [{"id": doc.id, **doc.to_dict()} async for doc in query.limit(limit).stream()]
+
+        return {
+            "collection": collection,
+            "items": items,
+            "next_cursor": items[-1]["id"] if len(items) == limit else None
+        }
+
+    async def iter_export(self, page_size: int = EXPORT_PAGE_SIZE):
+        """Yield (collection, document) pairs for the whole graph, holding one page in memory at a time"""
+        for collection in EXPORT_COLLECTIONS:
+            cursor = None
+            while True:
+                page = await self.export_page(collection, cursor, page_size)
+                for item in page["items"]:
+                    yield collection, item
+                cursor = page["next_cursor"]
+                if not cursor:
+                    break
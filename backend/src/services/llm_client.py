@@ -0,0 +1,98 @@
+"""
+Async LLM client for kg-note
+Shares one pooled HTTP connection across requests and caps in-flight calls
+"""
+
+import asyncio
+import os
+import logging
+from typing import Dict, List, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+LLM_MODEL = os.getenv("LLM_MODEL", "deepseek-chat")
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "16"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+
+class LLMClient:
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: str = DEEPSEEK_BASE_URL,
+        model: str = LLM_MODEL,
+        max_in_flight: int = LLM_MAX_IN_FLIGHT,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+    ):
+        """Create the shared async client and its connection pool"""
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._in_flight = 0
+
+        # One pooled transport for the whole process; keep-alive sized to the in-flight cap
+        self._http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_in_flight,
+                max_keepalive_connections=max_in_flight,
+            ),
+            timeout=httpx.Timeout(timeout, connect=LLM_CONNECT_TIMEOUT_SECONDS),
+        )
+        self._client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=self._http_client,
+            max_retries=LLM_MAX_RETRIES,
+        )
+
+    async def chat_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 0.1,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """Run a JSON-mode chat completion and return the raw message content"""
+        messages: List[Dict] = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        call_timeout = timeout or self.timeout
+
+        async with self._semaphore:
+            self._in_flight += 1
+            try:
+                response = await asyncio.wait_for(
+                    self._client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        response_format={'type': 'json_object'},
+                        temperature=temperature,
+                        stream=False,
+                        timeout=call_timeout
+                    ),
+                    # Hard ceiling so retries inside the SDK cannot exceed the budget
+                    timeout=call_timeout * (LLM_MAX_RETRIES + 1)
+                )
+            finally:
+                self._in_flight -= 1
+
+        return response.choices[0].message.content
+
+    def stats(self) -> Dict:
+        """Current concurrency usage"""
+        return {
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight
+        }
+
+    async def close(self):
+        """Close the pooled HTTP connection"""
+        await self._client.close()
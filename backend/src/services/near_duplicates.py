@@ -0,0 +1,123 @@
+"""
+Near-duplicate index for kg-note
+MinHash signatures of note word shingles in a banded LSH index, for sub-millisecond duplicate lookups
+"""
+
+import hashlib
+import os
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from services.category_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# What ingest does with a near-duplicate: "link" adds a DUPLICATE_OF edge, "merge" folds it into the
+# existing note, "off" disables detection
+KG_DUPLICATE_POLICY = os.getenv("KG_DUPLICATE_POLICY", "link").lower()
+KG_DUPLICATE_THRESHOLD = float(os.getenv("KG_DUPLICATE_THRESHOLD", "0.8"))
+KG_MINHASH_PERMUTATIONS = int(os.getenv("KG_MINHASH_PERMUTATIONS", "128"))
+KG_LSH_BANDS = int(os.getenv("KG_LSH_BANDS", "16"))
+
+DUPLICATE_POLICIES = ("link", "merge", "off")
+
+_SHINGLE_SIZE = 3
+# Notes with fewer shingles than this are too short to call duplicates
+_MIN_SHINGLES = 3
+# Largest prime below 2**32: (a * x + b) % p stays inside uint64 for 32-bit a, b and x
+_PRIME = np.uint64(4294967291)
+
+
+def shingles(text: str) -> Set[str]:
+    """Overlapping word 3-grams of a note's tokens"""
+    tokens = tokenize(text)
+    return {" ".join(tokens[i:i + _SHINGLE_SIZE]) for i in range(len(tokens) - _SHINGLE_SIZE + 1)}
+
+
+class MinHashLSH:
+    def __init__(self, num_perm: int = KG_MINHASH_PERMUTATIONS, bands: int = KG_LSH_BANDS,
+                 threshold: float = KG_DUPLICATE_THRESHOLD, seed: int = 1):
+        """Empty index; bands must divide num_perm"""
+        if num_perm % bands:
+            raise ValueError(f"{bands} LSH bands do not divide {num_perm} permutations")
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_PRIME), num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), num_perm, dtype=np.uint64)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, Set[str]]] = [{} for _ in range(bands)]
+        self.ready = False
+        self.lookups = 0
+        self.duplicates_found = 0
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, note_id: str) -> bool:
+        return note_id in self._signatures
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash signature of a note's shingles, or None if it is too short to compare"""
+        grams = shingles(text)
+        if len(grams) < _MIN_SHINGLES:
+            return None
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=4).digest(), "little") for gram in grams),
+            dtype=np.uint64, count=len(grams)
+        )
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def query(self, signature: np.ndarray, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """(note id, estimated Jaccard similarity) at or above the threshold, most similar first"""
+        self.lookups += 1
+        candidates = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            candidates.update(self._buckets[band].get(key, ()))
+        candidates.discard(exclude)
+        matches = []
+        for note_id in candidates:
+            similarity = float(np.count_nonzero(self._signatures[note_id] == signature)) / len(signature)
+            if similarity >= self.threshold:
+                matches.append((note_id, similarity))
+        if matches:
+            self.duplicates_found += 1
+        return sorted(matches, key=lambda match: (-match[1], match[0]))
+
+    def add(self, note_id: str, signature: np.ndarray) -> bool:
+        """Index a note's signature; returns False if the note was already indexed"""
+        if note_id in self._signatures:
+            return False
+        self._signatures[note_id] = signature
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(key, set()).add(note_id)
+        return True
+
+    def remove(self, note_id: str):
+        signature = self._signatures.pop(note_id, None)
+        if signature is None:
+            return
+        for band, key in enumerate(self._band_keys(signature)):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(note_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "notes": len(self._signatures),
+            "bands": self.bands,
+            "rows_per_band": self.rows,
+            "threshold": self.threshold,
+            "lookups": self.lookups,
+            "duplicates_found": self.duplicates_found
+        }
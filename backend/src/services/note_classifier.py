@@ -0,0 +1,216 @@
+"""
+Local note classifier for kg-note
+Multi-label naive Bayes trained on already-categorized notes, used to skip the LLM when confident
+"""
+
+import json
+import math
+import os
+import threading
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from services.category_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.9"))
+LOCAL_CLASSIFIER_MIN_NOTES = int(os.getenv("LOCAL_CLASSIFIER_MIN_NOTES", "50"))
+LOCAL_CLASSIFIER_MIN_LABEL_NOTES = int(os.getenv("LOCAL_CLASSIFIER_MIN_LABEL_NOTES", "5"))
+LOCAL_CLASSIFIER_PATH = os.getenv("LOCAL_CLASSIFIER_PATH", "")
+LOCAL_CLASSIFIER_SEED_FILES = os.getenv("LOCAL_CLASSIFIER_SEED_FILES", "")
+
+# Laplace smoothing for per-term likelihoods
+_ALPHA = 1.0
+_MAX_LABELS = 4
+
+
+def note_features(content: str, title: str = "", domain: str = "") -> Counter:
+    """Bag of content/title tokens plus one token for the source domain"""
+    features = Counter(tokenize(f"{content} {title}"))
+    if domain:
+        features[f"domain:{domain.lower()}"] += 1
+    return features
+
+
+class NoteClassifier:
+    def __init__(self, path: str = LOCAL_CLASSIFIER_PATH, threshold: float = LOCAL_CLASSIFIER_THRESHOLD):
+        """Empty model; counts are loaded from path when it exists"""
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._n_notes = 0
+        self._label_notes: Counter = Counter()          # label -> notes carrying it
+        self._label_terms: Dict[str, Counter] = {}       # label -> term counts in its notes
+        self._label_totals: Counter = Counter()          # label -> total term count
+        self._term_totals: Counter = Counter()           # term -> count over all notes
+        self._term_labels: Dict[str, set] = {}           # term -> labels it was seen with
+        self._total_terms = 0
+        self._names: Dict[str, str] = {}                 # lowercase label -> display name
+        self._seen_ids: set = set()
+        self.predictions = 0
+        self.confident_predictions = 0
+        if path and os.path.exists(path):
+            self._load()
+
+    def learn(self, content: str, categories: List[str], title: str = "", domain: str = "", note_id: Optional[str] = None):
+        """Add one labelled note to the model"""
+        if not content or not categories:
+            return
+        features = note_features(content, title, domain)
+        if not features:
+            return
+        with self._lock:
+            if note_id:
+                if note_id in self._seen_ids:
+                    return
+                self._seen_ids.add(note_id)
+            self._n_notes += 1
+            n_terms = sum(features.values())
+            self._term_totals.update(features)
+            self._total_terms += n_terms
+            for category in {c.strip() for c in categories if c and c.strip()}:
+                label = category.lower()
+                self._names.setdefault(label, category)
+                self._label_notes[label] += 1
+                self._label_terms.setdefault(label, Counter()).update(features)
+                self._label_totals[label] += n_terms
+                for term in features:
+                    self._term_labels.setdefault(term, set()).add(label)
+
+    def learn_many(self, notes: Iterable[Dict]) -> int:
+        """Learn from export-style note dicts; returns how many were used"""
+        before = self._n_notes
+        for note in notes:
+            metadata = note.get("metadata") or {}
+            self.learn(
+                note.get("content", ""),
+                note.get("categories") or [],
+                metadata.get("title", ""),
+                metadata.get("domain", ""),
+                note.get("id")
+            )
+        return self._n_notes - before
+
+    def learn_from_export(self, file_path: str) -> int:
+        """Learn from a knowledge-weaver export file"""
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        learned = self.learn_many(data.get("notes", []))
+        logger.info(f"Local classifier learned {learned} notes from {file_path}")
+        return learned
+
+    async def learn_from_firestore(self, db) -> int:
+        """Learn from note entities already stored in kg_entities (db is a Firestore AsyncClient)"""
+        notes = []
+        async for doc in db.collection("kg_entities").where("type", "==", "note").stream():
+            data = doc.to_dict().get("data", {})
+            metadata = data.get("metadata") or {}
+            notes.append({
+                "id": doc.id,
+                "content": data.get("content", ""),
+                "categories": data.get("categories", []),
+                "metadata": metadata
+            })
+        learned = self.learn_many(notes)
+        logger.info(f"Local classifier learned {learned} notes from kg_entities")
+        return learned
+
+    def predict(self, content: str, title: str = "", domain: str = "") -> List[Tuple[str, float]]:
+        """(category, probability) pairs for plausible labels, most likely first"""
+        features = note_features(content, title, domain)
+        with self._lock:
+            if not features or self._n_notes == 0:
+                return []
+            vocabulary = len(self._term_totals) or 1
+            candidates = set()
+            for term in features:
+                candidates |= self._term_labels.get(term, set())
+
+            scored = []
+            for label in candidates:
+                if self._label_notes[label] < LOCAL_CLASSIFIER_MIN_LABEL_NOTES:
+                    continue
+                positive = self._label_notes[label]
+                negative = self._n_notes - positive
+                # Binary NB: log-odds of label vs not-label given the note's terms
+                log_odds = math.log((positive + _ALPHA) / (negative + _ALPHA))
+                label_terms = self._label_terms[label]
+                label_total = self._label_totals[label]
+                other_total = self._total_terms - label_total
+                for term, count in features.items():
+                    in_label = label_terms.get(term, 0)
+                    in_other = self._term_totals.get(term, 0) - in_label
+                    p_label = (in_label + _ALPHA) / (label_total + _ALPHA * vocabulary)
+                    p_other = (in_other + _ALPHA) / (other_total + _ALPHA * vocabulary)
+                    log_odds += count * math.log(p_label / p_other)
+                probability = 1.0 / (1.0 + math.exp(-max(min(log_odds, 50.0), -50.0)))
+                scored.append((self._names[label], probability))
+
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored
+
+    def classify(self, content: str, title: str = "", domain: str = "") -> Optional[Dict]:
+        """Return {"categories": [...]} when confident enough to skip the LLM, else None"""
+        if self._n_notes < LOCAL_CLASSIFIER_MIN_NOTES:
+            return None
+        self.predictions += 1
+        confident = [(name, p) for name, p in self.predict(content, title, domain) if p >= self.threshold]
+        if not confident:
+            return None
+        self.confident_predictions += 1
+        return {
+            "categories": [name for name, _ in confident[:_MAX_LABELS]],
+            "confidence": round(min(p for _, p in confident[:_MAX_LABELS]), 4)
+        }
+
+    def save(self):
+        """Persist counts to disk (temp file + rename)"""
+        if not self.path:
+            return
+        with self._lock:
+            state = {
+                "n_notes": self._n_notes,
+                "names": self._names,
+                "label_notes": self._label_notes,
+                "label_terms": self._label_terms,
+                "term_totals": self._term_totals,
+                "total_terms": self._total_terms,
+                "seen_ids": sorted(self._seen_ids)
+            }
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load local classifier from {self.path}: {e}")
+            return
+        self._n_notes = state.get("n_notes", 0)
+        self._names = state.get("names", {})
+        self._label_notes = Counter(state.get("label_notes", {}))
+        self._seen_ids = set(state.get("seen_ids", []))
+        self._term_totals = Counter(state.get("term_totals", {}))
+        self._total_terms = state.get("total_terms", 0)
+        for label, terms in state.get("label_terms", {}).items():
+            self._label_terms[label] = Counter(terms)
+            self._label_totals[label] = sum(terms.values())
+            for term in terms:
+                self._term_labels.setdefault(term, set()).add(label)
+        logger.info(f"Loaded local classifier with {self._n_notes} notes from {self.path}")
+
+    def stats(self) -> Dict:
+        return {
+            "notes": self._n_notes,
+            "labels": len(self._label_notes),
+            "vocabulary": len(self._term_totals),
+            "threshold": self.threshold,
+            "predictions": self.predictions,
+            "confident_predictions": self.confident_predictions
+        }
@@ -0,0 +1,223 @@
+"""
+Overview stats for kg-note
+Materialized entity counts and top-N leaderboards, maintained on ingest and reconciled periodically
+"""
+
+import asyncio
+import copy
+import heapq
+import os
+import time
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from google.cloud import firestore
+
+logger = logging.getLogger(__name__)
+
+KG_STATS_FLUSH_SECONDS = float(os.getenv("KG_STATS_FLUSH_SECONDS", "2.0"))
+KG_STATS_RECONCILE_SECONDS = float(os.getenv("KG_STATS_RECONCILE_SECONDS", "3600"))
+# Entities tracked per leaderboard; well above what /kg/overview shows so late risers can climb
+KG_STATS_TRACKED_PER_TYPE = int(os.getenv("KG_STATS_TRACKED_PER_TYPE", "50"))
+
+STATS_COLLECTION = "kg_stats"
+STATS_DOCUMENT = "overview"
+
+# Ranked entity type -> counter field holding its count
+RANKED_TYPES = {
+    "domain": "data.note_count",
+    "category": "data.note_count",
+    "concept": "data.frequency",
+}
+
+
+def _apply(doc: Dict, created: Counter, deltas: Dict[Tuple[str, str], Tuple[str, int, bool]]) -> Dict:
+    """Fold pending changes into a stats document
+
+    Leaderboards use Space-Saving: an untracked entity that grows replaces the smallest entry and
+    inherits its count, so counts may be overestimated until the next reconciliation, but entities
+    with large counts are never dropped.
+    """
+    counts = doc.setdefault("entity_counts", {})
+    for entity_type, n in created.items():
+        counts[entity_type] = counts.get(entity_type, 0) + n
+    boards = doc.setdefault("leaderboards", {})
+    for (entity_type, entity_id), (name, delta, is_new) in deltas.items():
+        board = boards.setdefault(entity_type, {})
+        entry = board.get(entity_id)
+        if entry is not None:
+            entry["count"] += delta
+            entry["name"] = entry.get("name") or name
+            continue
+        if len(board) < KG_STATS_TRACKED_PER_TYPE:
+            board[entity_id] = {"name": name, "count": delta}
+            continue
+        smallest_id = min(board, key=lambda key: board[key]["count"])
+        smallest = board[smallest_id]["count"]
+        # A new entity's count is exact; an existing untracked one was at most the smallest tracked count
+        count = delta if is_new else smallest + delta
+        if count > smallest:
+            del board[smallest_id]
+            board[entity_id] = {"name": name, "count": count}
+    return doc
+
+
+class OverviewStats:
+    def __init__(self, db, flush_delay: float = KG_STATS_FLUSH_SECONDS):
+        """Stats for db (a Firestore AsyncClient); changes are buffered and flushed in one transaction"""
+        self.db = db
+        self.flush_delay = flush_delay
+        self._created: Counter = Counter()      # entity type -> new entities
+        self._deltas: Dict[Tuple[str, str], Tuple[str, int, bool]] = {}   # (type, id) -> (name, delta, new)
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.reconciliations = 0
+        self.last_drift: Dict[str, int] = {}
+
+    @property
+    def ref(self):
+        return self.db.collection(STATS_COLLECTION).document(STATS_DOCUMENT)
+
+    def record_created(self, entity_type: str, entity_id: str, name: str, count: int = 0):
+        """Count a new entity; ranked types also enter their leaderboard with their initial count"""
+        self._created[entity_type] += 1
+        if entity_type in RANKED_TYPES:
+            self._add_delta(entity_type, entity_id, name, count, True)
+        self._schedule()
+
+    def record_increment(self, entity_type: str, entity_id: str, name: str, delta: int):
+        """Count an increment on an existing ranked entity"""
+        if entity_type in RANKED_TYPES:
+            self._add_delta(entity_type, entity_id, name, delta, False)
+            self._schedule()
+
+    def _add_delta(self, entity_type: str, entity_id: str, name: str, delta: int, is_new: bool):
+        key = (entity_type, entity_id)
+        previous_name, previous, was_new = self._deltas.get(key, (name, 0, False))
+        self._deltas[key] = (previous_name or name, previous + delta, was_new or is_new)
+
+    def _schedule(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_delay)
+        self._flush_task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Stats flush failed: {e}")
+
+    async def flush(self) -> bool:
+        """Fold buffered changes into the stats document in one transaction; failures are re-queued"""
+        async with self._flush_lock:
+            if not self._created and not self._deltas:
+                return False
+            created, deltas = self._created, self._deltas
+            self._created, self._deltas = Counter(), {}
+
+            @firestore.async_transactional
+            async def apply(transaction):
+                snapshot = await self.ref.get(transaction=transaction)
+                doc = snapshot.to_dict() if snapshot.exists else {}
+                doc = _apply(doc, created, deltas)
+                doc["updated"] = firestore.SERVER_TIMESTAMP
+                transaction.set(self.ref, doc)
+
+            try:
+                await apply(self.db.transaction())
+                self.flushes += 1
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.error(f"Failed to flush overview stats, will retry: {e}")
+                self._created.update(created)
+                for (entity_type, entity_id), (name, delta, is_new) in deltas.items():
+                    self._add_delta(entity_type, entity_id, name, delta, is_new)
+        if self._created or self._deltas:
+            self._schedule()
+        return True
+
+    async def close(self):
+        """Write everything still pending, then cancel the scheduled flush"""
+        await self.flush()
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        self._flush_task = None
+
+    async def overview(self, top_n: int = 5) -> Optional[Dict]:
+        """Counts and top entities from the stats document plus unflushed changes; None if never reconciled"""
+        snapshot = await self.ref.get()
+        if not snapshot.exists:
+            return None
+        doc = _apply(copy.deepcopy(snapshot.to_dict()), self._created, self._deltas)
+        overview = {"entity_counts": doc.get("entity_counts", {})}
+        for entity_type, result_key in [("domain", "top_domains"), ("category", "top_categories"), ("concept", "top_concepts")]:
+            board = doc.get("leaderboards", {}).get(entity_type, {})
+            ranked = heapq.nlargest(top_n, board.items(), key=lambda item: (item[1]["count"], item[0]))
+            overview[result_key] = [{"name": entry["name"], "count": entry["count"]} for _, entry in ranked]
+        overview["reconciled_at"] = doc.get("reconciled_at")
+        return overview
+
+    async def reconcile(self, pending_counts: Optional[Dict[Tuple[str, str], int]] = None) -> Dict:
+        """Rebuild the stats document from a full scan of kg_entities
+
+        pending_counts adds increments other buffers have not written yet, keyed by (entity id, field).
+        """
+        pending_counts = pending_counts or {}
+        await self.flush()
+        async with self._flush_lock:
+            started = time.time()
+            counts: Counter = Counter()
+            ranked: Dict[str, List[Tuple[int, str, str]]] = {entity_type: [] for entity_type in RANKED_TYPES}
+            query = self.db.collection("kg_entities").select(["type", "name", "data.note_count", "data.frequency"])
+            async for entity in query.stream():
+                # Projected snapshots raise KeyError for fields an entity lacks, so read the dict
+                doc = entity.to_dict() or {}
+                entity_type = doc.get("type") or "unknown"
+                counts[entity_type] += 1
+                field = RANKED_TYPES.get(entity_type)
+                if field is None:
+                    continue
+                stored = (doc.get("data") or {}).get(field.split(".", 1)[1]) or 0
+                count = stored + pending_counts.get((entity.id, field), 0)
+                board = ranked[entity_type]
+                item = (count, entity.id, doc.get("name"))
+                if len(board) < KG_STATS_TRACKED_PER_TYPE:
+                    heapq.heappush(board, item)
+                elif item > board[0]:
+                    heapq.heapreplace(board, item)
+
+            doc = {
+                "entity_counts": dict(counts),
+                "leaderboards": {
+                    entity_type: {entity_id: {"name": name, "count": count} for count, entity_id, name in board}
+                    for entity_type, board in ranked.items()
+                },
+                "reconciled_at": started,
+                "updated": firestore.SERVER_TIMESTAMP
+            }
+            previous = await self.ref.get()
+            previous_counts = (previous.to_dict() or {}).get("entity_counts", {}) if previous.exists else {}
+            self.last_drift = {
+                entity_type: counts.get(entity_type, 0) - previous_counts.get(entity_type, 0)
+                for entity_type in set(counts) | set(previous_counts)
+                if counts.get(entity_type, 0) != previous_counts.get(entity_type, 0)
+            }
+            await self.ref.set(doc)
+            self.reconciliations += 1
+        logger.info(f"Reconciled overview stats in {time.time() - started:.1f}s; drift {self.last_drift}")
+        return {"entity_counts": dict(counts), "drift": self.last_drift}
+
+    def stats(self) -> Dict:
+        return {
+            "pending_entities": len(self._deltas),
+            "pending_created": sum(self._created.values()),
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "reconciliations": self.reconciliations,
+            "last_drift": self.last_drift,
+            "flush_delay_seconds": self.flush_delay
+        }
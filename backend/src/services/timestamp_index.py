@@ -0,0 +1,81 @@
+"""
+Timestamp index for kg-note
+Sorted note timestamps for O(log n + k) lookups of the notes written within a time window
+"""
+
+import bisect
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Timestamps below this are in seconds (1e11 s is the year 5138; 1e11 ms is 1973)
+_MILLISECONDS_THRESHOLD = 1e11
+
+
+def to_milliseconds(timestamp) -> Optional[int]:
+    """Note timestamps arrive in seconds or milliseconds; normalize to integer milliseconds"""
+    if isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)):
+        return None
+    if timestamp < _MILLISECONDS_THRESHOLD:
+        return int(round(timestamp * 1000))
+    return int(round(timestamp))
+
+
+class TimestampIndex:
+    def __init__(self):
+        """Empty index; load() stored notes or add() them as they are written"""
+        self._times: List[int] = []
+        self._ids: List[str] = []
+        self._by_id: Dict[str, int] = {}
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, note_id: str) -> bool:
+        return note_id in self._by_id
+
+    def load(self, notes: Iterable[Tuple[str, int]]):
+        """Merge many (note id, ms timestamp) pairs with one sort"""
+        for note_id, timestamp in notes:
+            self._by_id[note_id] = timestamp
+        pairs = sorted((timestamp, note_id) for note_id, timestamp in self._by_id.items())
+        self._times = [timestamp for timestamp, _ in pairs]
+        self._ids = [note_id for _, note_id in pairs]
+
+    def add(self, note_id: str, timestamp: int) -> bool:
+        """Insert a note; returns False if it was already indexed"""
+        if note_id in self._by_id:
+            if self._by_id[note_id] == timestamp:
+                return False
+            self.remove(note_id)
+        i = bisect.bisect_right(self._times, timestamp)
+        self._times.insert(i, timestamp)
+        self._ids.insert(i, note_id)
+        self._by_id[note_id] = timestamp
+        return True
+
+    def remove(self, note_id: str):
+        timestamp = self._by_id.pop(note_id, None)
+        if timestamp is None:
+            return
+        i = bisect.bisect_left(self._times, timestamp)
+        while self._ids[i] != note_id:
+            i += 1
+        del self._times[i]
+        del self._ids[i]
+
+    def within(self, timestamp: int, window: int) -> List[Tuple[str, int]]:
+        """(note id, ms timestamp) for notes strictly less than window ms away, oldest first"""
+        lo = bisect.bisect_right(self._times, timestamp - window)
+        hi = bisect.bisect_left(self._times, timestamp + window)
+        return list(zip(self._ids[lo:hi], self._times[lo:hi]))
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "notes": len(self._ids),
+            "oldest": self._times[0] if self._times else None,
+            "newest": self._times[-1] if self._times else None
+        }
@@ -0,0 +1,276 @@
+"""
+Vector index for kg-note
+Local note embeddings (signed feature hashing) in a float32 matrix with exact or IVF top-k cosine search
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.category_index import tokenize
+from services.kg_queue import KG_DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+KG_VECTOR_INDEX_PATH = os.getenv("KG_VECTOR_INDEX_PATH", os.path.join(KG_DATA_DIR, "kg_vectors"))
+KG_VECTOR_DIM = int(os.getenv("KG_VECTOR_DIM", "512"))
+# Switch from exact search to an inverted-file (IVF) index above this many vectors
+KG_VECTOR_IVF_THRESHOLD = int(os.getenv("KG_VECTOR_IVF_THRESHOLD", "20000"))
+KG_VECTOR_IVF_NPROBE = int(os.getenv("KG_VECTOR_IVF_NPROBE", "8"))
+
+# Character n-grams let morphological variants ("deploy", "deployment") land near each other
+_CHAR_NGRAM = 3
+_CHAR_WEIGHT = 0.5
+_BIGRAM_WEIGHT = 0.7
+_KMEANS_ITERATIONS = 10
+_KMEANS_SAMPLE = 50000
+
+
+def _hash(feature: str, dim: int) -> Tuple[int, float]:
+    """Bucket and sign for a feature; blake2b keeps them stable across processes"""
+    digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+    return digest % dim, 1.0 if (digest >> 63) else -1.0
+
+
+def embed(text: str, dim: int = KG_VECTOR_DIM) -> np.ndarray:
+    """Unit-length float32 embedding from hashed words, word bigrams and character trigrams"""
+    vector = np.zeros(dim, dtype=np.float32)
+    tokens = tokenize(text)
+    features: Dict[str, float] = {}
+    for token in tokens:
+        features[f"w:{token}"] = features.get(f"w:{token}", 0.0) + 1.0
+        padded = f"<{token}>"
+        for i in range(len(padded) - _CHAR_NGRAM + 1):
+            gram = f"c:{padded[i:i + _CHAR_NGRAM]}"
+            features[gram] = features.get(gram, 0.0) + _CHAR_WEIGHT
+    for first, second in zip(tokens, tokens[1:]):
+        features[f"b:{first} {second}"] = features.get(f"b:{first} {second}", 0.0) + _BIGRAM_WEIGHT
+    for feature, count in features.items():
+        bucket, sign = _hash(feature, dim)
+        # Sublinear term frequency so long notes are not dominated by repeated words
+        vector[bucket] += sign * np.log1p(count)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def _train_ivf(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Spherical k-means over (a sample of) the vectors; returns the centroids and each row's nearest one"""
+    size = len(vectors)
+    n_lists = max(1, int(np.sqrt(size)))
+    rng = np.random.default_rng(0)
+    sample = np.array(vectors[rng.choice(size, min(size, _KMEANS_SAMPLE), replace=False)])
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(_KMEANS_ITERATIONS):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        order = np.argsort(labels, kind="stable")
+        present, starts = np.unique(labels[order], return_index=True)
+        sums = np.zeros_like(centroids)
+        sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # Empty lists keep their previous centroid
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+    assignments = np.empty(size, dtype=np.int32)
+    for start in range(0, size, 65536):
+        block = vectors[start:start + 65536]
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return centroids.astype(np.float32), assignments
+
+
+class VectorIndex:
+    def __init__(self, path: str = KG_VECTOR_INDEX_PATH, dim: int = KG_VECTOR_DIM):
+        """Empty index; load() a saved matrix or add() notes to populate"""
+        self.path = path
+        self.dim = dim
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+        self._size = 0
+        # IVF state: centroids, each row's list, and the size the lists were trained at
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments: Optional[np.ndarray] = None
+        self._trained_size = 0
+        # While training runs in a thread: the pending task, and the rows written since its snapshot
+        self._training: Optional[asyncio.Task] = None
+        self._dirty: Optional[set] = None
+        self.ready = False
+        self.synced_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _reserve(self, rows: int):
+        """Grow the matrix geometrically so appends stay amortized O(1)"""
+        if rows <= len(self._matrix):
+            return
+        capacity = max(rows, 2 * len(self._matrix), 1024)
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+        if self._assignments is not None:
+            assignments = np.full(capacity, -1, dtype=np.int32)
+            assignments[:self._size] = self._assignments[:self._size]
+            self._assignments = assignments
+
+    def add(self, note_id: str, text: str):
+        """Embed a note and insert or replace its vector"""
+        self.add_vector(note_id, embed(text, self.dim))
+
+    def add_vector(self, note_id: str, vector: np.ndarray):
+        row = self._rows.get(note_id)
+        if row is None:
+            row = self._size
+            self._reserve(row + 1)
+            self._rows[note_id] = row
+            self._ids.append(note_id)
+            self._size += 1
+        elif not self._matrix.flags.writeable:
+            self._reserve(len(self._matrix) + 1)
+        self._matrix[row] = vector
+        if self._centroids is not None:
+            self._assignments[row] = int(np.argmax(self._centroids @ vector))
+        if self._dirty is not None:
+            self._dirty.add(row)
+        self.train_in_background()
+
+    def remove(self, note_id: str):
+        """Drop a note's vector; the last row moves into its slot"""
+        row = self._rows.pop(note_id, None)
+        if row is None:
+            return
+        last = self._size - 1
+        if row != last:
+            if not self._matrix.flags.writeable:
+                self._reserve(len(self._matrix) + 1)
+            moved = self._ids[last]
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = moved
+            self._rows[moved] = row
+            if self._assignments is not None:
+                self._assignments[row] = self._assignments[last]
+            if self._dirty is not None:
+                self._dirty.add(row)
+        self._ids.pop()
+        self._size -= 1
+
+    def vector(self, note_id: str) -> Optional[np.ndarray]:
+        row = self._rows.get(note_id)
+        return None if row is None else np.array(self._matrix[row])
+
+    def train_in_background(self) -> Optional[asyncio.Task]:
+        """Start IVF training once the index has grown enough; centroids are swapped in when it finishes
+
+        Training runs in a worker thread so adds and searches on the event loop are not blocked. Without a
+        running loop (offline scripts) it trains inline.
+        """
+        if self._training is not None:
+            return self._training
+        if self._size < KG_VECTOR_IVF_THRESHOLD or self._size < 1.5 * max(self._trained_size, 1):
+            return None
+        matrix, size = self._matrix, self._size
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._install_ivf(*_train_ivf(matrix[:size]), size)
+            return None
+        self._dirty = set()
+        self._training = loop.create_task(self._train(matrix, size))
+        return self._training
+
+    async def _train(self, matrix: np.ndarray, size: int):
+        try:
+            # Rows written meanwhile may be read half-updated; they are in _dirty and get reassigned on install
+            centroids, assignments = await asyncio.to_thread(_train_ivf, matrix[:size])
+            self._install_ivf(centroids, assignments, size)
+        except Exception as e:
+            logger.error(f"Failed to train IVF index: {e}")
+        finally:
+            self._dirty = None
+            self._training = None
+
+    def _install_ivf(self, centroids: np.ndarray, trained: np.ndarray, size: int):
+        """Swap in trained centroids; rows added, moved or replaced since the snapshot are assigned now"""
+        assignments = np.full(len(self._matrix), -1, dtype=np.int32)
+        kept = min(size, self._size)
+        assignments[:kept] = trained[:kept]
+        stale = set(range(kept, self._size)) | {row for row in (self._dirty or ()) if row < self._size}
+        if stale:
+            rows = np.fromiter(sorted(stale), dtype=np.int64)
+            assignments[rows] = np.argmax(self._matrix[rows] @ centroids.T, axis=1)
+        self._centroids, self._assignments, self._trained_size = centroids, assignments, size
+        logger.info(f"Trained IVF index with {len(centroids)} lists over {size} vectors")
+
+    def search(self, query: np.ndarray, limit: int = 10, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """(note id, cosine similarity) for the nearest vectors; IVF-probed above the size threshold"""
+        if self._size == 0:
+            return []
+        vectors = self._matrix[:self._size]
+        candidates = None
+        if self._centroids is not None and self._size >= KG_VECTOR_IVF_THRESHOLD:
+            probe = np.argsort(-(self._centroids @ query))[:KG_VECTOR_IVF_NPROBE]
+            candidates = np.nonzero(np.isin(self._assignments[:self._size], probe))[0]
+            if len(candidates) == 0:
+                # Removals emptied every probed list; fall back to the exact scan
+                candidates = None
+        scores = vectors @ query if candidates is None else vectors[candidates] @ query
+
+        k = min(limit + 1, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for i in top:
+            row = int(candidates[i]) if candidates is not None else int(i)
+            note_id = self._ids[row]
+            if note_id != exclude:
+                results.append((note_id, float(scores[i])))
+        return results[:limit]
+
+    def save(self):
+        """Write the matrix as a .npy file (memory-mappable on load) plus an id sidecar"""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        ids, size = list(self._ids), self._size
+        tmp_matrix, tmp_ids = f"{self.path}.npy.tmp", f"{self.path}.ids.json.tmp"
+        with open(tmp_matrix, "wb") as f:
+            np.save(f, self._matrix[:size])
+        with open(tmp_ids, "w") as f:
+            json.dump({"dim": self.dim, "synced_at": self.synced_at, "ids": ids}, f)
+        os.replace(tmp_matrix, f"{self.path}.npy")
+        os.replace(tmp_ids, f"{self.path}.ids.json")
+
+    def load(self) -> bool:
+        """Memory-map a saved matrix (copy-on-write); returns False when there is none or it does not fit"""
+        if not self.path or not os.path.exists(f"{self.path}.npy") or not os.path.exists(f"{self.path}.ids.json"):
+            return False
+        try:
+            with open(f"{self.path}.ids.json", "r") as f:
+                meta = json.load(f)
+            matrix = np.load(f"{self.path}.npy", mmap_mode="c")
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load vector index from {self.path}: {e}")
+            return False
+        if meta.get("dim") != self.dim or len(meta.get("ids", [])) != len(matrix):
+            logger.warning(f"Vector index at {self.path} does not match KG_VECTOR_DIM, rebuilding")
+            return False
+        self._matrix = matrix
+        self._ids = list(meta["ids"])
+        self._rows = {note_id: row for row, note_id in enumerate(self._ids)}
+        self._size = len(self._ids)
+        self.synced_at = meta.get("synced_at")
+        logger.info(f"Loaded {self._size} note vectors from {self.path}.npy")
+        return True
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "vectors": self._size,
+            "dim": self.dim,
+            "ivf_lists": 0 if self._centroids is None else len(self._centroids),
+            "memory_mapped": isinstance(self._matrix, np.memmap),
+            "synced_at": self.synced_at
+        }
@@ -0,0 +1,255 @@
+"""
+Shared test fixtures for kg-note
+An in-memory stand-in for the Firestore AsyncClient surface the services use
+"""
+
+import copy
+from datetime import datetime, timezone
+
+import pytest
+from google.api_core.exceptions import NotFound
+from google.cloud import firestore
+from google.cloud.firestore_v1.transforms import ArrayUnion, Increment, Sentinel
+
+
+def _resolve(value):
+    if isinstance(value, dict):
+        return {key: _resolve(item) for key, item in value.items()}
+    if isinstance(value, Increment):
+        return value.value
+    if isinstance(value, ArrayUnion):
+        return list(dict.fromkeys(value.values))
+    if isinstance(value, Sentinel):
+        return datetime.now(timezone.utc)
+    return copy.deepcopy(value)
+
+
+def _set_path(doc: dict, path: str, value):
+    *parents, leaf = path.split(".")
+    for key in parents:
+        doc = doc.setdefault(key, {})
+    if isinstance(value, Increment):
+        doc[leaf] = (doc.get(leaf) or 0) + value.value
+    elif isinstance(value, ArrayUnion):
+        doc[leaf] = list(dict.fromkeys([*(doc.get(leaf) or []), *value.values]))
+    else:
+        doc[leaf] = _resolve(value)
+
+
+def _merge(doc: dict, data: dict):
+    """set(..., merge=True): nested maps merge field by field, everything else is replaced"""
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(doc.get(key), dict):
+            _merge(doc[key], value)
+        else:
+            _set_path(doc, key, value)
+
+
+def _get_path(doc: dict, path: str):
+    """Field lookup with DocumentSnapshot.get semantics: a missing field raises KeyError"""
+    for key in path.split("."):
+        if not isinstance(doc, dict) or key not in doc:
+            raise KeyError(path)
+        doc = doc[key]
+    return doc
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id: str, data):
+        self.id = doc_id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field: str):
+        return copy.deepcopy(_get_path(self._data, field))
+
+
+class FakeDocument:
+    def __init__(self, db: "FakeFirestore", collection: str, doc_id: str):
+        self.db, self.collection, self.id = db, collection, doc_id
+
+    @property
+    def path(self) -> str:
+        return f"{self.collection}/{self.id}"
+
+    async def get(self, **kwargs) -> FakeSnapshot:
+        return FakeSnapshot(self.id, self.db.store.get(self.collection, {}).get(self.id))
+
+    async def set(self, data: dict, merge: bool = False):
+        self.db.apply([("merge" if merge else "set", self, data)])
+
+    async def update(self, data: dict):
+        self.db.apply([("update", self, data)])
+
+    async def delete(self):
+        self.db.apply([("delete", self, None)])
+
+
+_COMPARISONS = {
+    "==": lambda actual, value: actual == value,
+    "in": lambda actual, value: actual in value,
+    "<": lambda actual, value: actual < value,
+    "<=": lambda actual, value: actual <= value,
+    ">": lambda actual, value: actual > value,
+    ">=": lambda actual, value: actual >= value,
+}
+
+
+class FakeQuery:
+    def __init__(self, db: "FakeFirestore", collection: str, filters=(), fields=None, order=None, limit=None):
+        self.db, self.collection, self.filters, self.fields = db, collection, list(filters), fields
+        self.order, self.max_results = order, limit
+
+    def _copy(self, **changes) -> "FakeQuery":
+        state = {"filters": self.filters, "fields": self.fields, "order": self.order, "limit": self.max_results}
+        state.update(changes)
+        return FakeQuery(self.db, self.collection, **state)
+
+    def document(self, doc_id: str) -> FakeDocument:
+        return FakeDocument(self.db, self.collection, doc_id)
+
+    def where(self, field: str, op: str, value) -> "FakeQuery":
+        return self._copy(filters=self.filters + [(field, op, value)])
+
+    def select(self, fields) -> "FakeQuery":
+        return self._copy(fields=list(fields))
+
+    def order_by(self, field: str, direction: str = firestore.Query.ASCENDING) -> "FakeQuery":
+        return self._copy(order=(field, direction == firestore.Query.DESCENDING))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._copy(limit=count)
+
+    def _matches(self, data: dict) -> bool:
+        for field, op, value in self.filters:
+            try:
+                actual = _get_path(data, field)
+            except KeyError:
+                return False
+            if not _COMPARISONS[op](actual, value):
+                return False
+        return True
+
+    def _project(self, data: dict) -> dict:
+        if self.fields is None:
+            return data
+        projected = {}
+        for field in self.fields:
+            try:
+                _set_path(projected, field, _get_path(data, field))
+            except KeyError:
+                pass
+        return projected
+
+    async def stream(self):
+        matches = [(doc_id, data) for doc_id, data in sorted(self.db.store.get(self.collection, {}).items())
+                   if self._matches(data)]
+        if self.order:
+            field, descending = self.order
+            # Like Firestore, ordering on a field leaves out documents that lack it
+            matches = [(doc_id, data) for doc_id, data in matches if self._has(data, field)]
+            matches.sort(key=lambda item: _get_path(item[1], field), reverse=descending)
+        for doc_id, data in matches[:self.max_results]:
+            yield FakeSnapshot(doc_id, self._project(copy.deepcopy(data)))
+
+    async def get(self):
+        return [snapshot async for snapshot in self.stream()]
+
+    @staticmethod
+    def _has(data: dict, field: str) -> bool:
+        try:
+            _get_path(data, field)
+            return True
+        except KeyError:
+            return False
+
+
+class FakeBatch:
+    def __init__(self, db: "FakeFirestore"):
+        self.db, self.ops = db, []
+
+    def set(self, ref: FakeDocument, data: dict, merge: bool = False):
+        self.ops.append(("merge" if merge else "set", ref, data))
+
+    def update(self, ref: FakeDocument, data: dict):
+        self.ops.append(("update", ref, data))
+
+    def delete(self, ref: FakeDocument):
+        self.ops.append(("delete", ref, None))
+
+    async def commit(self):
+        self.db.apply(self.ops)
+
+
+class FakeTransaction(FakeBatch):
+    """Writes staged by a transactional function, applied atomically when it returns"""
+
+
+def fake_async_transactional(to_wrap):
+    """Stand-in for firestore.async_transactional: run once against a FakeTransaction, then commit"""
+    async def run(transaction: FakeTransaction, *args, **kwargs):
+        result = await to_wrap(transaction, *args, **kwargs)
+        await transaction.commit()
+        return result
+    return run
+
+
+class FakeFirestore:
+    """Documents live in store[collection][id]; batches apply atomically like Firestore's"""
+
+    def __init__(self):
+        self.store = {}
+
+    def collection(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch(self)
+
+    def transaction(self) -> FakeTransaction:
+        return FakeTransaction(self)
+
+    async def get_all(self, refs, **kwargs):
+        for ref in refs:
+            yield await ref.get()
+
+    def apply(self, ops):
+        for op, ref, _ in ops:
+            if op == "update" and ref.id not in self.store.get(ref.collection, {}):
+                raise NotFound(f"No document to update: {ref.path}")
+        for op, ref, data in ops:
+            docs = self.store.setdefault(ref.collection, {})
+            if op == "delete":
+                docs.pop(ref.id, None)
+            elif op == "set":
+                docs[ref.id] = _resolve(data)
+            elif op == "merge":
+                _merge(docs.setdefault(ref.id, {}), data)
+            else:
+                for field, value in data.items():
+                    _set_path(docs[ref.id], field, value)
+
+
+@pytest.fixture
+def db() -> FakeFirestore:
+    return FakeFirestore()
+
+
+@pytest.fixture
+def kg(db, monkeypatch, tmp_path):
+    """A KnowledgeGraphService over the in-memory store, with its index files under tmp_path"""
+    from services import knowledge_graph
+
+    monkeypatch.setenv("GOOGLE_APPLICATION_CREDENTIALS", "unused")
+    monkeypatch.setattr(knowledge_graph.firestore, "AsyncClient", lambda *args, **kwargs: db)
+    monkeypatch.setattr(knowledge_graph.firestore, "async_transactional", fake_async_transactional)
+    service = knowledge_graph.KnowledgeGraphService()
+    service.search_index.path = str(tmp_path / "kg_search_index.json")
+    service.vector_index.path = str(tmp_path / "kg_vectors")
+    return service
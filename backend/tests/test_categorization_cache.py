@@ -0,0 +1,20 @@
+import asyncio
+
+from services.categorization_cache import CategorizationCache
+
+
+def test_disk_tier_serves_entries_evicted_from_memory(tmp_path):
+    cache = CategorizationCache(max_entries=1, db_path=str(tmp_path / "cache.db"))
+
+    async def run():
+        await cache.set("a", "v1", {"categories": ["x"]})
+        await cache.set("b", "v1", {"categories": ["y"]})
+        hit = await cache.get("a", "v1")
+        # A new category set invalidates both tiers
+        stale = await cache.get("b", "v2")
+        return hit, stale
+
+    hit, stale = asyncio.run(run())
+    assert hit == {"categories": ["x"]}
+    assert stale is None
+    assert cache.stats()["disk_hits"] == 1
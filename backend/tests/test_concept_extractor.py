@@ -0,0 +1,12 @@
+from services.concept_extractor import CONCEPT_DICTIONARY_PATH, ConceptExtractor
+
+
+def test_default_dictionary_does_not_depend_on_the_working_directory():
+    assert ConceptExtractor().path == CONCEPT_DICTIONARY_PATH
+    assert ConceptExtractor().stats()["concepts"] > 0
+
+
+def test_missing_dictionary_falls_back_to_builtin_concepts(tmp_path):
+    extractor = ConceptExtractor(str(tmp_path / "missing.json"))
+    assert [match["concept"] for match in extractor.extract("Deploy the Dockerfile to the cloud")] == \
+        ["deployment", "docker"]
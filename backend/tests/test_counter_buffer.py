@@ -0,0 +1,41 @@
+import asyncio
+
+from services.counter_buffer import CounterBuffer
+
+
+def test_flush_writes_one_increment_per_entity(db):
+    db.store["kg_entities"] = {"category-a": {"data": {"note_count": 1}}}
+    counters = CounterBuffer(db, flush_delay=60)
+
+    async def run():
+        counters.add("category-a", "data.note_count", 1)
+        counters.add("category-a", "data.note_count", 2)
+        return await counters.close()
+
+    asyncio.run(run())
+    assert db.store["kg_entities"]["category-a"]["data"]["note_count"] == 4
+    assert counters.stats()["flushed_writes"] == 1
+
+
+def test_deleted_entity_does_not_block_the_batch(db):
+    db.store["kg_entities"] = {
+        "category-a": {"data": {"note_count": 1}},
+        "concept-b": {"data": {"frequency": 5}},
+    }
+    counters = CounterBuffer(db, flush_delay=60)
+
+    async def run():
+        counters.add("category-a", "data.note_count", 1)
+        counters.add("concept-gone", "data.frequency", -1)
+        counters.add("concept-b", "data.frequency", 2)
+        written = await counters.flush()
+        await counters.close()
+        return written
+
+    assert asyncio.run(run()) == 2
+    assert db.store["kg_entities"]["category-a"]["data"]["note_count"] == 2
+    assert db.store["kg_entities"]["concept-b"]["data"]["frequency"] == 7
+    assert "concept-gone" not in db.store["kg_entities"]
+    stats = counters.stats()
+    assert stats["pending_entities"] == 0
+    assert stats["dropped_deltas"] == 1
@@ -0,0 +1,32 @@
+from services.graph_index import GraphIndex
+
+
+def _rel(from_id: str, to_id: str, rel_type: str = "TAGGED_AS") -> dict:
+    return {"from_id": from_id, "to_id": to_id, "type": rel_type, "strength": 1.0}
+
+
+def test_removed_edges_stay_out_of_reads_and_rebuilds():
+    index = GraphIndex()
+    index.build([_rel("note-a", "category-x"), _rel("note-b", "category-x")])
+    index.upsert("note-c", "category-x", "TAGGED_AS")
+
+    index.remove("note-a", "category-x", "TAGGED_AS")   # base edge
+    index.remove("note-c", "category-x", "TAGGED_AS")   # pending edge
+    assert [other for other, _, _ in index.neighbors("category-x", "in")] == ["note-a", "note-b"]
+    index.compact()
+    assert [other for other, _, _ in index.neighbors("category-x", "in")] == ["note-b"]
+
+    # A rebuild that still streamed the deleted edge (read before the delete) leaves it out
+    index.build([_rel("note-a", "category-x"), _rel("note-b", "category-x")])
+    assert [other for other, _, _ in index.neighbors("category-x", "in")] == ["note-b"]
+    assert not index.has_node("note-a") and not index.has_node("note-c")
+    assert index.stats()["nodes"] == 2
+
+
+def test_rewritten_edge_survives_its_earlier_removal():
+    index = GraphIndex()
+    index.build([])
+    index.remove("note-a", "category-x", "TAGGED_AS")
+    index.upsert("note-a", "category-x", "TAGGED_AS")
+    index.build([])
+    assert index.neighbors("note-a") == [("category-x", "TAGGED_AS", 1.0)]
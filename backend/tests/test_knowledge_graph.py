@@ -0,0 +1,255 @@
+import asyncio
+import copy
+from datetime import datetime, timezone
+
+import pytest
+
+from services.ingest_keys import ingest_key
+
+
+def _stored_note(note_id: str, content: str, timestamp: int) -> dict:
+    now = datetime.now(timezone.utc)
+    note = {"id": note_id, "content": content, "timestamp": timestamp, "categories": []}
+    return {
+        "type": "note",
+        "name": content,
+        "data": {"content": content, "timestamp": timestamp, "categories": []},
+        "ingest_key": ingest_key(note_id, note),
+        "created": now,
+        "updated": now,
+    }
+
+
+def test_sync_picks_up_writes_from_another_process(db, kg):
+    kg.search_index.ready = kg.vector_index.ready = True
+    kg.timestamp_index.ready = kg.duplicate_index.ready = kg.ingest_keys.ready = True
+    kg.graph_index.build([])
+    content = "Firestore batches commit atomically across documents"
+    # Written straight to the store, as the standalone queue worker would
+    db.store["kg_entities"] = {"note-1": _stored_note("note-1", content, 1700000000)}
+    db.store["kg_relationships"] = {"note-1-BELONGS_TO-category-db": {
+        "from_id": "note-1", "to_id": "category-db", "type": "BELONGS_TO", "strength": 1.0,
+        "created": datetime.now(timezone.utc),
+    }}
+
+    synced = asyncio.run(kg.sync_indexes())
+
+    assert synced == {"entities": 1, "notes": 1, "relationships": 1}
+    assert [entity_id for entity_id, _ in kg.search_index.search("firestore")] == ["note-1"]
+    assert kg.vector_index.vector("note-1") is not None
+    assert "note-1" in kg.timestamp_index
+    assert "note-1" in kg.duplicate_index
+    assert db.store["kg_entities"]["note-1"]["ingest_key"] in kg.ingest_keys
+    assert kg.graph_index.has_node("category-db")
+
+
+def test_analytics_refresh_skips_deleted_entities(db, kg):
+    db.store["kg_entities"] = {
+        "note-a": {"type": "note", "data": {}},
+        "category-b": {"type": "category", "data": {}},
+    }
+    # note-gone was deleted after its edge was written
+    db.store["kg_relationships"] = {
+        f"{from_id}-BELONGS_TO-category-b": {"from_id": from_id, "to_id": "category-b", "type": "BELONGS_TO",
+                                             "strength": 1.0}
+        for from_id in ("note-a", "note-gone")
+    }
+
+    summary = asyncio.run(kg.refresh_analytics())
+
+    assert summary["written_entities"] == 2
+    assert summary["missing_entities"] == 1
+    assert "note-gone" not in db.store["kg_entities"]
+    assert "analytics" in db.store["kg_entities"]["note-a"]
+    assert "analytics" in db.store["kg_entities"]["category-b"]
+
+
+def test_note_indexes_load_notes_stored_without_an_ingest_key(db, kg):
+    legacy = _stored_note("note-old", "Stored before ingest keys existed", 1700000000)
+    del legacy["ingest_key"]
+    del legacy["data"]["timestamp"]
+    current = _stored_note("note-new", "Stored with an ingest key", 1700000100)
+    db.store["kg_entities"] = {"note-old": legacy, "note-new": current}
+
+    asyncio.run(kg.load_note_indexes())
+
+    assert kg.ingest_keys.ready and kg.timestamp_index.ready
+    assert len(kg.ingest_keys) == 1 and current["ingest_key"] in kg.ingest_keys
+    assert "note-new" in kg.timestamp_index and "note-old" not in kg.timestamp_index
+
+
+def _note(timestamp: int, content: str, categories) -> dict:
+    return {"content": content, "timestamp": timestamp, "categories": list(categories)}
+
+
+def test_edited_note_is_not_counted_again(db, kg):
+    text = "Batched writes in Firestore commit up to five hundred operations atomically"
+
+    note_id = kg._generate_entity_id("note", "1700000000")
+
+    async def run():
+        await kg.bulk_add_notes([_note(1700000000, text, ["databases"])])
+        db.store["kg_entities"][note_id]["data"]["duplicate_count"] = 2
+        return await kg.bulk_add_notes([_note(1700000000, text + " and retry on contention", ["databases"])])
+
+    result = asyncio.run(run())
+
+    assert result["notes"] == 1
+    stored = db.store["kg_entities"]
+    assert stored["category-databases"]["data"]["note_count"] == 1
+    assert stored[note_id]["data"]["content"].endswith("retry on contention")
+    assert stored[note_id]["data"]["duplicate_count"] == 2
+
+
+def test_merged_duplicate_stays_skipped_after_restart(db, kg, monkeypatch):
+    from services import knowledge_graph
+
+    monkeypatch.setattr(knowledge_graph, "KG_DUPLICATE_POLICY", "merge")
+    text = ("Firestore batched writes commit up to five hundred operations atomically, "
+            "so bulk imports group entity and relationship writes into large batches")
+    original, duplicate = _note(1700000000, text, ["databases"]), _note(1700000500, text + " today", ["databases"])
+
+    first = asyncio.run(kg.bulk_add_notes([original, duplicate]))
+    assert first["notes"] == 1 and first["duplicates_merged"] == 1
+
+    # A fresh process only knows what was persisted
+    restarted = knowledge_graph.KnowledgeGraphService()
+    again = asyncio.run(restarted.bulk_add_notes([duplicate]))
+
+    assert again["skipped_notes"] == 1 and again["writes"] == 0
+    assert db.store["kg_entities"]["category-databases"]["data"]["note_count"] == 1
+
+
+def _page_note(timestamp: int, content: str, categories, url: str = "") -> dict:
+    note = _note(timestamp, content, categories)
+    if url:
+        note["metadata"] = {"url": url, "domain": url.split("/")[2], "title": "page"}
+    return note
+
+
+def test_add_note_entity_commits_note_entities_and_edges(db, kg):
+    note = _page_note(1700000000, "Firestore transactions read before they write",
+                      ["databases"], "https://cloud.google.com/firestore")
+
+    async def run():
+        note_id = await kg.add_note_entity(note)
+        await kg.counters.close()
+        return note_id
+
+    note_id = asyncio.run(run())
+
+    entities, relationships = db.store["kg_entities"], db.store["kg_relationships"]
+    assert entities[note_id]["data"]["content"] == note["content"]
+    assert entities["category-databases"]["data"]["note_count"] == 1
+    assert entities["domain-cloud.google.com"]["data"]["note_count"] == 1
+    assert entities["concept-database"]["data"]["frequency"] == 1
+    assert {rel["type"] for rel in relationships.values() if rel["from_id"] == note_id} == \
+        {"TAGGED_AS", "CREATED_FROM", "CONTAINS"}
+
+
+def test_exact_reingest_of_a_single_note_writes_nothing(db, kg):
+    note = _page_note(1700000000, "Firestore transactions read before they write", ["databases"])
+
+    async def run():
+        first = await kg.add_note_entity(note)
+        await kg.counters.close()
+        stored = copy.deepcopy(db.store)
+        second = await kg.add_note_entity(dict(note))
+        await kg.counters.close()
+        return first, second, stored
+
+    first, second, stored = asyncio.run(run())
+
+    assert first == second
+    assert db.store == stored
+    assert kg.ingest_keys.stats()["skipped"] == 1
+
+
+def test_related_notes_rank_shared_signals_above_time_alone(db, kg):
+    url = "https://cloud.google.com/firestore"
+    notes = [
+        _page_note(1700000000, "Firestore transactions read before they write", ["databases"], url),
+        _page_note(1700090000, "Firestore batches cap at five hundred writes", ["databases"], url),
+        _page_note(1700000600, "Lunch plans for the offsite", ["personal"]),
+        _page_note(1700000300, "Indexing strategies for document stores", ["databases"]),
+    ]
+    asyncio.run(kg.bulk_add_notes(notes))
+    note_id = kg._generate_entity_id("note", "1700000000")
+
+    # Firestore queries: no graph index, no timestamp index
+    kg.timestamp_index.ready = False
+    from_queries = asyncio.run(kg.find_related_notes(note_id))
+    # In-process indexes
+    kg.timestamp_index.ready = True
+    asyncio.run(kg.load_graph_index())
+    from_indexes = asyncio.run(kg.find_related_notes(note_id))
+
+    assert from_queries == from_indexes
+    ranked = [related["id"] for related in from_queries]
+    assert ranked == ["note-1700090000", "note-1700000300", "note-1700000600"]
+    assert from_queries[0]["signals"] == {"CREATED_FROM": 1, "TAGGED_AS": 1, "CONTAINS": 1}
+    assert from_queries[2]["signals"] == {"TEMPORAL_NEAR": 1}
+
+
+def test_dedupe_merge_drops_the_duplicate_from_the_graph_index(db, kg):
+    text = ("Firestore batched writes commit up to five hundred operations atomically, "
+            "so bulk imports group entity and relationship writes into large batches")
+    duplicate_id = kg._generate_entity_id("note", "1700000500")
+
+    async def run():
+        await kg.bulk_add_notes([_note(1700000000, text, ["databases"]), _note(1700000500, text + " today", ["databases"])])
+        await kg.load_graph_index()
+        assert kg.graph_index.has_node(duplicate_id)
+        return await kg.dedupe_notes("merge", dry_run=False)
+
+    summary = asyncio.run(run())
+
+    assert summary["duplicates"] == 1 and not summary["errors"]
+    assert not kg.graph_index.has_node(duplicate_id)
+    assert all(duplicate_id not in (rel["from_id"], rel["to_id"]) for rel in db.store["kg_relationships"].values())
+
+
+def test_ingest_waits_for_note_indexes_that_failed_to_load(db, kg, monkeypatch):
+    from services import knowledge_graph
+
+    query_type = type(db.collection("kg_entities"))
+    text = "Batched writes in Firestore commit up to five hundred operations atomically"
+    asyncio.run(kg.bulk_add_notes([_note(1700000000, text, ["databases"])]))
+
+    restarted = knowledge_graph.KnowledgeGraphService()
+    stream = query_type.stream
+
+    async def unavailable(self):
+        raise RuntimeError("firestore unavailable")
+        yield
+
+    monkeypatch.setattr(query_type, "stream", unavailable)
+    with pytest.raises(RuntimeError):
+        asyncio.run(restarted.add_note_entity(_note(1700000000, text, ["databases"])))
+    assert not restarted.ingest_keys.ready
+
+    monkeypatch.setattr(query_type, "stream", stream)
+    assert asyncio.run(restarted.add_note_entity(_note(1700000000, text, ["databases"]))) == "note-1700000000"
+    assert db.store["kg_entities"]["category-databases"]["data"]["note_count"] == 1
+
+
+def test_retagged_note_moves_its_counts_and_drops_stale_edges(db, kg):
+    note_id = kg._generate_entity_id("note", "1700000000")
+
+    async def run():
+        await kg.add_note_entity(_note(1700000000, "Firestore transactions read before they write", ["alpha"]))
+        await kg.add_note_entity(_note(1700090000, "Firestore indexes speed up database queries", ["beta"]))
+        await kg.counters.close()
+        await kg.load_graph_index()
+        await kg.add_note_entity(_note(1700000000, "Retry loops back off under contention", ["beta"]))
+        await kg.counters.close()
+
+    asyncio.run(run())
+
+    entities, relationships = db.store["kg_entities"], db.store["kg_relationships"]
+    assert entities["category-alpha"]["data"]["note_count"] == 0
+    assert entities["category-beta"]["data"]["note_count"] == 2
+    assert entities["concept-database"]["data"]["frequency"] == 1
+    assert {(rel["type"], rel["to_id"]) for rel in relationships.values()
+            if rel["from_id"] == note_id and rel["type"] in ("TAGGED_AS", "CONTAINS")} == {("TAGGED_AS", "category-beta")}
+    assert {to_id for to_id, _, _ in kg.graph_index.neighbors(note_id, "out", ["TAGGED_AS", "CONTAINS"])} == {"category-beta"}
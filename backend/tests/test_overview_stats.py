@@ -0,0 +1,20 @@
+import asyncio
+
+from services.overview_stats import OverviewStats
+
+
+def test_reconcile_counts_entities_missing_ranked_fields(db):
+    db.store["kg_entities"] = {
+        "category-a": {"type": "category", "name": "a", "data": {"note_count": 3}},
+        "category-b": {"type": "category", "data": {}},
+        "note-1": {"type": "note"},
+    }
+    stats = OverviewStats(db)
+
+    async def run():
+        await stats.reconcile()
+        return await stats.overview()
+
+    overview = asyncio.run(run())
+    assert overview["entity_counts"] == {"category": 2, "note": 1}
+    assert overview["top_categories"][0] == {"name": "a", "count": 3}
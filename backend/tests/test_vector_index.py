@@ -0,0 +1,44 @@
+import asyncio
+
+import numpy as np
+
+from services import vector_index
+from services.vector_index import VectorIndex
+
+
+def _vectors(n: int, dim: int = 32) -> np.ndarray:
+    vectors = np.random.default_rng(0).standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_ivf_trains_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr(vector_index, "KG_VECTOR_IVF_THRESHOLD", 500)
+    vectors = _vectors(600)
+    index = VectorIndex(path="", dim=32)
+
+    async def run():
+        for i, vector in enumerate(vectors[:500]):
+            index.add_vector(f"note-{i}", vector)
+        assert index._training is not None and index._centroids is None
+        # Writes made while training are reassigned when the centroids are swapped in
+        for i, vector in enumerate(vectors[500:], start=500):
+            index.add_vector(f"note-{i}", vector)
+        index.remove("note-3")
+        await index._training
+
+    asyncio.run(run())
+    assert index.stats()["ivf_lists"] > 0
+    rows = index._matrix[:len(index)]
+    expected = np.argmax(rows @ index._centroids.T, axis=1)
+    assert (index._assignments[:len(index)] == expected).all()
+
+
+def test_search_falls_back_to_exact_when_no_list_has_candidates(monkeypatch):
+    monkeypatch.setattr(vector_index, "KG_VECTOR_IVF_THRESHOLD", 100)
+    vectors = _vectors(100)
+    index = VectorIndex(path="", dim=32)
+    for i, vector in enumerate(vectors):
+        index.add_vector(f"note-{i}", vector)
+    index._assignments[:len(index)] = -1
+
+    assert [note_id for note_id, _ in index.search(vectors[7], limit=1)] == ["note-7"]